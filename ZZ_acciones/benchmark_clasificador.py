@@ -0,0 +1,47 @@
+import os
+import django
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'qome_backend.settings')
+django.setup()
+
+from core.models import IngredienteBase, ProductoReal
+from core.clasificador import Clasificador, cumple_criterios_seguros
+
+def clasificar_original(nombre_prod, ingredientes):
+    for ing in ingredientes:
+        if cumple_criterios_seguros(nombre_prod, ing.nombre):
+            return ing
+    return None
+
+def benchmark(repeticiones=5):
+    print("⏱️ MICRO-BENCHMARK: bucle original vs clasificador compilado...")
+
+    ingredientes = list(IngredienteBase.objects.all())
+    nombres = list(ProductoReal.objects.values_list('nombre_comercial', flat=True)) * repeticiones
+    if not nombres:
+        print("❌ No hay productos. Ejecuta primero el scraper.")
+        return
+
+    inicio = time.perf_counter()
+    esperados = [clasificar_original(n, ingredientes) for n in nombres]
+    t_original = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    clasificador = Clasificador(ingredientes)
+    t_compilar = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    obtenidos = [clasificador.clasificar(n) for n in nombres]
+    t_compilado = time.perf_counter() - inicio
+
+    distintos = sum(1 for a, b in zip(esperados, obtenidos) if a != b)
+    print(f"   📦 {len(nombres)} productos × {len(ingredientes)} ingredientes")
+    print(f"   🐢 Original:   {t_original*1000:.1f} ms ({len(nombres)/t_original:,.0f} prod/s)")
+    print(f"   🚀 Compilado:  {t_compilado*1000:.1f} ms ({len(nombres)/t_compilado:,.0f} prod/s) + {t_compilar*1000:.1f} ms de compilación")
+    print(f"   {'✅' if not distintos else '❌'} Diferencias: {distintos}")
+
+if __name__ == "__main__":
+    benchmark()
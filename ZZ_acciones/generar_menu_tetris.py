@@ -12,6 +12,7 @@ django.setup()
 
 from django.contrib.auth.models import User
 from core.models import Receta, PlanSemanal, ComidaPlanificada, ProductoReal, CostePorSupermercado
+from core.precios import mapa_productos_mas_baratos
 
 def generar_tetris(usuario_nombre="admin"):
     print(f"🧩 Tetris V8 (Logística Real): Generando plan para '{usuario_nombre}'...")
@@ -41,6 +42,9 @@ def generar_tetris(usuario_nombre="admin"):
     plan, _ = PlanSemanal.objects.get_or_create(usuario=user, fecha_inicio=lunes_proximo)
     plan.comidas.all().delete()
     
+    # Producto más barato de cada ingrediente en mis supers (1 sola consulta)
+    productos_baratos = mapa_productos_mas_baratos(mis_supers)
+
     despensa = {} 
     cesta_compra_real = {}
     memoria_reciente = [] 
@@ -94,12 +98,7 @@ def generar_tetris(usuario_nombre="admin"):
 
                     if despensa[nombre_base]['stock'] < necesario:
                         # BUSCAMOS EL PRODUCTO REAL SOLO EN MIS SUPERMERCADOS
-                        candidatos = ProductoReal.objects.filter(
-                            ingrediente_base=item.ingrediente_base,
-                            supermercado__in=mis_supers
-                        ).order_by('precio_por_kg') # El más eficiente
-
-                        prod = candidatos.first()
+                        prod = productos_baratos.get(item.ingrediente_base_id) # El más eficiente
                         if not prod:
                             print(f"      ⚠️ No encontrado en tus supers: {nombre_base}")
                             continue
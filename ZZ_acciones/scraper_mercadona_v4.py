@@ -1,254 +1,92 @@
 import os
 import django
-import requests
-import time
-from decimal import Decimal
+import argparse
 import sys
+from datetime import timedelta
 
 # SETUP DJANGO
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'qome_backend.settings')
 django.setup()
 
-from core.models import Supermercado, IngredienteBase, ProductoReal
+from core.models import Supermercado, IngredienteBase
+from core.mercadona import crear_cliente, FuenteMercadona
+from core.clasificador import Clasificador
+from core.ingesta import EstadoCrawler, IngestaSupermercado
+from core.indice_ean import obtener_indice
 
-# --- CONFIGURACIÓN ---
-HEADERS = {'User-Agent': 'Mozilla/5.0 (compatible; QomeBot/1.0)'}
-API_ROOT = "https://tienda.mercadona.es/api/categories/?lang=es"
+# Copia local de las respuestas de la API (para revalidar y para --replay)
+CACHE_POR_DEFECTO = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache_mercadona')
 
-# --- FILTROS DE SEGURIDAD (BLACKLIST) ---
-# Palabras que, si aparecen, DESCARTAN el producto inmediatamente.
-BLACKLIST = [
-    "perro", "gato", "mascota", "animal", "juniors", "infantil", "bebé", "pañal",
-    "champú", "gel", "jabón", "crema", "facial", "corporal", "limpieza", "friegasuelos",
-    "detergente", "suavizante", "lejía", "insecticida", "ambientador", "pilas", "bombilla",
-    "servilleta", "papel", "higiénico", "toallitas", "discos", "algodón", "bastoncillos",
-    "maquillaje", "colonia", "perfume", "desodorante", "estropajo", "bayeta", "fregona",
-    "fregaplatos", "lavavajillas", "mopa", "escoba"
-]
-
-# 1. DICCIONARIO DE SINÓNIMOS (Lógica OR)
-MATCH_SINONIMOS_OR = {
-    "Macarrones": ["macarrón", "plumas", "penne", "tiburón", "hélices"],
-    "Espaguetis": ["spaghetti", "espagueti", "tallarín"],
-    "Arroz": ["arroz"],
-    "Gambas": ["gamba", "langostino", "camarón"],
-    "Salmón": ["salmón"],
-    "Merluza": ["merluza"],
-    "Bacalao": ["bacalao"],
-    "Atún Lata": ["atún", "bonito"],
-    "Lentejas Bote": ["lenteja"],
-    "Garbanzos Bote": ["garbanzo"],
-    "Pan Molde": ["molde"],
-    "Huevo Duro": ["cocido"],
-    "Quesitos": ["porciones"],
-    "Leche Entera": ["entera"],
-    "Leche Semidesnatada": ["semi"],
-    "Ajo": ["ajo"],
-    "Cebolla": ["cebolla"],
-    "Patata": ["patata"],
-    "Zanahoria": ["zanahoria"],
-    "Pimiento Rojo": ["rojo"],
-    "Pimiento Verde": ["verde"],
-    "Plátano": ["plátano", "banana"],
-    "Manzana": ["manzana"],
-    "Naranja": ["naranja"],
-    "Limón": ["limón"],
-    "Aguacate": ["aguacate"],
-    "Tomate": ["tomate"],
-    "Lechuga": ["lechuga"],
-    "Espinacas": ["espinaca"],
-    "Champiñones": ["champiñón"],
-    "Pepino": ["pepino"],
-    "Berenjena": ["berenjena"],
-    "Brócoli": ["brócoli"],
-    "Bacon": ["bacon", "panceta"],
-    "Salchichas": ["salchicha"],
-    "Sal": ["sal"],
-    "Azúcar": ["azúcar"],
-    "Harina Trigo": ["harina"],
-    "Mantequilla": ["mantequilla"],
-    "Mozzarella": ["mozzarella"],
-    "Queso Rallado": ["rallado", "fundir"],
-    "Pan Integral": ["integral"],
-    "Mayonesa": ["mayonesa"],
-    "Ketchup": ["ketchup"],
-    "Café": ["café"],
-    "Maíz Dulce": ["maíz"],
-    "Orégano": ["orégano"],
-    "Pimentón": ["pimentón"],
-    "Pimienta": ["pimienta"],
-    "Canela": ["canela"],
-    "Comino": ["comino"]
-}
-
-# 2. DICCIONARIO COMPUESTO (Lógica AND)
-MATCH_COMPUESTO_AND = {
-    "Aceite Oliva": ["aceite", "oliva"],
-    "Aceite Girasol": ["aceite", "girasol"],
-    "Carne Picada Vacuno": ["picada", "vacuno"],
-    "Pechuga de Pollo": ["pechuga", "pollo"],
-    "Lomo de Cerdo": ["lomo", "cerdo"],
-    "Jamón York": ["jamón", "cocido"],
-    "Jamón Serrano": ["jamón", "serrano"],
-    "Tomate Frito": ["tomate", "frito"],
-    "Pan Hamburguesa": ["pan", "burger"],
-    "Yogur Natural": ["yogur", "natural"],
-    "Yogur Griego": ["yogur", "griego"],
-    "Queso Batido": ["queso", "batido"],
-    "Queso Fresco": ["queso", "fresco"],
-    "Nata Cocinar": ["nata", "cocinar"],
-    "Pavo en Lonchas": ["pavo", "lonchas"]
-}
-
-def normalizar(texto):
-    replacements = (("á", "a"), ("é", "e"), ("í", "i"), ("ó", "o"), ("ú", "u"))
-    texto = texto.lower()
-    for a, b in replacements:
-        texto = texto.replace(a, b)
-    return texto
-
-def cumple_criterios_seguros(nombre_producto, nombre_ingrediente_base):
-    nombre_prod = normalizar(nombre_producto)
+def ejecutar_crawler(concurrencia=8, peticiones_por_segundo=10, timeout=15,
+                     directorio_cache=CACHE_POR_DEFECTO, replay=False, completo=False, frescura=None,
+                     hilos_parseo=2, hilos_clasificacion=2, tamano_cola=16):
+    print("🕷️ CRAWLER MERCADONA V13 (ANTI-BASURA + PIPELINE EN STREAMING + UPSERT EN BLOQUE + REANUDABLE)...")
     
-    # 1. FILTRO BLACKLIST
-    for bad in BLACKLIST:
-        if bad in nombre_prod: return False
-
-    nombre_ing = nombre_ingrediente_base 
-
-    # 2. INTENTO OR (Sinónimos)
-    if nombre_ing in MATCH_SINONIMOS_OR:
-        keywords = MATCH_SINONIMOS_OR[nombre_ing]
-        for k in keywords:
-            kn = normalizar(k)
-            # Lógica estricta para palabras cortas (<= 3 letras) como "Sal" o "Ajo"
-            if len(kn) <= 3:
-                # Debe estar rodeada de espacios o ser inicio/fin de cadena
-                if f" {kn} " in f" {nombre_prod} " or nombre_prod.startswith(f"{kn} ") or nombre_prod.endswith(f" {kn}"):
-                    return True
-            else:
-                if kn in nombre_prod: return True
-        return False 
-
-    # 3. INTENTO AND (Compuestos)
-    if nombre_ing in MATCH_COMPUESTO_AND:
-        keywords = MATCH_COMPUESTO_AND[nombre_ing]
-        for k in keywords:
-            if normalizar(k) not in nombre_prod: return False
-        return True
-
-    # 4. FALLBACK
-    return normalizar(nombre_ing) in nombre_prod
-
-def obtener_arbol_categorias():
-    try:
-        r = requests.get(API_ROOT, headers=HEADERS)
-        return r.json()
-    except Exception as e:
-        print(f"❌ Error descargando árbol: {e}")
-        return []
-
-def extraer_productos_de_categoria(cat_id):
-    url = f"https://tienda.mercadona.es/api/categories/{cat_id}/?lang=es"
-    try:
-        r = requests.get(url, headers=HEADERS)
-        data = r.json()
-        productos = []
-        if 'categories' in data:
-            for sub in data['categories']:
-                if 'products' in sub: productos.extend(sub['products'])
-        elif 'products' in data:
-            productos.extend(data['products'])
-        return productos
-    except:
-        return []
-
-def extraer_nutricion(p_data):
-    """
-    Intenta extraer las kcal por 100g.
-    Si no existe o falla, devuelve 0.
-    """
-    try:
-        # Placeholder: Aquí iría la lógica real de parseo del JSON de nutrición
-        # Para la demo, si no hay datos claros, 0 es seguro.
-        if 'nutrition_information' in p_data:
-            return 0 
-    except: pass
-    return 0
-
-def ejecutar_crawler():
-    print("🕷️ CRAWLER MERCADONA V9 (ANTI-BASURA + NUTRICIÓN)...")
-    
-    mercadona, _ = Supermercado.objects.get_or_create(nombre="Mercadona", defaults={'color_brand': '#007A3E'})
-    ingredientes_db = list(IngredienteBase.objects.all())
-    
-    arbol = obtener_arbol_categorias()
-    categorias_a_visitar = []
-    
-    def explorar_nodo(nodo):
-        if not nodo.get('categories'):
-            categorias_a_visitar.append(nodo['id'])
-        else:
-            for hijo in nodo['categories']:
-                explorar_nodo(hijo)
-    
-    if 'results' in arbol:
-        for raiz in arbol['results']:
-            explorar_nodo(raiz)
+    cliente = crear_cliente(
+        concurrencia=concurrencia, peticiones_por_segundo=peticiones_por_segundo, timeout=timeout,
+        directorio_cache=directorio_cache, replay=replay
+    )
+    fuente = FuenteMercadona(cliente)
+    supermercado, _ = Supermercado.objects.get_or_create(nombre=fuente.nombre, defaults={'color_brand': fuente.color_brand})
+    clasificador = Clasificador(IngredienteBase.objects.all())
+    estado = EstadoCrawler(supermercado, completo=completo, frescura=frescura)
+    if estado.reanudada: print(f"♻️ Reanudando la ejecución #{estado.ejecucion.id} desde su último checkpoint")
+
+    if replay: print(f"📼 Modo REPLAY: sin red, leyendo de {directorio_cache}")
+    todas = fuente.categorias()
+    if not todas:
+        # Sin árbol no se cierra la ejecución: la próxima vez se reanuda
+        fuente.cerrar()
+        return
+    categorias_a_visitar = estado.categorias_a_descargar(todas)
     
-    print(f"🌍 Escaneando {len(categorias_a_visitar)} pasillos...")
-
-    total_guardados = 0
-    
-    for i, cat_id in enumerate(categorias_a_visitar): 
-        if i % 15 == 0: print(f"   ⏳ Pasillo {i}/{len(categorias_a_visitar)}...")
-        
-        productos_raw = extraer_productos_de_categoria(cat_id)
-        
-        for p in productos_raw:
-            nombre_prod = p['display_name']
-            
-            for ing in ingredientes_db:
-                # Usamos la nueva función segura
-                if cumple_criterios_seguros(nombre_prod, ing.nombre):
-                    try:
-                        info = p['price_instructions']
-                        precio = Decimal(info['unit_price'])
-                        pum = Decimal(info['reference_price'])
-                        fmt = info['reference_format']
-                        
-                        peso_g = 1000
-                        if pum > 0:
-                            ratio = float(precio) / float(pum)
-                            # Si la referencia es KG o L, multiplicamos por 1000
-                            # Si no, asumimos que es unidad y estimamos
-                            if fmt.lower() in ['kg', 'l']: 
-                                peso_g = int(ratio * 1000)
-                            else:
-                                peso_g = int(ratio * 1000)
-
-                        kcal = extraer_nutricion(p)
-
-                        ProductoReal.objects.update_or_create(
-                            nombre_comercial=nombre_prod,
-                            supermercado=mercadona,
-                            ingrediente_base=ing,
-                            defaults={
-                                "precio_actual": precio,
-                                "peso_gramos": peso_g,
-                                "precio_por_kg": pum if fmt.lower() in ['kg', 'l'] else (precio / Decimal(peso_g/1000) if peso_g > 0 else 0),
-                                "imagen_url": p.get('thumbnail', ''),
-                                "kcal_100g": kcal
-                            }
-                        )
-                        total_guardados += 1
-                        break 
-                    except: pass
-        
-        time.sleep(0.05)
-
-    print(f"\n🏁 BARRIDO V9 COMPLETADO. {total_guardados} productos limpios.")
+    print(f"🌍 Escaneando {len(categorias_a_visitar)} pasillos ({concurrencia} en paralelo, {peticiones_por_segundo} pet/s)...")
+
+    # descarga → parseo → clasificación → guardado, con colas acotadas entre etapas
+    ingesta = IngestaSupermercado(
+        fuente, clasificador, estado,
+        hilos_parseo=hilos_parseo, hilos_clasificacion=hilos_clasificacion, tamano_cola=tamano_cola,
+        indice_ean=obtener_indice()  # nutrición por código de barras si el índice OFF está construido
+    )
+    pipeline = ingesta.ejecutar(categorias_a_visitar)
+    fuente.cerrar()
+
+    buffer = ingesta.buffer
+    if pipeline.errores:
+        # La ejecución queda EN_CURSO: la siguiente reanuda desde el último checkpoint
+        print(f"\n💥 {len(pipeline.errores)} errores en la pipeline (p. ej. {pipeline.errores[0]!r}).")
+    else:
+        estado.terminar()
+        print(f"\n🏁 BARRIDO V13 COMPLETADO. {buffer.insertados + buffer.actualizados} productos limpios.")
+    print(f"   {buffer.informe()}")
+    print(f"   {estado.informe()}")
+    print(f"   🙈 {ingesta.sin_ingrediente} productos sin ingrediente asociado.")
+    e = cliente.estadisticas
+    print(f"   🌐 {e['descargas']} descargas, {e['no_modificados']} sin cambios (304), {e['desde_cache']} desde caché.")
+    print("   ⏱️ Etapas:")
+    for linea in pipeline.informe().splitlines():
+        print(f"      {linea}")
 
 if __name__ == "__main__":
-    ejecutar_crawler()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Crawler de la API de Mercadona.")
+    parser.add_argument('--concurrencia', type=int, default=8, help="Descargas simultáneas")
+    parser.add_argument('--rps', type=float, default=10, help="Peticiones por segundo (presupuesto de cortesía)")
+    parser.add_argument('--timeout', type=float, default=15, help="Timeout por petición (s)")
+    parser.add_argument('--cache', default=CACHE_POR_DEFECTO, help="Directorio de la caché HTTP en disco")
+    parser.add_argument('--sin-cache', action='store_true', help="No guardar ni revalidar respuestas")
+    parser.add_argument('--replay', action='store_true', help="Ejecutar todo el pipeline desde la caché, sin red")
+    parser.add_argument('--hilos-parseo', type=int, default=2, help="Hilos de la etapa de parseo")
+    parser.add_argument('--hilos-clasificacion', type=int, default=2, help="Hilos de la etapa de clasificación")
+    parser.add_argument('--cola', type=int, default=16, help="Tamaño de las colas entre etapas (backpressure)")
+    parser.add_argument('--completo', action='store_true', help="Ignorar checkpoints y hashes: reprocesar todo")
+    parser.add_argument('--frescura', type=float, default=0, help="Horas durante las que un pasillo descargado no se vuelve a pedir")
+    args = parser.parse_args()
+    if args.replay and args.sin_cache:
+        parser.error("--replay reproduce la caché: no se puede combinar con --sin-cache")
+    ejecutar_crawler(
+        concurrencia=args.concurrencia, peticiones_por_segundo=args.rps, timeout=args.timeout,
+        directorio_cache=None if args.sin_cache else args.cache, replay=args.replay,
+        completo=args.completo, frescura=timedelta(hours=args.frescura) if args.frescura else None,
+        hilos_parseo=args.hilos_parseo, hilos_clasificacion=args.hilos_clasificacion, tamano_cola=args.cola
+    )
\ No newline at end of file
@@ -1,102 +1,128 @@
 import os
 import django
-import requests
 import time
 import sys
+import argparse
 
 # SETUP
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'qome_backend.settings')
 django.setup()
 
-from core.models import IngredienteBase, Receta
+from django.conf import settings
+from core.models import IngredienteBase
+from core.nutricion import recalcular_macros_recetas, enriquecer_productos_por_ean
+from core.off_local import AlmacenNutricion, leer_dump, recorrer_dump
+from core.indice_ean import IndiceEAN, construir_indice
+from core.off_api import ClienteOFF, PETICIONES_POR_SEGUNDO
 
-# Cabecera para ser "educados" con la API
-HEADERS_OFF = {
-    'User-Agent': 'QomeDemo/1.0 (Student Project; +http://localhost)'
-}
+def construir_almacen(ruta_dump, almacen, pais=None):
+    print(f"📦 Leyendo volcado de Open Food Facts: {ruta_dump}")
+    inicio = time.time()
+    total = almacen.construir(
+        leer_dump(ruta_dump, pais=pais),
+        progreso=lambda n: print(f"   ⏳ {n} productos con nutrición...", end="\r")
+    )
+    print(f"✅ Almacén local listo: {total} productos en {time.time() - inicio:.1f}s ({almacen.ruta})")
 
-def obtener_datos_off(nombre_ingrediente):
-    """
-    Consulta la API de Open Food Facts con sistema de REINTENTOS.
-    """
-    url = "https://es.openfoodfacts.org/cgi/search.pl"
-    params = {
-        'search_terms': nombre_ingrediente,
-        'search_simple': 1,
-        'action': 'process',
-        'json': 1,
-        'page_size': 3, 
-        'fields': 'product_name,nutriments' 
-    }
-    
-    # SISTEMA DE REINTENTOS (3 intentos max)
-    max_intentos = 3
-    for intento in range(1, max_intentos + 1):
-        try:
-            # Aumentamos timeout a 20s
-            r = requests.get(url, params=params, headers=HEADERS_OFF, timeout=20)
-            
-            if r.status_code == 200:
-                data = r.json()
-                if 'products' in data and len(data['products']) > 0:
-                    producto = data['products'][0]
-                    nutris = producto.get('nutriments', {})
-                    return {
-                        'kcal': int(nutris.get('energy-kcal_100g', 0) or 0),
-                        'prot': float(nutris.get('proteins_100g', 0) or 0),
-                        'gras': float(nutris.get('fat_100g', 0) or 0),
-                        'hidr': float(nutris.get('carbohydrates_100g', 0) or 0)
-                    }
-                return None # Si responde 200 pero no hay productos, no es error de red
-                
-        except Exception as e:
-            # Si es el último intento, imprimimos error
-            if intento == max_intentos:
-                print(f"      ❌ Error persistente: {e}")
-            else:
-                # Si falló pero quedan intentos, esperamos un poco
-                print(f"      ⚠️ Timeout. Reintentando ({intento}/{max_intentos})...", end="\r")
-                time.sleep(2) # Espera 2 segundos antes de reintentar
-    
-    return None
+def construir_indice_ean(ruta_dump, ruta_indice):
+    # Sin filtro de país: el código de barras ya identifica el producto exacto
+    print(f"🏷️ Construyendo índice EAN desde {ruta_dump}")
+    inicio = time.time()
+    total = construir_indice(
+        recorrer_dump(ruta_dump),
+        ruta_indice,
+        progreso=lambda n: print(f"   ⏳ {n} códigos leídos...", end="\r")
+    )
+    print(f"✅ Índice EAN listo: {total} códigos en {time.time() - inicio:.1f}s ({ruta_indice})")
 
-def sincronizar():
-    print("🌍 CONECTANDO CON OPEN FOOD FACTS (Modo Robusto)...")
-    
-    ingredientes = IngredienteBase.objects.all()
-    total = ingredientes.count()
+def enriquecer_productos(ruta_indice):
+    indice = IndiceEAN(ruta_indice)
+    total = enriquecer_productos_por_ean(indice)
+    indice.cerrar()
+    print(f"🏷️ {total} productos de supermercado con nutrición por código de barras.")
+
+def limpiar_nombre(nombre):
+    return nombre.replace("Bote", "").replace("Lata", "").replace("Fresco", "").strip()
+
+def buscar_en_api(cliente):
+    def buscar(consultas):
+        print(f"   📡 {len(consultas)} búsquedas (las cacheadas no salen a la red)...")
+        avisar = lambda consulta, macros, error: print(f"      ❌ {consulta}: {error}") if error else None
+        resultados = cliente.obtener_muchos(consultas, al_obtener=avisar)
+        e = cliente.estadisticas
+        print(f"   🌐 {e['descargas']} descargas, {e['desde_cache']} desde caché, {e['errores']} errores.")
+        return resultados
+    return buscar
+
+def buscar_en_almacen(almacen):
+    return lambda consultas: {c: almacen.buscar(c) for c in consultas}
+
+def sincronizar(buscar):
+    """buscar(consultas) -> {consulta: macros | None} (API con caché o almacén local)."""
+    ingredientes = list(IngredienteBase.objects.all())
+    total = len(ingredientes)
     actualizados = 0
+    cambiados = []
+    inicio = time.time()
+
+    consultas = {ing.id: limpiar_nombre(ing.nombre) for ing in ingredientes}
+    resultados = buscar(list(set(consultas.values())))
     
     for i, ing in enumerate(ingredientes):
-        print(f"   📡 [{i+1}/{total}] {ing.nombre}...", end=" ")
-        
-        # Limpieza nombre
-        query = ing.nombre.replace("Bote", "").replace("Lata", "").replace("Fresco", "").strip()
-        
-        macros = obtener_datos_off(query)
+        print(f"   🥕 [{i+1}/{total}] {ing.nombre}...", end=" ")
+        macros = resultados.get(consultas[ing.id])
         
         if macros and macros['kcal'] > 0:
             ing.calorias = macros['kcal']
             ing.proteinas = macros['prot']
             ing.grasas = macros['gras']
             ing.hidratos = macros['hidr']
-            ing.save()
-            print(f"✅ OK ({macros['kcal']} kcal)")
+            cambiados.append(ing)
+            detalle = f", mediana de {macros['candidatos']}" if 'candidatos' in macros else ""
+            print(f"✅ OK ({macros['kcal']} kcal{detalle})")
             actualizados += 1
         else:
             print("⚠️ Sin datos (0 kcal)")
-        
-        # Pausa entre ingredientes distintos para no saturar
-        time.sleep(1.0)
 
-    print(f"\n📊 Sincronización finalizada. {actualizados}/{total} ingredientes actualizados.")
+    IngredienteBase.objects.bulk_update(cambiados, ['calorias', 'proteinas', 'grasas', 'hidratos'], batch_size=500)
+    print(f"\n📊 Sincronización finalizada. {actualizados}/{total} ingredientes actualizados en {time.time() - inicio:.1f}s.")
     
-    print("\n🔄 Recalculando Macros de todas las Recetas...")
-    recetas = Receta.objects.all()
-    for r in recetas:
-        r.recalcular_macros()
-    print(f"✅ {recetas.count()} Recetas actualizadas con información nutricional real.")
+    print("\n🔄 Recalculando Macros de las Recetas con ingredientes cambiados...")
+    total_recetas = recalcular_macros_recetas(ingrediente_ids=[ing.id for ing in cambiados])
+    print(f"✅ {total_recetas} Recetas actualizadas con información nutricional real.")
 
 if __name__ == "__main__":
-    sincronizar()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Sincroniza la nutrición de los ingredientes con Open Food Facts.")
+    parser.add_argument('--dump', help="Volcado de OFF (.jsonl/.csv, opcionalmente .gz) para construir el almacén local")
+    parser.add_argument('--local', action='store_true', help="Usar el almacén local ya construido (sin red)")
+    parser.add_argument('--pais', help="Quedarse sólo con productos de este país (p. ej. en:spain)")
+    parser.add_argument('--almacen', default=str(settings.QOME_OFF_ALMACEN), help="Ruta del almacén local")
+    parser.add_argument('--ean', action='store_true', help="Nutrición de ProductoReal por código de barras (con --dump, construye antes el índice)")
+    parser.add_argument('--indice-ean', default=str(settings.QOME_OFF_INDICE_EAN), help="Ruta del índice binario EAN")
+    parser.add_argument('--concurrencia', type=int, default=4, help="Búsquedas simultáneas contra la API")
+    parser.add_argument('--rps', type=float, default=PETICIONES_POR_SEGUNDO, help="Peticiones por segundo a la API")
+    parser.add_argument('--sin-cache', action='store_true', help="No leer ni guardar la caché de respuestas")
+    args = parser.parse_args()
+
+    if args.ean:
+        if args.dump:
+            construir_indice_ean(args.dump, args.indice_ean)
+        elif not os.path.exists(args.indice_ean):
+            sys.exit(f"❌ No existe {args.indice_ean}. Constrúyelo antes con --dump --ean.")
+        enriquecer_productos(args.indice_ean)
+
+    if args.dump or args.local:
+        almacen = AlmacenNutricion(args.almacen)
+        if args.dump:
+            construir_almacen(args.dump, almacen, pais=args.pais)
+        elif not almacen.existe:
+            sys.exit(f"❌ No existe {almacen.ruta}. Constrúyelo antes con --dump.")
+        print("💾 SINCRONIZANDO CON EL ALMACÉN LOCAL DE OPEN FOOD FACTS...")
+        sincronizar(buscar_en_almacen(almacen))
+        almacen.cerrar()
+    else:
+        print("🌍 CONECTANDO CON OPEN FOOD FACTS (Concurrente + Caché)...")
+        cliente = ClienteOFF(concurrencia=args.concurrencia, peticiones_por_segundo=args.rps, usar_cache=not args.sin_cache)
+        sincronizar(buscar_en_api(cliente))
+        cliente.cerrar()
\ No newline at end of file
@@ -6,10 +6,16 @@ from .models import (
     RecetaIngrediente, 
     PlanSemanal, 
     ComidaPlanificada,
+    LineaCompra,
     Supermercado,
     PerfilUsuario,
-    CostePorSupermercado  # <--- NUEVO MODELO IMPORTADO
+    CostePorSupermercado,  # <--- NUEVO MODELO IMPORTADO
+    TrabajoPlan,
+    EjecucionCrawler,
+    ConjuntoSupermercados
 )
+from .cache import CATALOGO, subir_version
+from .precios import materializar_precios
 
 # 1. Configuración de INGREDIENTE BASE
 @admin.register(IngredienteBase)
@@ -69,10 +75,20 @@ class ComidaPlanificadaInline(admin.TabularInline):
     def has_add_permission(self, request, obj):
         return False
 
+class LineaCompraInline(admin.TabularInline):
+    model = LineaCompra
+    extra = 0
+    readonly_fields = ('supermercado_nombre', 'nombre', 'unidades', 'precio_unitario', 'total')
+    exclude = ('producto', 'supermercado', 'peso_gramos', 'imagen_url')
+    can_delete = False
+
+    def has_add_permission(self, request, obj):
+        return False
+
 @admin.register(PlanSemanal)
 class PlanSemanalAdmin(admin.ModelAdmin):
     list_display = ('usuario', 'fecha_inicio', 'coste_total_estimado') 
-    inlines = [ComidaPlanificadaInline]
+    inlines = [ComidaPlanificadaInline, LineaCompraInline]
 
 # 5. Otros registros simples
 admin.site.register(Supermercado)
@@ -81,4 +97,35 @@ admin.site.register(PerfilUsuario)
 @admin.register(CostePorSupermercado)
 class CostePorSupermercadoAdmin(admin.ModelAdmin):
     list_display = ('receta', 'supermercado', 'coste', 'es_posible')
-    list_filter = ('supermercado', 'es_posible')
\ No newline at end of file
+    list_filter = ('supermercado', 'es_posible')
+
+@admin.register(TrabajoPlan)
+class TrabajoPlanAdmin(admin.ModelAdmin):
+    list_display = ('usuario', 'estado', 'creado_en', 'terminado_en', 'mensaje')
+    list_filter = ('estado',)
+
+@admin.register(EjecucionCrawler)
+class EjecucionCrawlerAdmin(admin.ModelAdmin):
+    list_display = ('supermercado', 'estado', 'iniciada_en', 'terminada_en')
+    list_filter = ('supermercado', 'estado')
+
+# Conjuntos de supermercados con precios materializados (los registra el indexador)
+@admin.register(ConjuntoSupermercados)
+class ConjuntoSupermercadosAdmin(admin.ModelAdmin):
+    list_display = ('supermercados', 'firma', 'actualizado_en')
+    readonly_fields = ('firma', 'actualizado_en')
+    actions = ['materializar']
+
+    def save_model(self, request, obj, form, change):
+        ids = obj.ids()
+        obj.supermercados = ConjuntoSupermercados.lista_de(ids)
+        obj.firma = ConjuntoSupermercados.firma_de(ids)
+        super().save_model(request, obj, form, change)
+        materializar_precios([obj])
+        subir_version(CATALOGO)
+
+    @admin.action(description="Materializar precios de los conjuntos seleccionados")
+    def materializar(self, request, queryset):
+        filas = materializar_precios(queryset)
+        subir_version(CATALOGO)
+        self.message_user(request, f"{filas} precios materializados.")
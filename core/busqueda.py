@@ -0,0 +1,123 @@
+import re
+from collections import defaultdict
+from django.db import connections
+from django.db.models import F, Q
+from .clasificador import normalizar
+from .models import Receta, RecetaIngrediente, DocumentoBusquedaReceta, IndiceBusquedaReceta
+
+# --- BÚSQUEDA DE TEXTO COMPLETO DE RECETAS ---
+# Cada receta tiene un DocumentoBusquedaReceta (título + nombres de sus
+# ingredientes, pasados por `normalizar` igual que en el scraper) y, en
+# SQLite, una tabla FTS5 de contenido externo que lo indexa vía triggers.
+# La búsqueda es por prefijo de cada palabra ("salm" encuentra "Salmón") y
+# se ordena por bm25 (por precio si casa con demasiadas recetas). Sin FTS5
+# se busca con LIKE sobre el mismo texto.
+
+TABLA_FTS = IndiceBusquedaReceta._meta.db_table
+TAMANO_LOTE = 500
+# bm25 se calcula para todas las coincidencias en cada página (no hay índice
+# por relevancia): por encima de este número se ordena por precio
+LIMITE_RELEVANCIA = 2000
+
+# ¿Tiene la BD la tabla FTS5? (por nombre de BD, se mira una vez por proceso)
+_fts = {}
+
+
+def hay_fts(using='default'):
+    conexion = connections[using]
+    clave = conexion.settings_dict['NAME']
+    if clave not in _fts:
+        _fts[clave] = conexion.vendor == 'sqlite' and TABLA_FTS in conexion.introspection.table_names()
+    return _fts[clave]
+
+
+def texto_busqueda(texto):
+    return ' '.join(normalizar(texto or '').split())
+
+
+def palabras_busqueda(texto):
+    return re.findall(r'\w+', normalizar(texto or ''))
+
+
+def expresion_fts(texto):
+    """'Salmón al horno' -> '"salmon"* "al"* "horno"*' (todas las palabras, por prefijo)."""
+    return ' '.join(f'"{p}"*' for p in palabras_busqueda(texto))
+
+
+# --- MANTENIMIENTO INCREMENTAL ---
+def indexar_recetas(receta_ids=None):
+    """
+    (Re)genera en bloque los documentos de búsqueda de esas recetas (None =
+    todas). Los triggers trasladan el cambio al índice FTS5.
+    Devuelve el número de documentos escritos.
+    """
+    if receta_ids is None:
+        receta_ids = Receta.objects.values_list('id', flat=True)
+    ids = sorted(set(receta_ids))
+
+    total = 0
+    for i in range(0, len(ids), TAMANO_LOTE):
+        lote = ids[i:i + TAMANO_LOTE]
+        titulos = dict(Receta.objects.filter(id__in=lote).values_list('id', 'titulo'))
+        nombres = defaultdict(list)
+        for receta_id, nombre in RecetaIngrediente.objects.filter(receta_id__in=lote).order_by('id').values_list(
+            'receta_id', 'ingrediente_base__nombre'
+        ):
+            nombres[receta_id].append(texto_busqueda(nombre))
+
+        DocumentoBusquedaReceta.objects.bulk_create(
+            [
+                DocumentoBusquedaReceta(
+                    receta_id=receta_id, titulo=texto_busqueda(titulo), ingredientes=' '.join(nombres[receta_id])
+                )
+                for receta_id, titulo in titulos.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['receta'],
+            update_fields=['titulo', 'ingredientes']
+        )
+        total += len(titulos)
+    return total
+
+
+def optimizar_indice(using='default'):
+    """Fusiona los segmentos del índice FTS5 (tras cargas grandes)."""
+    if not hay_fts(using): return
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"INSERT INTO {TABLA_FTS}({TABLA_FTS}) VALUES ('optimize')")
+
+
+# --- CONSULTA ---
+def hay_mas_coincidencias(expresion, limite, using='default'):
+    """¿Casan más de `limite` recetas? Sin bm25: se detiene en la fila limite + 1."""
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f"SELECT count(*) FROM (SELECT rowid FROM {TABLA_FTS} WHERE {TABLA_FTS} MATCH %s LIMIT %s)",
+            [expresion, limite + 1]
+        )
+        return cursor.fetchone()[0] > limite
+
+
+def buscar_recetas(recetas, texto):
+    """
+    Filtra el queryset `recetas` por `texto` (título o ingredientes).
+    Devuelve (queryset, campo de orden): con FTS5 se anota `relevancia`
+    (bm25) y ese es el orden, salvo que la búsqueda sea tan genérica que
+    case con más de LIMITE_RELEVANCIA recetas; entonces, y con el respaldo
+    LIKE, no hay ranking (None) y se ordena por precio.
+    """
+    palabras = palabras_busqueda(texto)
+    if not palabras: return recetas, None
+
+    if hay_fts(recetas.db):
+        expresion = expresion_fts(texto)
+        recetas = recetas.filter(busqueda__documento__coincide=expresion)
+        if hay_mas_coincidencias(expresion, LIMITE_RELEVANCIA, recetas.db):
+            return recetas, None
+        return recetas.annotate(relevancia=F('busqueda__rango')), 'relevancia'
+
+    for palabra in palabras:
+        recetas = recetas.filter(
+            Q(documento_busqueda__titulo__contains=palabra) | Q(documento_busqueda__ingredientes__contains=palabra)
+        )
+    return recetas, None
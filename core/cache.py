@@ -0,0 +1,85 @@
+import hashlib
+import threading
+import time
+from django.core.cache import cache as contenido
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+
+# --- CACHÉ CON CLAVES VERSIONADAS (cache-aside) ---
+# El contenido va a la caché de Django (memoria de cada proceso) con las
+# versiones de las que depende dentro de la clave. Invalidar es subir una
+# versión; las versiones viven en la BD (tabla VersionCache), así que el
+# indexador de precios o el pool de planes también invalidan lo que sirve la
+# web, y la subida se confirma en la misma transacción que el cambio.
+# Lo viejo no se vuelve a leer y caduca solo.
+
+CATALOGO = ('catalogo',)
+AUSENTE = object()
+
+cerrojo_estadisticas = threading.Lock()
+estadisticas = {}  # {espacio: {'aciertos': n, 'fallos': n}} de este proceso
+
+
+def contar(espacio, resultado):
+    with cerrojo_estadisticas:
+        contadores = estadisticas.setdefault(espacio, {'aciertos': 0, 'fallos': 0})
+        contadores[resultado] += 1
+
+
+def version_usuario(usuario_id):
+    return ('usuario', usuario_id)
+
+
+def clave_version(partes):
+    return 'version:' + ':'.join(str(p) for p in partes)
+
+
+def versiones(dependencias):
+    """Versión actual de cada una (None si nunca ha subido), con una consulta."""
+    from .models import VersionCache  # import local: models importa este módulo
+    claves = [clave_version(partes) for partes in dependencias]
+    actuales = dict(VersionCache.objects.filter(clave__in=claves).values_list('clave', 'valor'))
+    return tuple(actuales.get(clave) for clave in claves)
+
+
+def subir_versiones(lista_partes):
+    """
+    Invalida lo cacheado con esas versiones (dos consultas para cualquier
+    número). La nueva versión es al menos el reloj en nanosegundos, así que
+    no se repite aunque la BD se reinicie o se restaure una copia anterior.
+    """
+    from .models import VersionCache
+    claves = sorted({clave_version(partes) for partes in lista_partes})
+    if not claves: return
+    ahora = time.time_ns()
+    VersionCache.objects.bulk_create([VersionCache(clave=c, valor=ahora) for c in claves], ignore_conflicts=True)
+    VersionCache.objects.filter(clave__in=claves).update(valor=Greatest(F('valor') + 1, Value(ahora)))
+
+
+def subir_version(partes):
+    subir_versiones([partes])
+
+
+def obtener(espacio, clave, dependencias, calcular):
+    """
+    Valor de `calcular()` para (espacio, clave), cacheado mientras no cambie
+    ninguna de las versiones de `dependencias`. Si `calcular` lanza una
+    excepción (p. ej. Http404) no se guarda nada. Mientras alguna versión no
+    exista (nunca ha subido) tampoco: una versión fija como 0 volvería a
+    valer lo mismo tras vaciar la BD y se serviría contenido de antes.
+    """
+    actuales = versiones(dependencias)
+    if None in actuales:
+        contar(espacio, 'fallos')
+        return calcular()
+    resumen = hashlib.sha1(repr((clave, actuales)).encode()).hexdigest()
+    clave_cache = f"{espacio}:{resumen}"
+
+    valor = contenido.get(clave_cache, AUSENTE)
+    if valor is not AUSENTE:
+        contar(espacio, 'aciertos')
+        return valor
+    contar(espacio, 'fallos')
+    valor = calcular()
+    contenido.set(clave_cache, valor)
+    return valor
@@ -0,0 +1,198 @@
+import re
+
+# --- FILTROS DE SEGURIDAD (BLACKLIST) ---
+# Palabras que, si aparecen, DESCARTAN el producto inmediatamente.
+BLACKLIST = [
+    "perro", "gato", "mascota", "animal", "juniors", "infantil", "bebé", "pañal",
+    "champú", "gel", "jabón", "crema", "facial", "corporal", "limpieza", "friegasuelos",
+    "detergente", "suavizante", "lejía", "insecticida", "ambientador", "pilas", "bombilla",
+    "servilleta", "papel", "higiénico", "toallitas", "discos", "algodón", "bastoncillos",
+    "maquillaje", "colonia", "perfume", "desodorante", "estropajo", "bayeta", "fregona",
+    "fregaplatos", "lavavajillas", "mopa", "escoba"
+]
+
+# 1. DICCIONARIO DE SINÓNIMOS (Lógica OR)
+MATCH_SINONIMOS_OR = {
+    "Macarrones": ["macarrón", "plumas", "penne", "tiburón", "hélices"],
+    "Espaguetis": ["spaghetti", "espagueti", "tallarín"],
+    "Arroz": ["arroz"],
+    "Gambas": ["gamba", "langostino", "camarón"],
+    "Salmón": ["salmón"],
+    "Merluza": ["merluza"],
+    "Bacalao": ["bacalao"],
+    "Atún Lata": ["atún", "bonito"],
+    "Lentejas Bote": ["lenteja"],
+    "Garbanzos Bote": ["garbanzo"],
+    "Pan Molde": ["molde"],
+    "Huevo Duro": ["cocido"],
+    "Quesitos": ["porciones"],
+    "Leche Entera": ["entera"],
+    "Leche Semidesnatada": ["semi"],
+    "Ajo": ["ajo"],
+    "Cebolla": ["cebolla"],
+    "Patata": ["patata"],
+    "Zanahoria": ["zanahoria"],
+    "Pimiento Rojo": ["rojo"],
+    "Pimiento Verde": ["verde"],
+    "Plátano": ["plátano", "banana"],
+    "Manzana": ["manzana"],
+    "Naranja": ["naranja"],
+    "Limón": ["limón"],
+    "Aguacate": ["aguacate"],
+    "Tomate": ["tomate"],
+    "Lechuga": ["lechuga"],
+    "Espinacas": ["espinaca"],
+    "Champiñones": ["champiñón"],
+    "Pepino": ["pepino"],
+    "Berenjena": ["berenjena"],
+    "Brócoli": ["brócoli"],
+    "Bacon": ["bacon", "panceta"],
+    "Salchichas": ["salchicha"],
+    "Sal": ["sal"],
+    "Azúcar": ["azúcar"],
+    "Harina Trigo": ["harina"],
+    "Mantequilla": ["mantequilla"],
+    "Mozzarella": ["mozzarella"],
+    "Queso Rallado": ["rallado", "fundir"],
+    "Pan Integral": ["integral"],
+    "Mayonesa": ["mayonesa"],
+    "Ketchup": ["ketchup"],
+    "Café": ["café"],
+    "Maíz Dulce": ["maíz"],
+    "Orégano": ["orégano"],
+    "Pimentón": ["pimentón"],
+    "Pimienta": ["pimienta"],
+    "Canela": ["canela"],
+    "Comino": ["comino"]
+}
+
+# 2. DICCIONARIO COMPUESTO (Lógica AND)
+MATCH_COMPUESTO_AND = {
+    "Aceite Oliva": ["aceite", "oliva"],
+    "Aceite Girasol": ["aceite", "girasol"],
+    "Carne Picada Vacuno": ["picada", "vacuno"],
+    "Pechuga de Pollo": ["pechuga", "pollo"],
+    "Lomo de Cerdo": ["lomo", "cerdo"],
+    "Jamón York": ["jamón", "cocido"],
+    "Jamón Serrano": ["jamón", "serrano"],
+    "Tomate Frito": ["tomate", "frito"],
+    "Pan Hamburguesa": ["pan", "burger"],
+    "Yogur Natural": ["yogur", "natural"],
+    "Yogur Griego": ["yogur", "griego"],
+    "Queso Batido": ["queso", "batido"],
+    "Queso Fresco": ["queso", "fresco"],
+    "Nata Cocinar": ["nata", "cocinar"],
+    "Pavo en Lonchas": ["pavo", "lonchas"]
+}
+
+def normalizar(texto):
+    replacements = (("á", "a"), ("é", "e"), ("í", "i"), ("ó", "o"), ("ú", "u"))
+    texto = texto.lower()
+    for a, b in replacements:
+        texto = texto.replace(a, b)
+    return texto
+
+def cumple_criterios_seguros(nombre_producto, nombre_ingrediente_base):
+    nombre_prod = normalizar(nombre_producto)
+    
+    # 1. FILTRO BLACKLIST
+    for bad in BLACKLIST:
+        if bad in nombre_prod: return False
+
+    nombre_ing = nombre_ingrediente_base 
+
+    # 2. INTENTO OR (Sinónimos)
+    if nombre_ing in MATCH_SINONIMOS_OR:
+        keywords = MATCH_SINONIMOS_OR[nombre_ing]
+        for k in keywords:
+            kn = normalizar(k)
+            # Lógica estricta para palabras cortas (<= 3 letras) como "Sal" o "Ajo"
+            if len(kn) <= 3:
+                # Debe estar rodeada de espacios o ser inicio/fin de cadena
+                if f" {kn} " in f" {nombre_prod} " or nombre_prod.startswith(f"{kn} ") or nombre_prod.endswith(f" {kn}"):
+                    return True
+            else:
+                if kn in nombre_prod: return True
+        return False 
+
+    # 3. INTENTO AND (Compuestos)
+    if nombre_ing in MATCH_COMPUESTO_AND:
+        keywords = MATCH_COMPUESTO_AND[nombre_ing]
+        for k in keywords:
+            if normalizar(k) not in nombre_prod: return False
+        return True
+
+    # 4. FALLBACK
+    return normalizar(nombre_ing) in nombre_prod
+
+
+# --- CLASIFICADOR COMPILADO (Índice multi-patrón) ---
+class Clasificador:
+    """
+    Versión precompilada de "primer ingrediente que cumple_criterios_seguros".
+    Normaliza cada producto una sola vez y resuelve BLACKLIST y todas las
+    palabras clave con un único recorrido de expresión regular; después sólo
+    evalúa (con consultas a conjuntos) los ingredientes que comparten alguna
+    palabra clave con el producto. Devuelve el mismo ingrediente que el bucle
+    original.
+    """
+    def __init__(self, ingredientes):
+        self.ingredientes = list(ingredientes)
+        self.reglas = []
+        subcadenas = set()
+        self.indice = {}  # ('sub'|'tok', palabra) -> posiciones de ingredientes
+
+        for pos, ing in enumerate(self.ingredientes):
+            nombre = ing.nombre
+            if nombre in MATCH_SINONIMOS_OR:
+                claves = []
+                for k in MATCH_SINONIMOS_OR[nombre]:
+                    kn = normalizar(k)
+                    # Palabras cortas: deben ir entre espacios (token completo)
+                    claves.append(('tok', kn) if len(kn) <= 3 else ('sub', kn))
+                regla = ('OR', claves)
+            elif nombre in MATCH_COMPUESTO_AND:
+                regla = ('AND', [('sub', normalizar(k)) for k in MATCH_COMPUESTO_AND[nombre]])
+            else:
+                regla = ('AND', [('sub', normalizar(nombre))])
+
+            self.reglas.append(regla)
+            for clave in regla[1]:
+                self.indice.setdefault(clave, set()).add(pos)
+                if clave[0] == 'sub': subcadenas.add(clave[1])
+
+        # BLACKLIST tal cual (igual que el original, sin normalizar las palabras)
+        self.re_blacklist = re.compile('|'.join(re.escape(b) for b in BLACKLIST))
+
+        # Lookahead en cada posición: la palabra clave MÁS LARGA que empieza ahí.
+        # Las palabras contenidas en ella se añaden con el cierre precalculado.
+        ordenadas = sorted(subcadenas, key=len, reverse=True)
+        self.re_claves = re.compile('(?=(' + '|'.join(re.escape(k) for k in ordenadas) + '))') if ordenadas else None
+        self.contenidas = {k: {k2 for k2 in subcadenas if k2 in k} for k in subcadenas}
+
+    def palabras_presentes(self, nombre_prod):
+        presentes = set()
+        if self.re_claves:
+            for m in self.re_claves.finditer(nombre_prod):
+                presentes |= self.contenidas[m.group(1)]
+        claves = {('sub', k) for k in presentes}
+        for token in nombre_prod.split(' '):
+            if ('tok', token) in self.indice: claves.add(('tok', token))
+        return claves
+
+    def clasificar(self, nombre_producto):
+        nombre_prod = normalizar(nombre_producto)
+        if self.re_blacklist.search(nombre_prod): return None
+
+        claves = self.palabras_presentes(nombre_prod)
+        candidatos = set()
+        for clave in claves:
+            candidatos |= self.indice[clave]
+
+        for pos in sorted(candidatos):
+            tipo, reglas = self.reglas[pos]
+            if tipo == 'OR':
+                if any(c in claves for c in reglas): return self.ingredientes[pos]
+            elif all(c in claves for c in reglas):
+                return self.ingredientes[pos]
+        return None
@@ -0,0 +1,173 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# --- LIMITADOR DE TASA (Token bucket) ---
+class LimitadorTasa:
+    """
+    Cubo de fichas compartido entre hilos: se rellena a `por_segundo` fichas
+    por segundo hasta `rafaga`. Cada petición consume una ficha.
+    """
+    def __init__(self, por_segundo, rafaga=None):
+        self.por_segundo = float(por_segundo)
+        self.capacidad = float(rafaga or max(1, por_segundo))
+        self.fichas = self.capacidad
+        self.ultimo = time.monotonic()
+        self.cerrojo = threading.Lock()
+
+    def esperar(self):
+        if self.por_segundo <= 0: return
+        while True:
+            with self.cerrojo:
+                ahora = time.monotonic()
+                self.fichas = min(self.capacidad, self.fichas + (ahora - self.ultimo) * self.por_segundo)
+                self.ultimo = ahora
+                if self.fichas >= 1:
+                    self.fichas -= 1
+                    return
+                espera = (1 - self.fichas) / self.por_segundo
+            time.sleep(espera)
+
+
+class ErrorHTTP(Exception):
+    pass
+
+
+# --- CACHÉ HTTP EN DISCO ---
+class CacheHTTP:
+    """
+    Un fichero JSON por URL (nombre = sha1 de la URL) con el cuerpo y las
+    cabeceras ETag/Last-Modified para poder revalidar con peticiones condicionales.
+    """
+    def __init__(self, directorio):
+        self.directorio = directorio
+        os.makedirs(directorio, exist_ok=True)
+
+    def ruta(self, url):
+        return os.path.join(self.directorio, hashlib.sha1(url.encode()).hexdigest() + '.json')
+
+    def leer(self, url):
+        try:
+            with open(self.ruta(url), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def guardar(self, url, cuerpo, etag=None, last_modified=None):
+        entrada = {'url': url, 'cuerpo': cuerpo, 'etag': etag, 'last_modified': last_modified, 'guardado': time.time()}
+        destino = self.ruta(url)
+        temporal = f"{destino}.{threading.get_ident()}.tmp"
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump(entrada, f, ensure_ascii=False)
+        os.replace(temporal, destino)  # escritura atómica
+
+
+# --- CLIENTE HTTP CONCURRENTE ---
+class ClienteHTTP:
+    """
+    Sesión compartida (pool de conexiones keep-alive) + límite de concurrencia,
+    limitador de tasa, timeout y reintentos con backoff exponencial.
+    """
+    REINTENTABLES = {429, 500, 502, 503, 504}
+
+    def __init__(self, headers=None, concurrencia=8, peticiones_por_segundo=10,
+                 timeout=15, reintentos=3, backoff=0.5, cache=None, solo_cache=False):
+        """
+        cache: CacheHTTP opcional; con él get_json revalida con If-None-Match /
+        If-Modified-Since. solo_cache=True (modo replay) no toca la red, así
+        que exige cache: sin ella se descargaría todo en vivo.
+        """
+        if solo_cache and cache is None:
+            raise ValueError("solo_cache (replay) necesita una CacheHTTP")
+        self.cache = cache
+        self.solo_cache = solo_cache
+        self.estadisticas = {'descargas': 0, 'no_modificados': 0, 'desde_cache': 0}
+        self.cerrojo_estadisticas = threading.Lock()
+        self.concurrencia = max(1, concurrencia)
+        self.timeout = timeout
+        self.reintentos = reintentos
+        self.backoff = backoff
+        self.limitador = LimitadorTasa(peticiones_por_segundo)
+
+        self.sesion = requests.Session()
+        if headers: self.sesion.headers.update(headers)
+        adaptador = HTTPAdapter(pool_connections=self.concurrencia, pool_maxsize=self.concurrencia)
+        self.sesion.mount('http://', adaptador)
+        self.sesion.mount('https://', adaptador)
+
+    def get(self, url, params=None, headers=None):
+        ultimo_error = None
+        for intento in range(self.reintentos + 1):
+            if intento:
+                # Backoff exponencial con algo de jitter para no sincronizar hilos
+                time.sleep(self.backoff * (2 ** (intento - 1)) * (1 + random.random() / 2))
+            self.limitador.esperar()
+            try:
+                r = self.sesion.get(url, params=params, headers=headers, timeout=self.timeout)
+            except requests.RequestException as e:
+                ultimo_error = e
+                continue
+            if r.status_code in self.REINTENTABLES:
+                ultimo_error = ErrorHTTP(f"HTTP {r.status_code} en {url}")
+                continue
+            return r
+        raise ErrorHTTP(f"Sin respuesta válida tras {self.reintentos + 1} intentos: {ultimo_error}")
+
+    def get_json(self, url, params=None):
+        if self.cache is None:
+            r = self.get(url, params=params)
+            if r.status_code != 200:
+                raise ErrorHTTP(f"HTTP {r.status_code} en {url}")
+            self.contar('descargas')
+            return r.json()
+
+        clave = requests.Request('GET', url, params=params).prepare().url
+        entrada = self.cache.leer(clave)
+
+        if self.solo_cache:
+            if entrada is None:
+                raise ErrorHTTP(f"Sin copia en caché (replay): {clave}")
+            self.contar('desde_cache')
+            return json.loads(entrada['cuerpo'])
+
+        condicionales = {}
+        if entrada and entrada.get('etag'): condicionales['If-None-Match'] = entrada['etag']
+        if entrada and entrada.get('last_modified'): condicionales['If-Modified-Since'] = entrada['last_modified']
+
+        r = self.get(clave, headers=condicionales)
+        if r.status_code == 304 and entrada:
+            self.contar('no_modificados')
+            return json.loads(entrada['cuerpo'])
+        if r.status_code != 200:
+            raise ErrorHTTP(f"HTTP {r.status_code} en {clave}")
+
+        self.contar('descargas')
+        self.cache.guardar(clave, r.text, r.headers.get('ETag'), r.headers.get('Last-Modified'))
+        return r.json()
+
+    def contar(self, clave):
+        with self.cerrojo_estadisticas:
+            self.estadisticas[clave] += 1
+
+    def mapear(self, funcion, elementos):
+        """
+        Ejecuta funcion(elemento) con `concurrencia` hilos y va devolviendo
+        (elemento, resultado, error) según terminan.
+        """
+        with ThreadPoolExecutor(max_workers=self.concurrencia) as ejecutor:
+            futuros = {ejecutor.submit(funcion, e): e for e in elementos}
+            for futuro in as_completed(futuros):
+                try:
+                    yield futuros[futuro], futuro.result(), None
+                except Exception as e:
+                    yield futuros[futuro], None, e
+
+    def cerrar(self):
+        self.sesion.close()
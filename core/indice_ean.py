@@ -0,0 +1,143 @@
+import heapq
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from django.conf import settings
+
+# --- ÍNDICE BINARIO DE CÓDIGOS DE BARRAS (EAN) ---
+# Fichero ordenado de registros de ancho fijo, servido con mmap:
+#   cabecera: b'QOMEEAN1' + número de registros (u64)
+#   registro: EAN (u64) | offset de la línea en el volcado (u64) | kcal, prot, gras, hidr (4 × f32)
+# La búsqueda es binaria sobre el mmap: O(log n) lecturas y casi nada de
+# memoria residente (el SO pagina sólo lo que se toca), así que cualquier
+# proceso (web, scraper, scripts) puede abrirlo sin cargar el volcado.
+
+MAGICO = b'QOMEEAN1'
+CABECERA = struct.Struct('<8sQ')
+REGISTRO = struct.Struct('<QQ4f')
+CLAVE = struct.Struct('<Q')
+REGISTROS_POR_TROZO = 200_000  # ~6 MB por trozo en la ordenación externa
+
+
+def ean_a_entero(codigo):
+    """EAN-8/12/13/14 a entero; None si no es un código numérico válido."""
+    codigo = str(codigo or '').strip()
+    if not codigo.isdigit() or len(codigo) > 19: return None
+    return int(codigo)
+
+
+# --- CONSTRUCCIÓN (Ordenación externa por trozos + mezcla) ---
+def volcar_trozo(registros, directorio):
+    registros.sort(key=lambda r: r[0])  # estable: a igual EAN se mantiene el orden del volcado
+    f = tempfile.NamedTemporaryFile(dir=directorio, delete=False, suffix='.trozo')
+    with f:
+        for r in registros:
+            f.write(REGISTRO.pack(*r))
+    return f.name
+
+
+def leer_trozo(ruta):
+    with open(ruta, 'rb') as f:
+        while True:
+            datos = f.read(REGISTRO.size * 1024)
+            if not datos: return
+            yield from REGISTRO.iter_unpack(datos)
+
+
+def construir_indice(filas_con_offset, ruta, progreso=None):
+    """
+    filas_con_offset: iterable de (offset, (código, nombre, kcal, prot, gras, hidr)),
+    p. ej. off_local.recorrer_dump(). Si un EAN se repite gana su primera
+    aparición. Escribe en un temporal y lo sustituye al final.
+    Devuelve el número de registros del índice.
+    """
+    ruta = str(ruta)
+    directorio = os.path.dirname(os.path.abspath(ruta))
+    trozos, registros, leidos = [], [], 0
+    try:
+        for offset, (codigo, _, kcal, prot, gras, hidr) in filas_con_offset:
+            ean = ean_a_entero(codigo)
+            if ean is None: continue
+            registros.append((ean, offset, kcal, prot, gras, hidr))
+            leidos += 1
+            if len(registros) >= REGISTROS_POR_TROZO:
+                trozos.append(volcar_trozo(registros, directorio))
+                registros = []
+                if progreso: progreso(leidos)
+        if registros:
+            trozos.append(volcar_trozo(registros, directorio))
+
+        temporal = ruta + '.tmp'
+        total = 0
+        with open(temporal, 'wb') as salida:
+            salida.write(CABECERA.pack(MAGICO, 0))
+            anterior = None
+            # heapq.merge es estable entre trozos (en orden de volcado)
+            for r in heapq.merge(*(leer_trozo(t) for t in trozos), key=lambda r: r[0]):
+                if r[0] == anterior: continue
+                salida.write(REGISTRO.pack(*r))
+                anterior = r[0]
+                total += 1
+            salida.seek(0)
+            salida.write(CABECERA.pack(MAGICO, total))
+        os.replace(temporal, ruta)
+        return total
+    finally:
+        for t in trozos:
+            os.remove(t)
+
+
+# --- CONSULTA (mmap + búsqueda binaria) ---
+class IndiceEAN:
+    def __init__(self, ruta):
+        self.ruta = str(ruta)
+        with open(self.ruta, 'rb') as f:
+            # El mmap sigue siendo válido tras cerrar el fichero
+            self.mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magico, self.total = CABECERA.unpack_from(self.mapa, 0)
+        if magico != MAGICO:
+            raise ValueError(f"{self.ruta} no es un índice EAN válido")
+
+    def __len__(self):
+        return self.total
+
+    def posicion(self, i):
+        return CABECERA.size + i * REGISTRO.size
+
+    def buscar(self, codigo):
+        """{'kcal', 'prot', 'gras', 'hidr', 'offset'} o None."""
+        ean = ean_a_entero(codigo)
+        if ean is None: return None
+        bajo, alto = 0, self.total
+        while bajo < alto:
+            medio = (bajo + alto) // 2
+            actual = CLAVE.unpack_from(self.mapa, self.posicion(medio))[0]
+            if actual < ean:
+                bajo = medio + 1
+            elif actual > ean:
+                alto = medio
+            else:
+                _, offset, kcal, prot, gras, hidr = REGISTRO.unpack_from(self.mapa, self.posicion(medio))
+                return {'kcal': int(round(kcal)), 'prot': prot, 'gras': gras, 'hidr': hidr, 'offset': offset}
+        return None
+
+    def cerrar(self):
+        self.mapa.close()
+
+
+# Un índice abierto por proceso (las páginas del mmap las comparte el SO)
+_indice = None
+_cerrojo = threading.Lock()
+
+
+def obtener_indice():
+    """El índice de settings.QOME_OFF_INDICE_EAN, o None si no se ha construido."""
+    global _indice
+    if _indice is None:
+        ruta = getattr(settings, 'QOME_OFF_INDICE_EAN', None)
+        with _cerrojo:
+            if _indice is None and ruta and os.path.exists(ruta):
+                _indice = IndiceEAN(ruta)
+    return _indice
@@ -0,0 +1,467 @@
+import hashlib
+import json
+from collections import Counter, defaultdict
+from decimal import Decimal
+from django.db import transaction, connection
+from django.utils import timezone
+from .pipeline import Pipeline, Etapa
+from .models import (
+    ProductoReal, PrecioPendiente, EjecucionCrawler, EstadoCategoria, EstadoProductoScrapeado
+)
+
+# Límites de las columnas DecimalField(max_digits=6, decimal_places=2)
+PRECIO_MAXIMO = Decimal('9999.99')
+
+CAMPOS_ACTUALIZABLES = [
+    'ingrediente_base', 'precio_actual', 'peso_gramos', 'precio_por_kg',
+    'tipo_unidad_original', 'precio_referencia_original', 'imagen_url',
+    'ultima_actualizacion',
+]
+# Sólo se sobrescriben si la fila nueva los trae: si no, se conserva lo que
+# haya puesto el enriquecimiento (índice EAN, Open Food Facts)
+CAMPOS_NUTRICION = ['kcal_100g', 'prot_100g', 'grasas_100g', 'hidratos_100g']
+
+
+def campos_a_actualizar(producto):
+    campos = list(CAMPOS_ACTUALIZABLES)
+    if producto.ean:
+        campos.append('ean')
+    if any(getattr(producto, c) for c in CAMPOS_NUTRICION):
+        campos += CAMPOS_NUTRICION
+    return tuple(campos)
+
+
+class ProductoInvalido(Exception):
+    """Producto descartado en la ingesta; el mensaje es el motivo."""
+    pass
+
+
+# --- BUFFER DE PRODUCTOS (Upsert en bloque) ---
+class BufferProductos:
+    """
+    Acumula productos ya clasificados y los vuelca por lotes con
+    bulk_create(update_conflicts=True) sobre (supermercado, nombre_comercial).
+    Lleva la cuenta de insertados, actualizados y rechazados (con motivo).
+    """
+    def __init__(self, supermercado, tamano_lote=500, al_vaciar=None, al_fallar=None):
+        """
+        al_vaciar: callback opcional que se ejecuta dentro de la misma transacción
+        que cada lote (p. ej. para guardar el checkpoint del crawler).
+        al_fallar: callback opcional si un lote no llega a confirmarse (p. ej.
+        para olvidar el checkpoint pendiente, que describe algo no escrito).
+        """
+        self.supermercado = supermercado
+        self.tamano_lote = tamano_lote
+        self.al_vaciar = al_vaciar
+        self.al_fallar = al_fallar
+        self.pendientes = {}
+        self.insertados = 0
+        self.actualizados = 0
+        self.rechazados = Counter()
+
+    def agregar(self, datos, ingrediente):
+        try:
+            producto = self.construir(datos, ingrediente)
+        except ProductoInvalido as e:
+            self.rechazar(str(e))
+            return
+        # Dentro de un lote gana la última versión de cada nombre
+        self.pendientes[producto.nombre_comercial] = producto
+        if len(self.pendientes) >= self.tamano_lote:
+            self.vaciar()
+
+    def rechazar(self, motivo):
+        self.rechazados[motivo] += 1
+
+    def construir(self, datos, ingrediente):
+        precio = datos['precio_actual']
+        peso = datos['peso_gramos']
+        if precio <= 0:
+            raise ProductoInvalido("precio nulo")
+        if peso <= 0:
+            raise ProductoInvalido("peso nulo")
+        if precio > PRECIO_MAXIMO:
+            raise ProductoInvalido("precio fuera de rango")
+
+        # Lo que antes hacía save(): en bloque no se llama a save()
+        precio_por_kg = ProductoReal.calcular_precio_por_kg(precio, peso)
+        if precio_por_kg > PRECIO_MAXIMO:
+            raise ProductoInvalido("precio_por_kg fuera de rango")
+
+        referencia = datos.get('precio_referencia_original')
+        if referencia is not None and referencia > PRECIO_MAXIMO:
+            referencia = None
+
+        return ProductoReal(
+            supermercado=self.supermercado,
+            ingrediente_base=ingrediente,
+            nombre_comercial=datos['nombre_comercial'][:200],
+            ean=datos.get('ean') or None,
+            precio_actual=precio,
+            peso_gramos=peso,
+            precio_por_kg=precio_por_kg,
+            tipo_unidad_original=datos.get('tipo_unidad_original') or 'KG',
+            precio_referencia_original=referencia,
+            imagen_url=datos.get('imagen_url') or None,
+            kcal_100g=datos.get('kcal_100g', 0),
+            prot_100g=datos.get('prot_100g', 0.0),
+            grasas_100g=datos.get('grasas_100g', 0.0),
+            hidratos_100g=datos.get('hidratos_100g', 0.0),
+        )
+
+    def vaciar(self):
+        """
+        Escribe el lote en una transacción. El buffer sólo se vacía tras el
+        COMMIT; si falla, el lote se descarta (reintentarlo fallaría igual),
+        se cuenta como rechazado, se avisa a al_fallar y se relanza el error.
+        """
+        if not self.pendientes: return
+        lote = list(self.pendientes.values())
+
+        try:
+            with transaction.atomic():
+                # 1 SELECT por lote para saber qué existe y qué precio tenía
+                existentes = {
+                    nombre: (ing_id, precio_kg)
+                    for nombre, ing_id, precio_kg in ProductoReal.objects.filter(
+                        supermercado=self.supermercado,
+                        nombre_comercial__in=[p.nombre_comercial for p in lote]
+                    ).values_list('nombre_comercial', 'ingrediente_base_id', 'precio_por_kg')
+                }
+
+                # Un upsert por combinación de columnas presentes (como mucho 4)
+                por_campos = defaultdict(list)
+                for p in lote:
+                    por_campos[campos_a_actualizar(p)].append(p)
+                for campos, productos in por_campos.items():
+                    ProductoReal.objects.bulk_create(
+                        productos,
+                        update_conflicts=True,
+                        unique_fields=['supermercado', 'nombre_comercial'],
+                        update_fields=list(campos),
+                    )
+
+                # Dirty tracking para el indexador incremental
+                pares = set()
+                for p in lote:
+                    anterior = existentes.get(p.nombre_comercial)
+                    if anterior != (p.ingrediente_base_id, p.precio_por_kg):
+                        pares.add((p.ingrediente_base_id, self.supermercado.id))
+                        if anterior: pares.add((anterior[0], self.supermercado.id))
+                if pares:
+                    PrecioPendiente.marcar(pares)
+                if self.al_vaciar:
+                    self.al_vaciar()
+        except Exception:
+            self.pendientes = {}
+            self.rechazados["lote no guardado (error de BD)"] += len(lote)
+            if self.al_fallar:
+                self.al_fallar()
+            raise
+
+        self.pendientes = {}
+        actualizados = sum(1 for p in lote if p.nombre_comercial in existentes)
+        self.actualizados += actualizados
+        self.insertados += len(lote) - actualizados
+
+    def informe(self):
+        rechazados = sum(self.rechazados.values())
+        lineas = [f"➕ {self.insertados} insertados, 🔁 {self.actualizados} actualizados, 🚫 {rechazados} rechazados"]
+        for motivo, n in self.rechazados.most_common():
+            lineas.append(f"      · {motivo}: {n}")
+        return "\n".join(lineas)
+
+
+# --- ESTADO DEL CRAWLER (Checkpoints, hashes y reanudación) ---
+def hash_contenido(datos):
+    """sha1 estable del JSON (claves ordenadas) para detectar cambios."""
+    return hashlib.sha1(json.dumps(datos, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+
+
+class EstadoCrawler:
+    """
+    Memoria entre ejecuciones de un crawler:
+    - Reanuda la última EjecucionCrawler EN_CURSO (murió a medias) saltándose
+      las categorías que ya dejó guardadas.
+    - Salta categorías cuyo contenido no ha cambiado (mismo hash) y, con
+      `frescura`, las descargadas hace menos de ese tiempo.
+    - Deduplica productos dentro de la ejecución y salta los que no cambian.
+    Los checkpoints se guardan con guardar_checkpoint(), en la transacción de
+    cada lote de BufferProductos, para no marcar nada que no esté escrito.
+    """
+    def __init__(self, supermercado, completo=False, frescura=None):
+        self.supermercado = supermercado
+        self.completo = completo
+        self.frescura = frescura
+        self.estadisticas = Counter()
+
+        anterior = EjecucionCrawler.objects.filter(
+            supermercado=supermercado, estado='EN_CURSO'
+        ).order_by('-iniciada_en').first()
+        if anterior and completo:
+            anterior.estado = 'ABANDONADA'
+            anterior.terminada_en = timezone.now()
+            anterior.save(update_fields=['estado', 'terminada_en'])
+            anterior = None
+        self.reanudada = anterior is not None
+        self.ejecucion = anterior or EjecucionCrawler.objects.create(supermercado=supermercado)
+
+        self.categorias = {
+            c.categoria_id: c for c in EstadoCategoria.objects.filter(supermercado=supermercado)
+        }
+        self.hashes_productos = dict(
+            EstadoProductoScrapeado.objects.filter(supermercado=supermercado)
+            .values_list('producto_id', 'hash_contenido')
+        )
+        # Productos ya escritos por esta misma ejecución antes de morir
+        self.vistos = set(
+            EstadoProductoScrapeado.objects.filter(ejecucion=self.ejecucion)
+            .values_list('producto_id', flat=True)
+        ) if self.reanudada else set()
+
+        self.categorias_pendientes = {}
+        self.productos_pendientes = {}
+
+    def categorias_a_descargar(self, categorias):
+        """Filtra (antes de ir a la red) las ya hechas en esta ejecución y las frescas."""
+        limite = timezone.now() - self.frescura if self.frescura else None
+        quedan = []
+        for cat_id in categorias:
+            estado = self.categorias.get(str(cat_id))
+            if estado and estado.ejecucion_id == self.ejecucion.id:
+                self.estadisticas['categorias_reanudadas'] += 1
+            elif estado and limite and not self.completo and estado.ultima_descarga >= limite:
+                self.estadisticas['categorias_frescas'] += 1
+            else:
+                quedan.append(cat_id)
+        return quedan
+
+    def categoria_sin_cambios(self, cat_id, huella):
+        estado = self.categorias.get(str(cat_id))
+        if estado and estado.hash_contenido == huella and not self.completo:
+            self.estadisticas['categorias_sin_cambios'] += 1
+            return True
+        return False
+
+    def categoria_terminada(self, cat_id, huella):
+        """Sólo cuando todos sus productos están ya en el buffer."""
+        self.categorias_pendientes[str(cat_id)] = huella
+
+    def producto_a_procesar(self, producto_id, p):
+        """
+        Devuelve (producto_id, huella), o None si el producto ya pasó por esta
+        ejecución (está en varias categorías) o su contenido no ha cambiado.
+        """
+        if producto_id in self.vistos:
+            self.estadisticas['productos_duplicados'] += 1
+            return None
+        self.vistos.add(producto_id)
+
+        huella = hash_contenido(p)
+        if self.hashes_productos.get(producto_id) == huella and not self.completo:
+            self.estadisticas['productos_sin_cambios'] += 1
+            return None
+        return producto_id, huella
+
+    def producto_en_buffer(self, producto_id, huella):
+        self.productos_pendientes[producto_id] = huella
+
+    def descartar_pendientes(self):
+        """
+        Un lote de BufferProductos no llegó a escribirse: lo pendiente de
+        checkpoint ya no es verdad. Se olvida y esos productos y pasillos se
+        reprocesarán en la próxima ejecución.
+        """
+        self.productos_pendientes = {}
+        self.categorias_pendientes = {}
+
+    def guardar_checkpoint(self):
+        ahora = timezone.now()
+        if self.productos_pendientes:
+            EstadoProductoScrapeado.objects.bulk_create(
+                [EstadoProductoScrapeado(
+                    supermercado=self.supermercado, producto_id=pid, hash_contenido=h,
+                    ultima_vista=ahora, ejecucion=self.ejecucion
+                ) for pid, h in self.productos_pendientes.items()],
+                update_conflicts=True,
+                unique_fields=['supermercado', 'producto_id'],
+                update_fields=['hash_contenido', 'ultima_vista', 'ejecucion'],
+                batch_size=500
+            )
+            self.hashes_productos.update(self.productos_pendientes)
+            self.productos_pendientes = {}
+
+        if self.categorias_pendientes:
+            estados = [EstadoCategoria(
+                supermercado=self.supermercado, categoria_id=cid, hash_contenido=h,
+                ultima_descarga=ahora, ejecucion=self.ejecucion
+            ) for cid, h in self.categorias_pendientes.items()]
+            EstadoCategoria.objects.bulk_create(
+                estados,
+                update_conflicts=True,
+                unique_fields=['supermercado', 'categoria_id'],
+                update_fields=['hash_contenido', 'ultima_descarga', 'ejecucion'],
+            )
+            self.categorias.update({e.categoria_id: e for e in estados})
+            self.categorias_pendientes = {}
+
+    def terminar(self):
+        self.guardar_checkpoint()
+        self.ejecucion.estado = 'COMPLETADA'
+        self.ejecucion.terminada_en = timezone.now()
+        self.ejecucion.save(update_fields=['estado', 'terminada_en'])
+
+    def informe(self):
+        e = self.estadisticas
+        return (
+            f"📌 Pasillos: {e['categorias_reanudadas']} ya hechos (reanudación), "
+            f"{e['categorias_frescas']} frescos, {e['categorias_sin_cambios']} sin cambios. "
+            f"Productos: {e['productos_duplicados']} repetidos, {e['productos_sin_cambios']} sin cambios."
+        )
+
+
+# --- FUENTES DE SUPERMERCADO (Etapas de descarga y parseo enchufables) ---
+class FuenteSupermercado:
+    """
+    Lo único específico de cada supermercado. Para añadir uno nuevo basta con
+    una subclase; clasificación y guardado en bloque son comunes.
+    """
+    nombre = None
+    color_brand = '#333333'
+
+    def categorias(self):
+        """Ids de las categorías (pasillos) a recorrer."""
+        raise NotImplementedError
+
+    def descargar(self, categorias):
+        """Iterable de (cat_id, productos_en_bruto, error) según van llegando."""
+        raise NotImplementedError
+
+    def id_producto(self, p):
+        raise NotImplementedError
+
+    def nombre_producto(self, p):
+        raise NotImplementedError
+
+    def parsear(self, p):
+        """Dict para BufferProductos; lanza ProductoInvalido con el motivo."""
+        raise NotImplementedError
+
+    def cerrar(self):
+        pass
+
+
+class LoteCategoria:
+    """Lo que viaja por la pipeline: una categoría y sus productos."""
+    def __init__(self, cat_id, huella, productos=()):
+        self.cat_id = cat_id
+        self.huella = huella
+        self.productos = list(productos)  # (clave, producto_en_bruto)
+        self.parseados = []               # (clave, nombre, datos | None, motivo de rechazo)
+        self.clasificados = []            # (clave, datos | None, motivo, ingrediente | None)
+
+
+# --- INGESTA EN STREAMING (descarga → parseo → clasificación → guardado) ---
+class IngestaSupermercado:
+    """
+    Une una FuenteSupermercado con el Clasificador, el EstadoCrawler y
+    BufferProductos mediante una Pipeline con colas acotadas. La red no espera
+    a la BD ni al revés; el guardado va en un único hilo (un escritor).
+    """
+    def __init__(self, fuente, clasificador, estado, hilos_parseo=2, hilos_clasificacion=2,
+                 tamano_cola=16, tamano_lote=500, indice_ean=None):
+        """indice_ean: IndiceEAN opcional para completar la nutrición por código de barras."""
+        self.fuente = fuente
+        self.indice_ean = indice_ean
+        self.clasificador = clasificador
+        self.estado = estado
+        self.buffer = BufferProductos(
+            estado.supermercado, tamano_lote,
+            al_vaciar=estado.guardar_checkpoint, al_fallar=estado.descartar_pendientes
+        )
+        self.hilos_parseo = hilos_parseo
+        self.hilos_clasificacion = hilos_clasificacion
+        self.tamano_cola = tamano_cola
+        self.sin_ingrediente = 0
+        self.fallidas = 0
+        self.total_categorias = 0
+
+    def ejecutar(self, categorias):
+        self.total_categorias = len(categorias)
+        self.pipeline = Pipeline(
+            self.lotes(categorias),
+            [
+                Etapa('parseo', self.parsear, hilos=self.hilos_parseo),
+                Etapa('clasificación', self.clasificar, hilos=self.hilos_clasificacion),
+                Etapa('guardado', self.guardar, hilos=1, al_terminar=self.terminar_guardado),
+            ],
+            tamano_cola=self.tamano_cola, nombre_fuente='descarga'
+        )
+        return self.pipeline.ejecutar()
+
+    def lotes(self, categorias):
+        # Un solo hilo: aquí se filtra con el EstadoCrawler (hashes y repetidos)
+        for cat_id, productos_raw, error in self.fuente.descargar(categorias):
+            if error:
+                self.fallidas += 1
+                print(f"   ⚠️ Pasillo {cat_id} sin descargar: {error}")
+                continue
+            huella = hash_contenido(productos_raw)
+            if self.estado.categoria_sin_cambios(cat_id, huella):
+                yield LoteCategoria(cat_id, huella)
+                continue
+            lote = LoteCategoria(cat_id, huella)
+            for p in productos_raw:
+                clave = self.estado.producto_a_procesar(self.fuente.id_producto(p), p)
+                if clave is not None: lote.productos.append((clave, p))
+            yield lote
+
+    def parsear(self, lote):
+        for clave, p in lote.productos:
+            try:
+                datos = self.fuente.parsear(p)
+                if self.indice_ean and datos.get('ean'): self.completar_nutricion(datos)
+                lote.parseados.append((clave, self.fuente.nombre_producto(p), datos, None))
+            except ProductoInvalido as e:
+                lote.parseados.append((clave, self.fuente.nombre_producto(p), None, str(e)))
+        return lote
+
+    def completar_nutricion(self, datos):
+        encontrado = self.indice_ean.buscar(datos['ean'])
+        if encontrado is None: return
+        datos['kcal_100g'] = encontrado['kcal']
+        datos['prot_100g'] = round(encontrado['prot'], 1)
+        datos['grasas_100g'] = round(encontrado['gras'], 1)
+        datos['hidratos_100g'] = round(encontrado['hidr'], 1)
+
+    def clasificar(self, lote):
+        # Índice compilado: mismo "primer ingrediente que cumple" que antes
+        lote.clasificados = [
+            (clave, datos, motivo, self.clasificador.clasificar(nombre))
+            for clave, nombre, datos, motivo in lote.parseados
+        ]
+        return lote
+
+    def guardar(self, lote):
+        for clave, datos, motivo, ing in lote.clasificados:
+            if ing is None:
+                self.sin_ingrediente += 1
+                continue
+            if motivo:
+                self.buffer.rechazar(motivo)
+            else:
+                self.buffer.agregar(datos, ing)
+            self.estado.producto_en_buffer(*clave)
+
+        self.estado.categoria_terminada(lote.cat_id, lote.huella)
+        # Sin nada a medias en el buffer el checkpoint se puede guardar ya
+        if not self.buffer.pendientes: self.estado.guardar_checkpoint()
+
+        hechos = self.pipeline.etapas[-1].procesados
+        if hechos % 15 == 0: print(f"   ⏳ Pasillo {hechos}/{self.total_categorias}...")
+
+    def terminar_guardado(self):
+        try:
+            self.buffer.vaciar()
+        finally:
+            connection.close()  # conexión propia del hilo escritor
@@ -0,0 +1,96 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import connections
+from core.models import PerfilUsuario
+from core.motor import CatalogoPlanes, construir_plan, guardar_planes
+from core.precios import registrar_conjuntos
+
+# Catálogo "caliente" de cada proceso trabajador (se reutiliza entre usuarios)
+_catalogo = None
+
+
+def inicializar_trabajador():
+    global _catalogo
+    import django
+    django.setup()
+    _catalogo = CatalogoPlanes()
+
+
+def inicializar_local():
+    global _catalogo
+    _catalogo = CatalogoPlanes()
+
+
+def calcular_tanda(perfil_ids):
+    """Construye en memoria los planes de una tanda de perfiles (sin escribir)."""
+    perfiles = PerfilUsuario.objects.filter(id__in=perfil_ids).prefetch_related('supermercados_seleccionados')
+    return [construir_plan(perfil, _catalogo) for perfil in perfiles]
+
+
+class Command(BaseCommand):
+    help = "Regenera el plan semanal de todos los usuarios con perfil (o de un subconjunto) en paralelo."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuarios', nargs='+', help="Sólo estos nombres de usuario")
+        parser.add_argument('--supermercado', help="Sólo usuarios que tengan seleccionado este supermercado")
+        parser.add_argument('--procesos', type=int, default=os.cpu_count() or 1, help="Procesos trabajadores (1 = sin pool)")
+        parser.add_argument('--tanda', type=int, default=50, help="Perfiles que calcula cada tarea del pool")
+        parser.add_argument('--lote', type=int, default=500, help="Planes por transacción de escritura")
+
+    def handle(self, *args, **opts):
+        perfiles = PerfilUsuario.objects.all()
+        if opts['usuarios']:
+            perfiles = perfiles.filter(usuario__username__in=opts['usuarios'])
+        if opts['supermercado']:
+            perfiles = perfiles.filter(supermercados_seleccionados__nombre=opts['supermercado'])
+        ids = list(perfiles.order_by('id').values_list('id', flat=True).distinct())
+
+        if not ids:
+            self.stdout.write("⚠️ No hay perfiles que regenerar.")
+            return
+
+        # Conjuntos de supermercados registrados aquí: los trabajadores sólo leen precios
+        catalogo = CatalogoPlanes()
+        registrar_conjuntos({catalogo.supers_de(p) for p in perfiles.prefetch_related('supermercados_seleccionados')})
+
+        tandas = [ids[i:i + opts['tanda']] for i in range(0, len(ids), opts['tanda'])]
+        procesos = max(1, min(opts['procesos'], len(tandas)))
+        self.stdout.write(f"🧩 Regenerando {len(ids)} planes con {procesos} proceso(s)...")
+
+        inicio = time.perf_counter()
+        pendientes = []
+        escritos = 0
+
+        def volcar():
+            nonlocal escritos
+            guardar_planes(pendientes)
+            escritos += len(pendientes)
+            pendientes.clear()
+            ritmo = escritos / (time.perf_counter() - inicio)
+            self.stdout.write(f"   💾 {escritos}/{len(ids)} planes guardados ({ritmo:.1f} planes/s)")
+
+        if procesos == 1:
+            inicializar_local()
+            resultados = map(calcular_tanda, tandas)
+            ejecutor = None
+        else:
+            # Se cierran antes de crear los procesos: así ninguno hereda un socket
+            # o fichero de BD abierto y cada trabajador abre su propia conexión
+            connections.close_all()
+            ejecutor = ProcessPoolExecutor(max_workers=procesos, initializer=inicializar_trabajador)
+            resultados = ejecutor.map(calcular_tanda, tandas)
+
+        try:
+            for planes in resultados:
+                pendientes.extend(planes)
+                if len(pendientes) >= opts['lote']: volcar()
+            if pendientes: volcar()
+        finally:
+            if ejecutor: ejecutor.shutdown()
+
+        duracion = time.perf_counter() - inicio
+        self.stdout.write(self.style.SUCCESS(
+            f"✨ {escritos} planes en {duracion:.1f}s ({escritos / duracion:.1f} planes/s)."
+        ))
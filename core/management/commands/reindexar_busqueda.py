@@ -0,0 +1,14 @@
+import time
+from django.core.management.base import BaseCommand
+from core.busqueda import indexar_recetas, optimizar_indice, hay_fts
+
+
+class Command(BaseCommand):
+    help = "Regenera los documentos de búsqueda de todas las recetas (tras cargas que se salten save())."
+
+    def handle(self, *args, **opts):
+        t0 = time.perf_counter()
+        total = indexar_recetas()
+        optimizar_indice()
+        motor = "FTS5" if hay_fts() else "LIKE (sin FTS5)"
+        self.stdout.write(f"✨ {total} recetas indexadas en {time.perf_counter() - t0:.1f}s · búsqueda por {motor}.")
@@ -0,0 +1,81 @@
+# --- MOTOR MATRICIAL (NumPy) PARA COSTES Y MACROS ---
+# Matriz dispersa receta×ingrediente de gramos (COO) construida una vez:
+#   costes = gramos × céntimos_por_kg      (una columna por supermercado)
+#   macros = gramos × nutrientes_por_gramo (kcal, prot, grasas, hidratos)
+# NumPy es opcional: sin él DISPONIBLE es False y se usa el camino en Python.
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - entorno sin numpy
+    np = None
+
+DISPONIBLE = np is not None
+
+
+class MatrizRecetas:
+    def __init__(self, recetas_ids, filas):
+        """
+        recetas_ids: ids de TODAS las recetas a calcular (también las vacías).
+        filas: iterable de (receta_id, ingrediente_base_id, gramos).
+        """
+        self.recetas_ids = list(recetas_ids)
+        self.pos_receta = {rid: i for i, rid in enumerate(self.recetas_ids)}
+
+        self.ingredientes_ids = []
+        self.pos_ingrediente = {}
+        filas_idx, cols_idx, gramos = [], [], []
+        for receta_id, ing_id, g in filas:
+            fila = self.pos_receta.get(receta_id)
+            if fila is None: continue
+            col = self.pos_ingrediente.get(ing_id)
+            if col is None:
+                col = self.pos_ingrediente[ing_id] = len(self.ingredientes_ids)
+                self.ingredientes_ids.append(ing_id)
+            filas_idx.append(fila)
+            cols_idx.append(col)
+            gramos.append(g)
+
+        self.filas = np.array(filas_idx, dtype=np.int64)
+        self.cols = np.array(cols_idx, dtype=np.int64)
+        self.gramos = np.array(gramos, dtype=np.float64)
+
+    def _sumar_por_receta(self, contribuciones):
+        """Suma (nnz × k) -> (recetas × k) agrupando por fila (producto disperso)."""
+        n = len(self.recetas_ids)
+        return np.column_stack([
+            np.bincount(self.filas, weights=contribuciones[:, j], minlength=n)
+            for j in range(contribuciones.shape[1])
+        ]) if contribuciones.shape[1] else np.zeros((n, 0))
+
+    def costes(self, supers_ids, precios):
+        """
+        precios: {(ingrediente_base_id, supermercado_id): precio_por_kg} (con
+        2 decimales, como la columna). Devuelve (costes[recetas × supers],
+        posibles[recetas × supers]) con los costes en cienmilésimas de euro
+        (céntimos/kg × gramos): enteros exactos, para redondearlos igual que
+        el camino en Decimal. float64 es exacto con enteros hasta 2**53.
+        """
+        centimos_kg = np.full((len(self.ingredientes_ids), len(supers_ids)), np.nan)
+        pos_super = {sid: j for j, sid in enumerate(supers_ids)}
+        for (ing_id, super_id), precio_kg in precios.items():
+            i, j = self.pos_ingrediente.get(ing_id), pos_super.get(super_id)
+            if i is not None and j is not None:
+                centimos_kg[i, j] = round(precio_kg * 100)
+
+        contrib = self.gramos[:, None] * centimos_kg[self.cols]
+        faltan = np.isnan(contrib)
+        costes = self._sumar_por_receta(np.where(faltan, 0.0, contrib))
+        posibles = self._sumar_por_receta(faltan.astype(np.float64)) == 0
+        return np.rint(costes).astype(np.int64), posibles
+
+    def macros(self, nutrientes):
+        """
+        nutrientes: {ingrediente_base_id: (kcal, prot, grasas, hidratos) por 100g}.
+        Devuelve una matriz recetas × 4 con los totales de cada receta.
+        """
+        por_gramo = np.zeros((len(self.ingredientes_ids), 4))
+        for ing_id, valores in nutrientes.items():
+            i = self.pos_ingrediente.get(ing_id)
+            if i is not None:
+                por_gramo[i] = [float(v) / 100 for v in valores]
+
+        return self._sumar_por_receta(self.gramos[:, None] * por_gramo[self.cols])
@@ -0,0 +1,95 @@
+import heapq
+import json
+import logging
+import time
+from contextlib import ExitStack
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('qome.peticiones')
+
+
+# --- REGISTRO DE CONSULTAS (execute_wrapper) ---
+class RegistroConsultas:
+    """
+    Envuelve cada consulta de la petición en curso: cuenta, suma el tiempo y
+    guarda (duración, sql) para sacar las más lentas. Los parámetros no se
+    guardan (pueden llevar datos del usuario).
+    """
+    def __init__(self):
+        self.consultas = []
+        self.tiempo = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        t0 = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duracion = time.perf_counter() - t0
+            self.tiempo += duracion
+            self.consultas.append((duracion, sql))
+
+    def mas_lentas(self, n):
+        return heapq.nlargest(n, self.consultas, key=lambda c: c[0])
+
+
+# --- MIDDLEWARE DE INSTRUMENTACIÓN ---
+class InstrumentacionPeticiones:
+    """
+    Por petición: tiempo total, número de consultas SQL, tiempo en BD y las
+    N más lentas. Lo devuelve en la cabecera Server-Timing y en una línea de
+    log JSON (logger 'qome.peticiones'); si la petición pasa del umbral, el
+    log es un WARNING con la lista completa de consultas.
+    Sólo se instrumentan las vistas de QOME_INSTRUMENTAR_VISTAS (None = todas).
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.vistas = getattr(settings, 'QOME_INSTRUMENTAR_VISTAS', None)
+        self.umbral_ms = getattr(settings, 'QOME_PETICION_LENTA_MS', 500)
+        self.n_lentas = getattr(settings, 'QOME_CONSULTAS_MAS_LENTAS', 3)
+
+    def __call__(self, request):
+        inicio = time.perf_counter()
+        request.registro_consultas = None
+        with ExitStack() as envolturas:
+            request.envolturas_sql = envolturas
+            response = self.get_response(request)
+        registro = request.registro_consultas
+        if registro is None: return response
+
+        total_ms = (time.perf_counter() - inicio) * 1000
+        bd_ms = registro.tiempo * 1000
+        response['Server-Timing'] = (
+            f'total;dur={total_ms:.1f}, db;dur={bd_ms:.1f};desc="{len(registro.consultas)} consultas"'
+        )
+        self.registrar(request, response, registro, total_ms, bd_ms)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Aquí ya se sabe qué vista es; las consultas de sesión/usuario son perezosas y se cuentan
+        if self.vistas is not None and request.resolver_match.url_name not in self.vistas: return None
+        registro = RegistroConsultas()
+        for alias in connections:
+            request.envolturas_sql.enter_context(connections[alias].execute_wrapper(registro))
+        request.registro_consultas = registro
+        return None
+
+    def registrar(self, request, response, registro, total_ms, bd_ms):
+        lenta = total_ms >= self.umbral_ms
+        datos = {
+            'metodo': request.method,
+            'ruta': request.path,
+            'vista': request.resolver_match.url_name,
+            'estado': response.status_code,
+            'ms': round(total_ms, 1),
+            'consultas': len(registro.consultas),
+            'ms_bd': round(bd_ms, 1),
+            'mas_lentas': [
+                {'ms': round(d * 1000, 2), 'sql': sql[:300]} for d, sql in registro.mas_lentas(self.n_lentas)
+            ],
+        }
+        if lenta:
+            datos['todas'] = [{'ms': round(d * 1000, 2), 'sql': sql} for d, sql in registro.consultas]
+            logger.warning(json.dumps(datos, ensure_ascii=False))
+        elif logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps(datos, ensure_ascii=False))
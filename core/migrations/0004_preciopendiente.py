@@ -0,0 +1,26 @@
+# Generated by Django 6.0 on 2026-10-17 23:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_trabajoplan'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrecioPendiente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('marcado_en', models.DateTimeField(auto_now=True)),
+                ('ingrediente_base', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.ingredientebase')),
+                ('supermercado', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.supermercado')),
+            ],
+            options={
+                'unique_together': {('ingrediente_base', 'supermercado')},
+            },
+        ),
+    ]
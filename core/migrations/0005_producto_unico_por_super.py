@@ -0,0 +1,33 @@
+# Generated by Django 6.0 on 2026-10-17 23:40
+
+from django.db import migrations, models
+
+
+def eliminar_duplicados(apps, schema_editor):
+    """Antes de la restricción: un único producto por (supermercado, nombre), el más reciente."""
+    ProductoReal = apps.get_model('core', 'ProductoReal')
+    vistos = set()
+    duplicados = []
+    for pid, super_id, nombre in ProductoReal.objects.order_by('-ultima_actualizacion', '-id').values_list(
+        'id', 'supermercado_id', 'nombre_comercial'
+    ):
+        if (super_id, nombre) in vistos:
+            duplicados.append(pid)
+        else:
+            vistos.add((super_id, nombre))
+    ProductoReal.objects.filter(id__in=duplicados).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_preciopendiente'),
+    ]
+
+    operations = [
+        migrations.RunPython(eliminar_duplicados, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='productoreal',
+            constraint=models.UniqueConstraint(fields=('supermercado', 'nombre_comercial'), name='producto_unico_por_super'),
+        ),
+    ]
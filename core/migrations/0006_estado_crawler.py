@@ -0,0 +1,58 @@
+# Generated by Django 6.0 on 2026-10-17 23:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_producto_unico_por_super'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EjecucionCrawler',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado', models.CharField(choices=[('EN_CURSO', 'En curso'), ('COMPLETADA', 'Completada'), ('ABANDONADA', 'Abandonada')], default='EN_CURSO', max_length=10)),
+                ('iniciada_en', models.DateTimeField(auto_now_add=True)),
+                ('terminada_en', models.DateTimeField(blank=True, null=True)),
+                ('supermercado', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ejecuciones_crawler', to='core.supermercado')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='EstadoCategoria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('categoria_id', models.CharField(max_length=50)),
+                ('hash_contenido', models.CharField(max_length=40)),
+                ('ultima_descarga', models.DateTimeField()),
+                ('ejecucion', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='core.ejecucioncrawler')),
+                ('supermercado', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.supermercado')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='EstadoProductoScrapeado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('producto_id', models.CharField(max_length=50)),
+                ('hash_contenido', models.CharField(max_length=40)),
+                ('ultima_vista', models.DateTimeField()),
+                ('ejecucion', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='core.ejecucioncrawler')),
+                ('supermercado', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.supermercado')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='ejecucioncrawler',
+            index=models.Index(fields=['supermercado', 'estado'], name='core_ejecuc_superme_d19178_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='estadocategoria',
+            unique_together={('supermercado', 'categoria_id')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='estadoproductoscrapeado',
+            unique_together={('supermercado', 'producto_id')},
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-17 23:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_estado_crawler'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productoreal',
+            name='ean',
+            field=models.CharField(blank=True, db_index=True, help_text='Código de barras (si la tienda lo da)', max_length=14, null=True),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 6.0 on 2026-10-17 23:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_productoreal_ean'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RespuestaOFF',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('consulta', models.CharField(max_length=200, unique=True)),
+                ('respuesta', models.JSONField(blank=True, null=True)),
+                ('guardada_en', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 6.0 on 2026-10-17 23:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_respuestaoff'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConjuntoSupermercados',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('firma', models.CharField(max_length=64, unique=True)),
+                ('supermercados', models.CharField(help_text='Ids ordenados, separados por comas', max_length=255)),
+                ('actualizado_en', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PrecioRecetaConjunto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('firma', models.CharField(max_length=64)),
+                ('coste', models.DecimalField(decimal_places=2, max_digits=6)),
+                ('receta', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='precios_conjunto', to='core.receta')),
+                ('supermercado', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.supermercado')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['firma', 'coste'], name='core_precio_firma_8c5353_idx')],
+                'unique_together': {('firma', 'receta')},
+            },
+        ),
+    ]
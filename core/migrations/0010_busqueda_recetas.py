@@ -0,0 +1,104 @@
+# Generated by Django 6.0 on 2026-10-17 23:23
+
+import django.db.models.deletion
+from collections import defaultdict
+from django.db import migrations, models, OperationalError
+
+FTS = 'core_busquedareceta_fts'
+DOCUMENTOS = 'core_documentobusquedareceta'
+
+# Tabla FTS5 de contenido externo + triggers que la sincronizan con los documentos
+SQL_FTS = [
+    f"""CREATE VIRTUAL TABLE {FTS} USING fts5(
+        titulo, ingredientes, content='{DOCUMENTOS}', content_rowid='receta_id',
+        tokenize='unicode61 remove_diacritics 0')""",
+    # El título pesa 10 veces más que los ingredientes
+    f"INSERT INTO {FTS}({FTS}, rank) VALUES ('rank', 'bm25(10.0, 1.0)')",
+    f"""CREATE TRIGGER {DOCUMENTOS}_ai AFTER INSERT ON {DOCUMENTOS} BEGIN
+        INSERT INTO {FTS}(rowid, titulo, ingredientes) VALUES (new.receta_id, new.titulo, new.ingredientes);
+    END""",
+    f"""CREATE TRIGGER {DOCUMENTOS}_ad AFTER DELETE ON {DOCUMENTOS} BEGIN
+        INSERT INTO {FTS}({FTS}, rowid, titulo, ingredientes) VALUES ('delete', old.receta_id, old.titulo, old.ingredientes);
+    END""",
+    f"""CREATE TRIGGER {DOCUMENTOS}_au AFTER UPDATE ON {DOCUMENTOS} BEGIN
+        INSERT INTO {FTS}({FTS}, rowid, titulo, ingredientes) VALUES ('delete', old.receta_id, old.titulo, old.ingredientes);
+        INSERT INTO {FTS}(rowid, titulo, ingredientes) VALUES (new.receta_id, new.titulo, new.ingredientes);
+    END""",
+]
+
+
+def crear_indice_fts(apps, schema_editor):
+    """Sólo en SQLite; si no trae FTS5 la búsqueda usa LIKE sobre los documentos."""
+    if schema_editor.connection.vendor != 'sqlite': return
+    try:
+        for sql in SQL_FTS:
+            schema_editor.execute(sql)
+    except OperationalError:
+        pass
+
+
+def borrar_indice_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite': return
+    for sufijo in ('ai', 'ad', 'au'):
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {DOCUMENTOS}_{sufijo}")
+    schema_editor.execute(f"DROP TABLE IF EXISTS {FTS}")
+
+
+def normalizar(texto):
+    # Copia congelada de core.clasificador.normalizar tal y como era al escribir esta migración
+    replacements = (("á", "a"), ("é", "e"), ("í", "i"), ("ó", "o"), ("ú", "u"))
+    texto = texto.lower()
+    for a, b in replacements:
+        texto = texto.replace(a, b)
+    return texto
+
+
+def poblar_documentos(apps, schema_editor):
+    """Documentos de las recetas existentes (los triggers llenan el índice)."""
+    Receta = apps.get_model('core', 'Receta')
+    RecetaIngrediente = apps.get_model('core', 'RecetaIngrediente')
+    DocumentoBusquedaReceta = apps.get_model('core', 'DocumentoBusquedaReceta')
+
+    def texto(valor):
+        return ' '.join(normalizar(valor or '').split())
+
+    nombres = defaultdict(list)
+    for receta_id, nombre in RecetaIngrediente.objects.order_by('id').values_list('receta_id', 'ingrediente_base__nombre'):
+        nombres[receta_id].append(texto(nombre))
+    DocumentoBusquedaReceta.objects.bulk_create([
+        DocumentoBusquedaReceta(receta_id=receta_id, titulo=texto(titulo), ingredientes=' '.join(nombres[receta_id]))
+        for receta_id, titulo in Receta.objects.values_list('id', 'titulo').iterator()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_precios_materializados'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndiceBusquedaReceta',
+            fields=[
+                ('receta', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='busqueda', serialize=False, to='core.receta')),
+                # core.models.CampoBusqueda sólo añade el lookup `coincide`; aquí basta el TextField
+                ('documento', models.TextField(db_column='core_busquedareceta_fts')),
+                ('rango', models.FloatField(db_column='rank')),
+            ],
+            options={
+                'db_table': 'core_busquedareceta_fts',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='DocumentoBusquedaReceta',
+            fields=[
+                ('receta', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='documento_busqueda', serialize=False, to='core.receta')),
+                ('titulo', models.TextField()),
+                ('ingredientes', models.TextField(blank=True)),
+            ],
+        ),
+        migrations.RunPython(crear_indice_fts, borrar_indice_fts),
+        migrations.RunPython(poblar_documentos, migrations.RunPython.noop),
+    ]
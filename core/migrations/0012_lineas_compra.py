@@ -0,0 +1,148 @@
+# Generated by Django 6.0 on 2026-10-17 23:31
+
+import django.db.models.deletion
+import json
+import re
+from collections import Counter
+from decimal import Decimal, InvalidOperation
+from django.db import migrations, models
+
+
+def peso_display(gramos):
+    # Copia congelada de LineaCompra.peso_display (el formato del snapshot)
+    if gramos >= 1000:
+        return f"{gramos/1000:.1f}kg".replace(".0kg", "kg")
+    return f"{gramos}g"
+
+
+def gramos_de(texto):
+    """'234g' -> 234, '1.5kg' -> 1500; None si no se entiende."""
+    encontrado = re.fullmatch(r'\s*(\d+(?:[.,]\d+)?)\s*(kg|g)\s*', texto or '')
+    if not encontrado: return None
+    valor = float(encontrado.group(1).replace(',', '.'))
+    return int(round(valor * 1000 if encontrado.group(2) == 'kg' else valor))
+
+
+def snapshot_a_lineas(apps, schema_editor):
+    """
+    Convierte el JSON de cada plan ({nombre: {super, unidades, precio_u, total,
+    imagen, peso_display}}) en LineaCompra + subtotales. El peso del envase sale
+    del peso_display del snapshot (el del producto actual sólo si coincide con
+    él, por ser más preciso). Si el supermercado ya no existe la línea se
+    guarda igual, con su nombre y sin FK. Lo que no se puede convertir (JSON
+    o importes ilegibles) se omite y se informa.
+    """
+    PlanSemanal = apps.get_model('core', 'PlanSemanal')
+    LineaCompra = apps.get_model('core', 'LineaCompra')
+    Supermercado = apps.get_model('core', 'Supermercado')
+    ProductoReal = apps.get_model('core', 'ProductoReal')
+
+    supers = dict(Supermercado.objects.values_list('nombre', 'id'))
+    productos = {
+        (super_id, nombre): (pid, peso)
+        for pid, super_id, nombre, peso in ProductoReal.objects.values_list(
+            'id', 'supermercado_id', 'nombre_comercial', 'peso_gramos'
+        )
+    }
+
+    lineas, planes = [], []
+    omitidas = Counter()
+    sin_supermercado = Counter()
+    for plan in PlanSemanal.objects.exclude(lista_compra_snapshot__isnull=True).exclude(lista_compra_snapshot='').iterator():
+        try:
+            cesta = json.loads(plan.lista_compra_snapshot)
+        except ValueError:
+            omitidas[f"plan {plan.id}: JSON ilegible"] += 1
+            continue
+        subtotales = {}
+        for nombre, datos in cesta.items():
+            super_nombre = datos.get('super') or ''
+            super_id = supers.get(super_nombre)
+            if super_id is None:
+                sin_supermercado[super_nombre] += 1
+            try:
+                precio = Decimal(str(datos.get('precio_u', 0))).quantize(Decimal('0.01'))
+                total = Decimal(str(datos.get('total', 0))).quantize(Decimal('0.01'))
+            except InvalidOperation:
+                omitidas["importe ilegible"] += 1
+                continue
+            producto_id, peso_actual = productos.get((super_id, nombre), (None, 0))
+            peso = gramos_de(datos.get('peso_display'))
+            if peso is None or (peso_actual and peso_display(peso_actual) == datos.get('peso_display')):
+                peso = peso_actual
+            lineas.append(LineaCompra(
+                plan_id=plan.id, producto_id=producto_id, supermercado_id=super_id,
+                supermercado_nombre=super_nombre, nombre=nombre,
+                unidades=int(datos.get('unidades', 0)), precio_unitario=precio, total=total,
+                peso_gramos=peso, imagen_url=datos.get('imagen')
+            ))
+            subtotales[super_nombre] = subtotales.get(super_nombre, 0) + total
+        plan.subtotales_compra = {n: float(round(t, 2)) for n, t in subtotales.items()}
+        planes.append(plan)
+
+    LineaCompra.objects.bulk_create(lineas, batch_size=500)
+    PlanSemanal.objects.bulk_update(planes, ['subtotales_compra'], batch_size=500)
+    if sin_supermercado:
+        print(f"\n   ℹ️ {sum(sin_supermercado.values())} línea(s) de supermercados que ya no existen (se guardan con su nombre):")
+        for super_nombre, n in sin_supermercado.most_common():
+            print(f"      · '{super_nombre}': {n}")
+    if omitidas:
+        print(f"\n   ⚠️ {sum(omitidas.values())} línea(s) de la compra sin convertir:")
+        for motivo, n in omitidas.most_common():
+            print(f"      · {motivo}: {n}")
+
+
+def lineas_a_snapshot(apps, schema_editor):
+    PlanSemanal = apps.get_model('core', 'PlanSemanal')
+    LineaCompra = apps.get_model('core', 'LineaCompra')
+
+    cestas = {}
+    for linea in LineaCompra.objects.order_by('id').iterator():
+        cestas.setdefault(linea.plan_id, {})[linea.nombre] = {
+            'super': linea.supermercado_nombre,
+            'unidades': linea.unidades,
+            'precio_u': float(linea.precio_unitario),
+            'total': float(linea.total),
+            'imagen': linea.imagen_url,
+            'peso_display': peso_display(linea.peso_gramos),
+        }
+    planes = list(PlanSemanal.objects.filter(id__in=cestas))
+    for plan in planes:
+        plan.lista_compra_snapshot = json.dumps(cestas[plan.id])
+    PlanSemanal.objects.bulk_update(planes, ['lista_compra_snapshot'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_versioncache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plansemanal',
+            name='subtotales_compra',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.CreateModel(
+            name='LineaCompra',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('supermercado_nombre', models.CharField(max_length=50)),
+                ('nombre', models.CharField(max_length=200)),
+                ('unidades', models.IntegerField()),
+                ('precio_unitario', models.DecimalField(decimal_places=2, max_digits=6)),
+                ('total', models.DecimalField(decimal_places=2, max_digits=8)),
+                ('peso_gramos', models.IntegerField(default=0)),
+                ('imagen_url', models.URLField(blank=True, max_length=500, null=True)),
+                ('plan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lineas_compra', to='core.plansemanal')),
+                ('producto', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='lineas_compra', to='core.productoreal')),
+                ('supermercado', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='core.supermercado')),
+            ],
+        ),
+        migrations.RunPython(snapshot_a_lineas, lineas_a_snapshot),
+        migrations.RemoveField(
+            model_name='plansemanal',
+            name='lista_compra_snapshot',
+        ),
+    ]
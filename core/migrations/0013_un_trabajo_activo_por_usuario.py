@@ -0,0 +1,34 @@
+# Generated by Django 6.0 on 2026-10-17 23:44
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def cerrar_duplicados(apps, schema_editor):
+    """Antes de la restricción: un único trabajo vivo por usuario, el más reciente."""
+    TrabajoPlan = apps.get_model('core', 'TrabajoPlan')
+    vistos = set()
+    duplicados = []
+    for tid, usuario_id in TrabajoPlan.objects.filter(estado__in=['PENDIENTE', 'EN_CURSO']).order_by(
+        '-creado_en', '-id'
+    ).values_list('id', 'usuario_id'):
+        if usuario_id in vistos:
+            duplicados.append(tid)
+        else:
+            vistos.add(usuario_id)
+    TrabajoPlan.objects.filter(id__in=duplicados).update(estado='ERROR', mensaje="Trabajo duplicado descartado")
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_lineas_compra'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(cerrar_duplicados, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='trabajoplan',
+            constraint=models.UniqueConstraint(condition=models.Q(('estado__in', ['PENDIENTE', 'EN_CURSO'])), fields=('usuario',), name='un_trabajo_activo_por_usuario'),
+        ),
+    ]
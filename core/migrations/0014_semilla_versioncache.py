@@ -0,0 +1,19 @@
+# Generated by Django 6.0 on 2026-10-17 23:51
+
+import time
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_un_trabajo_activo_por_usuario'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='versioncache',
+            name='valor',
+            field=models.BigIntegerField(default=time.time_ns),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-18 00:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_semilla_versioncache'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='trabajoplan',
+            name='un_trabajo_activo_por_usuario',
+        ),
+        migrations.AddConstraint(
+            model_name='trabajoplan',
+            constraint=models.UniqueConstraint(condition=models.Q(('estado', 'PENDIENTE')), fields=('usuario',), name='un_trabajo_pendiente_por_usuario'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 6.0 on 2026-10-18 00:40
+
+import hashlib
+from django.db import migrations
+
+
+# Copias congeladas de ConjuntoSupermercados.firma_de: la nueva y la anterior
+def firma_sha1(ids):
+    return hashlib.sha1(','.join(str(i) for i in sorted(ids)).encode()).hexdigest()
+
+
+def firma_mascara(ids):
+    mascara = 0
+    for super_id in ids:
+        mascara |= 1 << super_id
+    return format(mascara, 'x')
+
+
+def refirmar(firmar):
+    def migrar(apps, schema_editor):
+        """Reescribe la firma de cada conjunto y de sus precios materializados."""
+        ConjuntoSupermercados = apps.get_model('core', 'ConjuntoSupermercados')
+        PrecioRecetaConjunto = apps.get_model('core', 'PrecioRecetaConjunto')
+        for conjunto in ConjuntoSupermercados.objects.all():
+            ids = {int(i) for i in conjunto.supermercados.split(',') if i}
+            nueva = firmar(ids)
+            if nueva == conjunto.firma: continue
+            PrecioRecetaConjunto.objects.filter(firma=conjunto.firma).update(firma=nueva)
+            conjunto.firma = nueva
+            conjunto.save(update_fields=['firma'])
+    return migrar
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_un_trabajo_pendiente_por_usuario'),
+    ]
+
+    operations = [
+        migrations.RunPython(refirmar(firma_sha1), refirmar(firma_mascara)),
+    ]
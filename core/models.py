@@ -1,7 +1,9 @@
+import hashlib
+import time
 from decimal import Decimal
 from django.db import models
 from django.contrib.auth.models import User
-from django.db.models import Min
+from .cache import CATALOGO, subir_version, version_usuario
 
 # --- 1. MODELO SUPERMERCADO ---
 class Supermercado(models.Model):
@@ -80,6 +82,7 @@ class PerfilUsuario(models.Model):
         self.objetivo_grasas = gras
         self.objetivo_hidratos = hidr
         super().save(*args, **kwargs)
+        subir_version(version_usuario(self.usuario_id))
 
     def __str__(self):
         return f"Perfil de {self.usuario.username}"
@@ -100,6 +103,30 @@ class IngredienteBase(models.Model):
     hidratos = models.FloatField(default=0.0)
     dias_caducidad = models.IntegerField(default=7)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._nombre_cargado = instance.__dict__.get('nombre')
+        return instance
+
+    def save(self, *args, **kwargs):
+        anterior = getattr(self, '_nombre_cargado', None)
+        super().save(*args, **kwargs)
+        # El nombre forma parte del texto de búsqueda de las recetas que lo usan
+        if anterior is not None and anterior != self.nombre:
+            from .busqueda import indexar_recetas
+            indexar_recetas(RecetaIngrediente.objects.filter(ingrediente_base=self).values_list('receta_id', flat=True))
+            subir_version(CATALOGO)
+        self._nombre_cargado = self.nombre
+
+    def delete(self, *args, **kwargs):
+        from .busqueda import indexar_recetas
+        receta_ids = list(RecetaIngrediente.objects.filter(ingrediente_base=self).values_list('receta_id', flat=True))
+        resultado = super().delete(*args, **kwargs)
+        indexar_recetas(receta_ids)
+        subir_version(CATALOGO)
+        return resultado
+
     def __str__(self):
         return self.nombre
 
@@ -109,6 +136,7 @@ class ProductoReal(models.Model):
     supermercado = models.ForeignKey(Supermercado, on_delete=models.CASCADE)
     
     nombre_comercial = models.CharField(max_length=200)
+    ean = models.CharField(max_length=14, blank=True, null=True, db_index=True, help_text="Código de barras (si la tienda lo da)")
     precio_actual = models.DecimalField(max_digits=6, decimal_places=2)
     
     # Datos Físicos
@@ -128,11 +156,48 @@ class ProductoReal(models.Model):
     imagen_url = models.URLField(max_length=500, blank=True, null=True)
     ultima_actualizacion = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['supermercado', 'nombre_comercial'], name='producto_unico_por_super')
+        ]
+
+    @staticmethod
+    def calcular_precio_por_kg(precio_actual, peso_gramos):
+        """Precio normalizado €/kg (lo usan save() y la ingesta en bloque)."""
+        if peso_gramos > 0 and precio_actual > 0:
+            return ((precio_actual / Decimal(peso_gramos)) * 1000).quantize(Decimal('0.01'))
+        return None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Foto del precio cargado para detectar cambios al guardar
+        instance._precio_cargado = (
+            instance.__dict__.get('ingrediente_base_id'),
+            instance.__dict__.get('supermercado_id'),
+            instance.__dict__.get('precio_por_kg'),
+        )
+        return instance
+
     def save(self, *args, **kwargs):
-        if self.peso_gramos > 0 and self.precio_actual > 0:
-            self.precio_por_kg = (self.precio_actual / Decimal(self.peso_gramos)) * 1000
+        precio_por_kg = self.calcular_precio_por_kg(self.precio_actual, self.peso_gramos)
+        if precio_por_kg is not None:
+            self.precio_por_kg = precio_por_kg
         super().save(*args, **kwargs)
 
+        # Dirty tracking: anotamos los pares (ingrediente, súper) cuyo precio cambió
+        anterior = getattr(self, '_precio_cargado', None)
+        actual = (self.ingrediente_base_id, self.supermercado_id, self.precio_por_kg)
+        if anterior != actual:
+            pares = {actual[:2]}
+            if anterior and anterior[0] and anterior[1]: pares.add(anterior[:2])
+            PrecioPendiente.marcar(pares)
+            self._precio_cargado = actual
+
+    def delete(self, *args, **kwargs):
+        PrecioPendiente.marcar([(self.ingrediente_base_id, self.supermercado_id)])
+        return super().delete(*args, **kwargs)
+
     def __str__(self):
         return f"{self.nombre_comercial} ({self.supermercado.nombre}) - {self.precio_actual}€"
 
@@ -153,27 +218,30 @@ class Receta(models.Model):
     grasas = models.FloatField(default=0.0)
     hidratos = models.FloatField(default=0.0)
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Import local: busqueda importa models
+        from .busqueda import indexar_recetas
+        indexar_recetas([self.id])
+        subir_version(CATALOGO)
+
+    def delete(self, *args, **kwargs):
+        resultado = super().delete(*args, **kwargs)
+        subir_version(CATALOGO)
+        return resultado
+
     def obtener_precio_para_usuario(self, perfil_usuario):
-        mis_supers = perfil_usuario.supermercados_seleccionados.all()
-        if not mis_supers.exists(): return None
-        costes = self.costes_por_supermercado.filter(supermercado__in=mis_supers)
-        if costes.exists(): return costes.aggregate(Min('coste'))['coste__min']
-        return None
+        # Mismo camino de sólo lectura que el catálogo (import local: precios importa models)
+        from .precios import anotar_precio_conjunto
+        mis_supers = list(perfil_usuario.supermercados_seleccionados.values_list('id', flat=True))
+        if not mis_supers: return None
+        recetas = anotar_precio_conjunto(Receta.objects.filter(id=self.id), mis_supers, 'precio_usuario')
+        return recetas.values_list('precio_usuario', flat=True).first()
 
     def recalcular_macros(self):
-        c, p, g, h = 0, 0, 0, 0
-        for item in self.ingredientes.all():
-            gramos = item.cantidad_gramos
-            base = item.ingrediente_base
-            c += (base.calorias / 100) * gramos
-            p += (base.proteinas / 100) * gramos
-            g += (base.grasas / 100) * gramos
-            h += (base.hidratos / 100) * gramos
-        self.calorias = int(c)
-        self.proteinas = round(p, 1)
-        self.grasas = round(g, 1)
-        self.hidratos = round(h, 1)
-        self.save()
+        # Mismo camino que el recálculo en bloque (import local: nutricion importa models)
+        from .nutricion import actualizar_macros
+        actualizar_macros([self])
 
     def __str__(self):
         return self.titulo
@@ -195,6 +263,19 @@ class RecetaIngrediente(models.Model):
     ingrediente_base = models.ForeignKey(IngredienteBase, on_delete=models.CASCADE)
     cantidad_gramos = models.IntegerField()
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        from .busqueda import indexar_recetas
+        indexar_recetas([self.receta_id])
+        subir_version(CATALOGO)
+
+    def delete(self, *args, **kwargs):
+        from .busqueda import indexar_recetas
+        resultado = super().delete(*args, **kwargs)
+        indexar_recetas([self.receta_id])
+        subir_version(CATALOGO)
+        return resultado
+
     def __str__(self):
         return f"{self.ingrediente_base.nombre} ({self.cantidad_gramos}g)"
 
@@ -203,11 +284,238 @@ class PlanSemanal(models.Model):
     usuario = models.ForeignKey(User, on_delete=models.CASCADE)
     fecha_inicio = models.DateField()
     creado_en = models.DateTimeField(auto_now_add=True)
-    lista_compra_snapshot = models.TextField(blank=True, null=True) 
     coste_total_estimado = models.DecimalField(max_digits=8, decimal_places=2, default=0)
+    # {nombre del súper: total}, calculado al guardar las líneas de compra
+    subtotales_compra = models.JSONField(default=dict, blank=True)
 
 class ComidaPlanificada(models.Model):
     plan = models.ForeignKey(PlanSemanal, related_name='comidas', on_delete=models.CASCADE)
     receta = models.ForeignKey(Receta, on_delete=models.CASCADE)
     dia_semana = models.IntegerField(choices=[(i, str(i)) for i in range(7)])
-    momento = models.CharField(max_length=10, choices=[('COMIDA','Comida'), ('CENA','Cena')])
\ No newline at end of file
+    momento = models.CharField(max_length=10, choices=[('COMIDA','Comida'), ('CENA','Cena')])
+
+class LineaCompra(models.Model):
+    # Foto de la compra al generar el plan: el producto puede cambiar o desaparecer después
+    plan = models.ForeignKey(PlanSemanal, related_name='lineas_compra', on_delete=models.CASCADE)
+    producto = models.ForeignKey(ProductoReal, related_name='lineas_compra', null=True, on_delete=models.SET_NULL)
+    supermercado = models.ForeignKey(Supermercado, null=True, on_delete=models.SET_NULL)
+    # Nombre del súper al generar el plan: agrupa la lista y es la clave de subtotales_compra
+    supermercado_nombre = models.CharField(max_length=50)
+    nombre = models.CharField(max_length=200)
+    unidades = models.IntegerField()
+    precio_unitario = models.DecimalField(max_digits=6, decimal_places=2)
+    total = models.DecimalField(max_digits=8, decimal_places=2)
+    peso_gramos = models.IntegerField(default=0)
+    imagen_url = models.URLField(max_length=500, blank=True, null=True)
+
+    @property
+    def peso_display(self):
+        if self.peso_gramos >= 1000:
+            return f"{self.peso_gramos/1000:.1f}kg".replace(".0kg", "kg")
+        return f"{self.peso_gramos}g"
+
+    @classmethod
+    def demanda(cls, desde):
+        """Unidades e importe por producto en los planes que empiezan desde `desde` (p. ej. esta semana)."""
+        return cls.objects.filter(plan__fecha_inicio__gte=desde, producto__isnull=False).values(
+            'producto_id', 'producto__nombre_comercial', 'supermercado_id'
+        ).annotate(unidades_totales=models.Sum('unidades'), importe=models.Sum('total')).order_by('-unidades_totales')
+
+    def __str__(self):
+        return f"{self.unidades}x {self.nombre}"
+
+# --- 9. TRABAJOS DE GENERACIÓN DE PLAN (Cola en BD) ---
+class TrabajoPlan(models.Model):
+    ESTADOS = [
+        ('PENDIENTE', 'Pendiente'),
+        ('EN_CURSO', 'En curso'),
+        ('HECHO', 'Hecho'),
+        ('ERROR', 'Error'),
+    ]
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='trabajos_plan')
+    estado = models.CharField(max_length=10, choices=ESTADOS, default='PENDIENTE')
+    mensaje = models.CharField(max_length=255, blank=True, default='')
+    creado_en = models.DateTimeField(auto_now_add=True)
+    iniciado_en = models.DateTimeField(null=True, blank=True)
+    terminado_en = models.DateTimeField(null=True, blank=True)
+
+    ACTIVOS = ['PENDIENTE', 'EN_CURSO']
+
+    class Meta:
+        indexes = [models.Index(fields=['usuario', 'estado'])]
+        constraints = [
+            # Como mucho un trabajo pendiente por usuario (lo garantiza la BD, no el código).
+            # Puede haber además uno en curso: leyó el perfil antes del último cambio
+            models.UniqueConstraint(
+                fields=['usuario'], condition=models.Q(estado='PENDIENTE'),
+                name='un_trabajo_pendiente_por_usuario'
+            )
+        ]
+
+    def __str__(self):
+        return f"Plan de {self.usuario.username} [{self.estado}]"
+
+# --- 10. PRECIOS PENDIENTES DE REINDEXAR (Dirty tracking) ---
+class PrecioPendiente(models.Model):
+    ingrediente_base = models.ForeignKey(IngredienteBase, on_delete=models.CASCADE)
+    supermercado = models.ForeignKey(Supermercado, on_delete=models.CASCADE)
+    marcado_en = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('ingrediente_base', 'supermercado')
+
+    @classmethod
+    def marcar(cls, pares):
+        """Registra (o refresca) pares (ingrediente_base_id, supermercado_id) a reindexar."""
+        cls.objects.bulk_create(
+            [cls(ingrediente_base_id=ing, supermercado_id=sup) for ing, sup in pares],
+            update_conflicts=True,
+            unique_fields=['ingrediente_base', 'supermercado'],
+            update_fields=['marcado_en'],
+            batch_size=500
+        )
+
+    def __str__(self):
+        return f"{self.ingrediente_base_id} @ {self.supermercado_id}"
+
+# --- 11. ESTADO DEL CRAWLER (Checkpoints y hashes de contenido) ---
+class EjecucionCrawler(models.Model):
+    ESTADOS = [
+        ('EN_CURSO', 'En curso'),
+        ('COMPLETADA', 'Completada'),
+        ('ABANDONADA', 'Abandonada'),
+    ]
+    supermercado = models.ForeignKey(Supermercado, on_delete=models.CASCADE, related_name='ejecuciones_crawler')
+    estado = models.CharField(max_length=10, choices=ESTADOS, default='EN_CURSO')
+    iniciada_en = models.DateTimeField(auto_now_add=True)
+    terminada_en = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['supermercado', 'estado'])]
+
+    def __str__(self):
+        return f"Crawler {self.supermercado.nombre} #{self.id} [{self.estado}]"
+
+class EstadoCategoria(models.Model):
+    supermercado = models.ForeignKey(Supermercado, on_delete=models.CASCADE)
+    categoria_id = models.CharField(max_length=50)
+    hash_contenido = models.CharField(max_length=40)
+    ultima_descarga = models.DateTimeField()
+    # Última ejecución que la procesó entera (checkpoint para reanudar)
+    ejecucion = models.ForeignKey(EjecucionCrawler, on_delete=models.SET_NULL, null=True, blank=True)
+
+    class Meta:
+        unique_together = ('supermercado', 'categoria_id')
+
+    def __str__(self):
+        return f"Categoría {self.categoria_id} @ {self.supermercado_id}"
+
+class EstadoProductoScrapeado(models.Model):
+    supermercado = models.ForeignKey(Supermercado, on_delete=models.CASCADE)
+    producto_id = models.CharField(max_length=50)
+    hash_contenido = models.CharField(max_length=40)
+    ultima_vista = models.DateTimeField()
+    ejecucion = models.ForeignKey(EjecucionCrawler, on_delete=models.SET_NULL, null=True, blank=True)
+
+    class Meta:
+        unique_together = ('supermercado', 'producto_id')
+
+    def __str__(self):
+        return f"Producto {self.producto_id} @ {self.supermercado_id}"
+
+# --- 12. CACHÉ DE RESPUESTAS DE OPEN FOOD FACTS ---
+class RespuestaOFF(models.Model):
+    # Consulta normalizada (minúsculas, sin tildes, espacios colapsados)
+    consulta = models.CharField(max_length=200, unique=True)
+    # Macros extraídas; null = OFF no encontró nada (también se cachea)
+    respuesta = models.JSONField(null=True, blank=True)
+    guardada_en = models.DateTimeField()
+
+    def __str__(self):
+        return self.consulta
+
+# --- 13. PRECIOS MATERIALIZADOS POR CONJUNTO DE SUPERMERCADOS ---
+class ConjuntoSupermercados(models.Model):
+    """Combinaciones de supermercados que usan los usuarios (pocas y repetidas)."""
+    firma = models.CharField(max_length=64, unique=True)
+    supermercados = models.CharField(max_length=255, help_text="Ids ordenados, separados por comas")
+    actualizado_en = models.DateTimeField(auto_now=True)
+
+    @staticmethod
+    def lista_de(supers_ids):
+        """'1,3,7': los ids sin repetir y ordenados (lo que se guarda en `supermercados`)."""
+        return ','.join(str(i) for i in sorted(set(supers_ids)))
+
+    @staticmethod
+    def firma_de(supers_ids):
+        """SHA-1 de la lista ordenada: mismo conjunto, misma firma, y 40 caracteres sean cuales sean los ids."""
+        return hashlib.sha1(ConjuntoSupermercados.lista_de(supers_ids).encode()).hexdigest()
+
+    def ids(self):
+        return {int(i) for i in self.supermercados.split(',') if i}
+
+    def __str__(self):
+        return f"[{self.supermercados}]"
+
+class PrecioRecetaConjunto(models.Model):
+    # Coste mínimo POSIBLE de la receta dentro del conjunto y el súper que lo da
+    firma = models.CharField(max_length=64)
+    receta = models.ForeignKey(Receta, related_name='precios_conjunto', on_delete=models.CASCADE)
+    supermercado = models.ForeignKey(Supermercado, on_delete=models.CASCADE)
+    coste = models.DecimalField(max_digits=6, decimal_places=2)
+
+    class Meta:
+        unique_together = ('firma', 'receta')
+        indexes = [models.Index(fields=['firma', 'coste'])]
+
+    def __str__(self):
+        return f"{self.receta_id} @ {self.firma}: {self.coste}€"
+
+# --- 14. BÚSQUEDA DE RECETAS (Texto completo) ---
+class DocumentoBusquedaReceta(models.Model):
+    # Texto ya pasado por `normalizar`; lo mantiene core.busqueda y lo indexa la tabla FTS5
+    receta = models.OneToOneField(Receta, primary_key=True, related_name='documento_busqueda', on_delete=models.CASCADE)
+    titulo = models.TextField()
+    ingredientes = models.TextField(blank=True)
+
+    def __str__(self):
+        return self.titulo
+
+class CampoBusqueda(models.TextField):
+    """Columna oculta de una tabla FTS5 (la que se llama como la tabla). Admite `__coincide` (MATCH)."""
+
+@CampoBusqueda.register_lookup
+class Coincide(models.Lookup):
+    lookup_name = 'coincide'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f"{lhs} MATCH {rhs}", [*lhs_params, *rhs_params]
+
+class IndiceBusquedaReceta(models.Model):
+    """
+    Tabla virtual FTS5 con contenido externo (DocumentoBusquedaReceta), sincronizada
+    por triggers. Sólo existe en SQLite con FTS5: la crea la migración, no Django.
+    """
+    receta = models.OneToOneField(
+        Receta, primary_key=True, db_column='rowid', related_name='busqueda',
+        on_delete=models.DO_NOTHING, db_constraint=False
+    )
+    documento = CampoBusqueda(db_column='core_busquedareceta_fts')
+    # bm25 con el título pesando más que los ingredientes (más negativo = mejor)
+    rango = models.FloatField(db_column='rank')
+
+    class Meta:
+        managed = False
+        db_table = 'core_busquedareceta_fts'
+
+# --- 15. VERSIONES DE LA CACHÉ ---
+class VersionCache(models.Model):
+    # Sube cuando cambia lo que hay detrás (catálogo, datos de un usuario); ver core/cache.py
+    clave = models.CharField(max_length=100, unique=True)
+    # Semilla del reloj (ns), no 0: una versión nunca se repite entre BDs o restauraciones
+    valor = models.BigIntegerField(default=time.time_ns)
+
+    def __str__(self):
+        return f"{self.clave} = {self.valor}"
@@ -0,0 +1,225 @@
+import random
+from decimal import Decimal
+from itertools import islice
+from datetime import date
+from django.db import transaction
+from .models import Receta, PlanSemanal, Supermercado, ComidaPlanificada, LineaCompra
+from .precios import mapa_productos_mas_baratos, anotar_precio_conjunto, registrar_conjuntos
+from .cache import subir_versiones, version_usuario
+
+# --- CATÁLOGO DE CANDIDATAS (Una sola consulta por plan) ---
+def cargar_candidatas(mis_supers, orden_prioridad):
+    """
+    Carga de una vez las recetas posibles en mis supermercados con su coste
+    mínimo (materializado, o agregado si el conjunto no está registrado) y
+    sus ingredientes ya precargados, ordenadas según la estrategia.
+    """
+    recetas = list(
+        anotar_precio_conjunto(Receta.objects.all(), mis_supers, 'precio_minimo_mio').filter(
+            precio_minimo_mio__isnull=False
+        ).prefetch_related('ingredientes__ingrediente_base')
+    )
+    return ordenar_candidatas(recetas, orden_prioridad)
+
+def ordenar_candidatas(recetas, orden_prioridad):
+    # Orden estable: primero el desempate por precio, luego la prioridad
+    recetas = sorted(recetas, key=lambda r: r.precio_minimo_mio)
+    campo = orden_prioridad.lstrip('-')
+    if campo != 'precio_minimo_mio':
+        recetas.sort(key=lambda r: getattr(r, campo), reverse=orden_prioridad.startswith('-'))
+    return recetas
+
+class CatalogoPlanes:
+    """
+    Caché en memoria de candidatas y productos más baratos por combinación de
+    supermercados. Una petición web usa uno nuevo; un proceso de regeneración
+    masiva lo mantiene "caliente" entre miles de usuarios.
+    """
+    def __init__(self):
+        self.todos_supers = None
+        self.recetas = {}
+        self.ordenadas = {}
+        self.productos = {}
+
+    def supers_de(self, perfil):
+        ids = sorted(s.id for s in perfil.supermercados_seleccionados.all())
+        if not ids:
+            if self.todos_supers is None:
+                self.todos_supers = sorted(Supermercado.objects.values_list('id', flat=True))
+            ids = self.todos_supers
+        return tuple(ids)
+
+    def candidatas(self, supers_ids, orden_prioridad):
+        clave = (supers_ids, orden_prioridad)
+        if clave not in self.ordenadas:
+            if supers_ids not in self.recetas:
+                self.recetas[supers_ids] = cargar_candidatas(supers_ids, 'precio_minimo_mio')
+            self.ordenadas[clave] = ordenar_candidatas(self.recetas[supers_ids], orden_prioridad)
+        return self.ordenadas[clave]
+
+    def productos_baratos(self, supers_ids):
+        if supers_ids not in self.productos:
+            self.productos[supers_ids] = mapa_productos_mas_baratos(supers_ids, ingredientes={
+                item.ingrediente_base_id
+                for r in self.candidatas(supers_ids, 'precio_minimo_mio')
+                for item in r.ingredientes.all()
+            })
+        return self.productos[supers_ids]
+
+def estrategia_nutricional(perfil):
+    orden_prioridad = 'precio_minimo_mio'
+    if perfil.gasto_energetico_diario > 2500:
+        orden_prioridad = '-calorias'
+    elif perfil.gasto_energetico_diario < 1800:
+        orden_prioridad = 'calorias'
+    return orden_prioridad
+
+# --- MOTOR TETRIS V9 (Con Pesos y Macros) ---
+def generar_plan_motor(user):
+    try:
+        perfil = user.perfil
+    except:
+        return False, "Usuario sin perfil configurado."
+
+    catalogo = CatalogoPlanes()
+    # Es un trabajo en segundo plano: aquí sí se registra y materializa su conjunto
+    registrar_conjuntos([catalogo.supers_de(perfil)])
+    datos = construir_plan(perfil, catalogo)
+    guardar_planes([datos])
+
+    return True, "Plan generado correctamente."
+
+def construir_plan(perfil, catalogo):
+    """
+    Calcula la semana completamente en memoria (sin escrituras) y devuelve
+    el dict que consume guardar_planes: usuario_id, comidas [(receta_id,
+    dia, momento)], cesta ({producto_id (int): línea con importes Decimal})
+    y coste (float). No es JSON: se pasa tal cual entre procesos (pickle).
+    """
+    # 1. Supermercados
+    supers_ids = catalogo.supers_de(perfil)
+
+    # 2. Estrategia Nutricional
+    candidatas = catalogo.candidatas(supers_ids, estrategia_nutricional(perfil))
+    productos_baratos = catalogo.productos_baratos(supers_ids)
+
+    # 3. La semana se construye en memoria; no se toca la BD hasta el final
+    comidas = []
+    despensa = {}
+    cesta_compra_real = {}
+    memoria_reciente = []
+    coste_total_plan = 0.0
+
+    dias = range(7)
+    momentos = ['COMIDA', 'CENA']
+
+    # 4. Generación
+    for dia in dias:
+        for momento in momentos:
+            # Top 5 en memoria con filtro Anti-Repetición
+            pool = list(islice((r for r in candidatas if r.titulo not in memoria_reciente), 5))
+            if not pool: continue
+
+            receta_elegida = random.choice(pool)
+
+            memoria_reciente.append(receta_elegida.titulo)
+            if len(memoria_reciente) > 4: memoria_reciente.pop(0)
+
+            coste_plato = receta_elegida.precio_minimo_mio or 0
+            coste_total_plan += float(coste_plato)
+
+            # --- GENERAR LISTA DE COMPRA ---
+            for item in receta_elegida.ingredientes.all():
+                nombre_base = item.ingrediente_base.nombre
+                necesario = item.cantidad_gramos
+
+                if nombre_base not in despensa: despensa[nombre_base] = 0
+
+                if despensa[nombre_base] < necesario:
+                    prod = productos_baratos.get(item.ingrediente_base_id)
+
+                    if prod:
+                        peso_pack = prod.peso_gramos
+                        cantidad_a_comprar = 1
+                        deficit = necesario - despensa[nombre_base]
+
+                        while (cantidad_a_comprar * peso_pack) < deficit:
+                            cantidad_a_comprar += 1
+
+                        despensa[nombre_base] += (peso_pack * cantidad_a_comprar)
+
+                        # Por id: dos súper pueden tener un producto con el mismo nombre
+                        clave = prod.id
+                        if clave not in cesta_compra_real:
+                            cesta_compra_real[clave] = {
+                                'super': prod.supermercado.nombre,
+                                'supermercado_id': prod.supermercado_id,
+                                'nombre': prod.nombre_comercial,
+                                'unidades': 0,
+                                'precio_u': prod.precio_actual,
+                                'total': Decimal(0),
+                                'imagen': prod.imagen_url,
+                                'peso_gramos': prod.peso_gramos,
+                            }
+                        cesta_compra_real[clave]['unidades'] += cantidad_a_comprar
+                        cesta_compra_real[clave]['total'] += cantidad_a_comprar * prod.precio_actual
+
+                despensa[nombre_base] -= necesario
+
+            comidas.append((receta_elegida.id, dia, momento))
+
+    return {
+        'usuario_id': perfil.usuario_id,
+        'comidas': comidas,
+        'cesta': cesta_compra_real,
+        'coste': coste_total_plan,
+    }
+
+
+# --- PERSISTENCIA ATÓMICA DEL PLAN ---
+def subtotales_cesta(cesta):
+    """{nombre del súper: total} redondeado a céntimos (lo que pinta la lista de la compra)."""
+    subtotales = {}
+    for linea in cesta.values():
+        subtotales[linea['super']] = subtotales.get(linea['super'], 0) + linea['total']
+    return {nombre: float(round(total, 2)) for nombre, total in subtotales.items()}
+
+def guardar_planes(planes):
+    """
+    Escribe los planes, sus comidas y sus líneas de compra (bulk_create) en
+    una única transacción y sólo entonces retira los planes anteriores de
+    esos usuarios. Un lector concurrente ve la semana vieja o la nueva,
+    nunca una a medias.
+    """
+    with transaction.atomic():
+        nuevos = PlanSemanal.objects.bulk_create([
+            PlanSemanal(
+                usuario_id=datos['usuario_id'],
+                fecha_inicio=date.today(),
+                coste_total_estimado=datos['coste'],
+                subtotales_compra=subtotales_cesta(datos['cesta'])
+            )
+            for datos in planes
+        ])
+
+        ComidaPlanificada.objects.bulk_create([
+            ComidaPlanificada(plan=plan, receta_id=receta_id, dia_semana=dia, momento=momento)
+            for plan, datos in zip(nuevos, planes)
+            for receta_id, dia, momento in datos['comidas']
+        ])
+
+        LineaCompra.objects.bulk_create([
+            LineaCompra(
+                plan=plan, producto_id=producto_id, supermercado_id=linea['supermercado_id'],
+                supermercado_nombre=linea['super'], nombre=linea['nombre'], unidades=linea['unidades'], precio_unitario=linea['precio_u'],
+                total=linea['total'], peso_gramos=linea['peso_gramos'], imagen_url=linea['imagen']
+            )
+            for plan, datos in zip(nuevos, planes)
+            for producto_id, linea in datos['cesta'].items()
+        ], batch_size=500)
+
+        PlanSemanal.objects.filter(
+            usuario_id__in=[datos['usuario_id'] for datos in planes]
+        ).exclude(pk__in=[plan.pk for plan in nuevos]).delete()
+        subir_versiones([version_usuario(datos['usuario_id']) for datos in planes])
+    return nuevos
@@ -0,0 +1,82 @@
+from . import matrices
+from .cache import CATALOGO, subir_version
+from .models import Receta, RecetaIngrediente, ProductoReal
+
+
+# --- RECÁLCULO DE MACROS DE RECETAS ---
+CAMPOS_MACROS = ['calorias', 'proteinas', 'grasas', 'hidratos']
+
+
+def recalcular_macros_recetas(receta_ids=None, ingrediente_ids=None):
+    """
+    Recalcula calorías/proteínas/grasas/hidratos de todas las recetas, sólo de
+    `receta_ids`, o sólo de las que usan alguno de `ingrediente_ids` (p. ej.
+    los que acaba de cambiar la sincronización). Devuelve cuántas recetas.
+    """
+    recetas = Receta.objects.all()
+    if receta_ids is not None:
+        recetas = recetas.filter(id__in=receta_ids)
+    if ingrediente_ids is not None:
+        recetas = recetas.filter(ingredientes__ingrediente_base_id__in=ingrediente_ids).distinct()
+    recetas = list(recetas)
+    actualizar_macros(recetas)
+    return len(recetas)
+
+
+def actualizar_macros(recetas):
+    """
+    Calcula las macros de estas instancias con una única consulta
+    RecetaIngrediente ⨝ IngredienteBase y las guarda con bulk_update.
+    Con NumPy la suma es un producto de matrices; sin él, un recorrido en Python.
+    """
+    if not recetas: return
+    filas = list(
+        RecetaIngrediente.objects.filter(receta_id__in=[r.id for r in recetas]).values_list(
+            'receta_id', 'ingrediente_base_id', 'cantidad_gramos',
+            'ingrediente_base__calorias', 'ingrediente_base__proteinas',
+            'ingrediente_base__grasas', 'ingrediente_base__hidratos',
+        )
+    )
+
+    if matrices.DISPONIBLE:
+        matriz = matrices.MatrizRecetas([r.id for r in recetas], (f[:3] for f in filas))
+        totales = dict(zip(matriz.recetas_ids, matriz.macros({f[1]: f[3:] for f in filas}).tolist()))
+    else:
+        totales = {r.id: [0, 0, 0, 0] for r in recetas}
+        for receta_id, _, gramos, *por_100g in filas:
+            suma = totales[receta_id]
+            for i, valor in enumerate(por_100g):
+                suma[i] += (valor / 100) * gramos
+
+    for receta in recetas:
+        c, p, g, h = totales[receta.id]
+        receta.calorias = int(c)
+        receta.proteinas = round(p, 1)
+        receta.grasas = round(g, 1)
+        receta.hidratos = round(h, 1)
+    Receta.objects.bulk_update(recetas, CAMPOS_MACROS, batch_size=500)
+    subir_version(CATALOGO)
+
+
+# --- NUTRICIÓN DE PRODUCTOS POR CÓDIGO DE BARRAS ---
+def enriquecer_productos_por_ean(indice, productos=None):
+    """
+    Rellena kcal/prot/grasas/hidratos_100g de los ProductoReal con EAN
+    consultando el índice binario (core.indice_ean). Devuelve cuántos se
+    han actualizado.
+    """
+    if productos is None:
+        productos = ProductoReal.objects.exclude(ean__isnull=True).exclude(ean='')
+    cambiados = []
+    for producto in productos.only('id', 'ean'):
+        datos = indice.buscar(producto.ean)
+        if datos is None: continue
+        producto.kcal_100g = datos['kcal']
+        producto.prot_100g = round(datos['prot'], 1)
+        producto.grasas_100g = round(datos['gras'], 1)
+        producto.hidratos_100g = round(datos['hidr'], 1)
+        cambiados.append(producto)
+    ProductoReal.objects.bulk_update(
+        cambiados, ['kcal_100g', 'prot_100g', 'grasas_100g', 'hidratos_100g'], batch_size=500
+    )
+    return len(cambiados)
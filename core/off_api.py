@@ -0,0 +1,111 @@
+import os
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from .clasificador import normalizar
+from .http import ClienteHTTP
+from .models import RespuestaOFF
+
+# --- CONFIGURACIÓN ---
+# Cabecera para ser "educados" con la API
+HEADERS_OFF = {'User-Agent': 'QomeDemo/1.0 (Student Project; +http://localhost)'}
+# Se puede apuntar a un servidor local (stub) para pruebas
+OFF_API_BASE = os.environ.get('OFF_API_BASE', "https://es.openfoodfacts.org")
+# OFF pide no pasar de ~10 búsquedas por minuto
+PETICIONES_POR_SEGUNDO = 10 / 60
+
+
+def clave_consulta(texto):
+    return ' '.join(normalizar(texto).split())[:200]
+
+
+def macros_de_respuesta(data):
+    """Macros del primer producto de una búsqueda de OFF, o None si no hay."""
+    productos = data.get('products') or []
+    if not productos: return None
+    nutris = productos[0].get('nutriments', {})
+    return {
+        'kcal': int(nutris.get('energy-kcal_100g', 0) or 0),
+        'prot': float(nutris.get('proteins_100g', 0) or 0),
+        'gras': float(nutris.get('fat_100g', 0) or 0),
+        'hidr': float(nutris.get('carbohydrates_100g', 0) or 0)
+    }
+
+
+# --- CLIENTE CONCURRENTE CON CACHÉ PERSISTENTE ---
+class ClienteOFF:
+    """
+    Búsquedas en la API de OFF con ClienteHTTP (sesión compartida, límite de
+    concurrencia y de tasa, backoff exponencial) y caché en la tabla
+    RespuestaOFF por consulta normalizada, válida `ttl`. Las búsquedas sin
+    resultado también se cachean; los errores de red no.
+    """
+    def __init__(self, concurrencia=4, peticiones_por_segundo=PETICIONES_POR_SEGUNDO, timeout=20,
+                 reintentos=3, backoff=2, ttl=None, usar_cache=True, base=OFF_API_BASE):
+        self.base = base
+        self.usar_cache = usar_cache
+        self.ttl = ttl if ttl is not None else timedelta(days=getattr(settings, 'QOME_OFF_CACHE_DIAS', 30))
+        self.http = ClienteHTTP(
+            headers=HEADERS_OFF, concurrencia=concurrencia, peticiones_por_segundo=peticiones_por_segundo,
+            timeout=timeout, reintentos=reintentos, backoff=backoff
+        )
+        self.estadisticas = {'desde_cache': 0, 'descargas': 0, 'errores': 0}
+
+    def descargar(self, consulta):
+        data = self.http.get_json(f"{self.base}/cgi/search.pl", params={
+            'search_terms': consulta,
+            'search_simple': 1,
+            'action': 'process',
+            'json': 1,
+            'page_size': 3,
+            'fields': 'product_name,nutriments'
+        })
+        return macros_de_respuesta(data)
+
+    def leer_cache(self, claves):
+        if not self.usar_cache: return {}
+        return dict(
+            RespuestaOFF.objects.filter(consulta__in=claves, guardada_en__gte=timezone.now() - self.ttl)
+            .values_list('consulta', 'respuesta')
+        )
+
+    def guardar_cache(self, respuestas):
+        if not self.usar_cache or not respuestas: return
+        ahora = timezone.now()
+        RespuestaOFF.objects.bulk_create(
+            [RespuestaOFF(consulta=c, respuesta=r, guardada_en=ahora) for c, r in respuestas.items()],
+            update_conflicts=True,
+            unique_fields=['consulta'],
+            update_fields=['respuesta', 'guardada_en'],
+            batch_size=500
+        )
+
+    def obtener_muchos(self, consultas, al_obtener=None):
+        """
+        {consulta: macros | None}. Lo cacheado sale de 1 SELECT; el resto se
+        descarga en paralelo y se guarda en bloque. al_obtener(consulta,
+        macros, error) se llama según va llegando cada descarga.
+        """
+        claves = {c: clave_consulta(c) for c in consultas}
+        cacheadas = self.leer_cache(set(claves.values()))
+        self.estadisticas['desde_cache'] += sum(1 for k in claves.values() if k in cacheadas)
+
+        pendientes = sorted({k for k in claves.values() if k not in cacheadas})
+        nuevas = {}
+        for clave, macros, error in self.http.mapear(self.descargar, pendientes):
+            if error:
+                self.estadisticas['errores'] += 1
+            else:
+                self.estadisticas['descargas'] += 1
+                nuevas[clave] = macros
+            if al_obtener: al_obtener(clave, macros, error)
+        self.guardar_cache(nuevas)
+
+        resultados = {**cacheadas, **nuevas}
+        return {c: resultados.get(k) for c, k in claves.items()}
+
+    def obtener(self, consulta):
+        return self.obtener_muchos([consulta])[consulta]
+
+    def cerrar(self):
+        self.http.cerrar()
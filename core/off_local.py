@@ -0,0 +1,221 @@
+import csv
+import gzip
+import json
+import os
+import sqlite3
+import statistics
+import sys
+from .clasificador import normalizar
+
+# --- VOLCADO LOCAL DE OPEN FOOD FACTS ---
+# Recorre en streaming (memoria constante) un export de OFF (.jsonl/.csv,
+# opcionalmente .gz, varios GB) y guarda sólo lo que usamos en un SQLite
+# compacto: código, nombre y los 4 nutrientes por 100g.
+
+CAMPOS_NUTRIENTES = ('energy-kcal_100g', 'proteins_100g', 'fat_100g', 'carbohydrates_100g')
+TAMANO_LOTE = 5000
+TOP_K = 5
+
+
+def lineas(ruta):
+    """(offset en bytes del volcado sin comprimir, línea decodificada)."""
+    abrir = gzip.open if ruta.endswith('.gz') else open
+    offset = 0
+    with abrir(ruta, 'rb') as f:
+        for linea in f:
+            yield offset, linea.decode('utf-8', errors='replace')
+            offset += len(linea)
+
+
+def numero(valor):
+    try:
+        return float(valor or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def fila_nutricion(codigo, nombre, valores, paises=None, pais=None):
+    """(código, nombre, kcal, prot, gras, hidr) o None si no sirve."""
+    if not nombre: return None
+    if pais and pais not in (paises or ''): return None
+    kcal, prot, gras, hidr = (numero(valores.get(c)) for c in CAMPOS_NUTRIENTES)
+    if kcal <= 0: return None
+    return (str(codigo or ''), nombre.strip(), kcal, prot, gras, hidr)
+
+
+def recorrer_jsonl(ruta, pais=None):
+    for offset, linea in lineas(ruta):
+        # Filtro barato antes de parsear: sin kcal no hay nada que guardar
+        if '"energy-kcal_100g"' not in linea: continue
+        try:
+            p = json.loads(linea)
+        except ValueError:
+            continue
+        paises = ','.join(p.get('countries_tags') or [])
+        fila = fila_nutricion(
+            p.get('code'), p.get('product_name_es') or p.get('product_name'),
+            p.get('nutriments') or {}, paises, pais
+        )
+        if fila: yield offset, fila
+
+
+def recorrer_csv(ruta, pais=None):
+    # Línea a línea (el CSV de OFF no tiene saltos de línea dentro de los campos)
+    csv.field_size_limit(sys.maxsize)  # OFF tiene columnas enormes
+    columnas = delimitador = None
+    for offset, linea in lineas(ruta):
+        if columnas is None:
+            delimitador = '\t' if '\t' in linea else ','
+            columnas = next(csv.reader([linea], delimiter=delimitador))
+            continue
+        p = dict(zip(columnas, next(csv.reader([linea], delimiter=delimitador), [])))
+        fila = fila_nutricion(
+            p.get('code'), p.get('product_name_es') or p.get('product_name'),
+            p, p.get('countries_tags'), pais
+        )
+        if fila: yield offset, fila
+
+
+def recorrer_dump(ruta, pais=None):
+    """
+    (offset, fila) según la extensión (.jsonl / .json / .csv / .tsv, con o
+    sin .gz). El offset permite volver a la línea original del volcado.
+    """
+    base = ruta[:-3] if ruta.endswith('.gz') else ruta
+    if base.endswith(('.jsonl', '.json')):
+        return recorrer_jsonl(ruta, pais)
+    if base.endswith(('.csv', '.tsv')):
+        return recorrer_csv(ruta, pais)
+    raise ValueError(f"Formato de volcado no reconocido: {ruta}")
+
+
+def leer_dump(ruta, pais=None):
+    """Sólo las filas (código, nombre, kcal, prot, gras, hidr)."""
+    return (fila for _, fila in recorrer_dump(ruta, pais))
+
+
+# --- ALMACÉN LOCAL DE NUTRICIÓN (SQLite + índice FTS5) ---
+class AlmacenNutricion:
+    """
+    Tabla `productos` + índice de texto completo `productos_fts` (FTS5) sobre
+    el nombre ya pasado por `normalizar` (mismo plegado de tildes que el
+    scraper; el tokenizador no quita más diacríticos). Si el SQLite no trae
+    FTS5 se busca con LIKE.
+    """
+    def __init__(self, ruta):
+        self.ruta = str(ruta)
+        self.con = None
+        self.fts = None
+
+    @property
+    def existe(self):
+        return os.path.exists(self.ruta)
+
+    def conectar(self):
+        if self.con is None:
+            self.con = sqlite3.connect(self.ruta, check_same_thread=False)
+        return self.con
+
+    def construir(self, filas, progreso=None):
+        """
+        Crea el almacén desde cero en un fichero temporal y lo sustituye al
+        final (quien esté leyendo el anterior no ve un almacén a medias).
+        Devuelve el número de productos guardados.
+        """
+        temporal = self.ruta + '.tmp'
+        if os.path.exists(temporal): os.remove(temporal)
+        con = sqlite3.connect(temporal)
+        con.execute('PRAGMA journal_mode = OFF')
+        con.execute('PRAGMA synchronous = OFF')
+        con.execute('''
+            CREATE TABLE productos (
+                codigo TEXT, nombre TEXT, nombre_norm TEXT,
+                kcal REAL, prot REAL, gras REAL, hidr REAL
+            )
+        ''')
+
+        total, lote = 0, []
+        for codigo, nombre, kcal, prot, gras, hidr in filas:
+            lote.append((codigo, nombre, normalizar(nombre), kcal, prot, gras, hidr))
+            if len(lote) >= TAMANO_LOTE:
+                total += self.insertar(con, lote)
+                lote = []
+                if progreso: progreso(total)
+        total += self.insertar(con, lote)
+
+        con.execute('CREATE INDEX productos_codigo ON productos (codigo)')
+        try:
+            con.execute(
+                "CREATE VIRTUAL TABLE productos_fts USING fts5("
+                "nombre_norm, content='productos', tokenize='unicode61 remove_diacritics 0')"
+            )
+            con.execute("INSERT INTO productos_fts(productos_fts) VALUES ('rebuild')")
+        except sqlite3.OperationalError:
+            pass  # SQLite sin FTS5: buscar() usará LIKE
+        con.commit()
+        con.execute('VACUUM')
+        con.close()
+
+        self.cerrar()
+        os.replace(temporal, self.ruta)
+        return total
+
+    def insertar(self, con, lote):
+        con.executemany('INSERT INTO productos VALUES (?, ?, ?, ?, ?, ?, ?)', lote)
+        return len(lote)
+
+    def tiene_fts(self):
+        if self.fts is None:
+            self.fts = self.conectar().execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'productos_fts'"
+            ).fetchone() is not None
+        return self.fts
+
+    def candidatos(self, texto, k=TOP_K):
+        """
+        Los k productos que mejor encajan, de mejor a peor: primero los que
+        tienen todas las palabras (bm25, y a igualdad el nombre más corto);
+        si no hay ninguno, los que tienen alguna.
+        Devuelve [(nombre, kcal, prot, gras, hidr)].
+        """
+        palabras = normalizar(texto).split()
+        if not palabras: return []
+        if not self.tiene_fts():
+            return self.candidatos_like(palabras, k)
+
+        terminos = ['"%s"' % p.replace('"', '""') for p in palabras]
+        for operador in (' ', ' OR '):
+            filas = self.conectar().execute(
+                'SELECT p.nombre, p.kcal, p.prot, p.gras, p.hidr FROM productos_fts '
+                'JOIN productos p ON p.rowid = productos_fts.rowid '
+                'WHERE productos_fts MATCH ? '
+                'ORDER BY bm25(productos_fts), length(p.nombre_norm) LIMIT ?',
+                [operador.join(terminos), k]
+            ).fetchall()
+            if filas or len(palabras) == 1: return filas
+        return []
+
+    def candidatos_like(self, palabras, k):
+        condiciones = ' AND '.join(['nombre_norm LIKE ?'] * len(palabras))
+        return self.conectar().execute(
+            f'SELECT nombre, kcal, prot, gras, hidr FROM productos WHERE {condiciones} '
+            f'ORDER BY length(nombre_norm) LIMIT ?',
+            [f'%{p}%' for p in palabras] + [k]
+        ).fetchall()
+
+    def buscar(self, texto, k=TOP_K):
+        """
+        Mediana de cada nutriente entre los k mejores candidatos (más estable
+        que quedarse con el primero). Devuelve {'kcal', 'prot', 'gras', 'hidr',
+        'candidatos'} o None.
+        """
+        filas = self.candidatos(texto, k)
+        if not filas: return None
+        kcal, prot, gras, hidr = (statistics.median(columna) for columna in list(zip(*filas))[1:])
+        return {'kcal': int(kcal), 'prot': prot, 'gras': gras, 'hidr': hidr, 'candidatos': len(filas)}
+
+    def cerrar(self):
+        if self.con is not None:
+            self.con.close()
+            self.con = None
+            self.fts = None
@@ -0,0 +1,55 @@
+import math
+from decimal import Decimal, InvalidOperation
+from django.db.models import F, Q
+
+# --- PAGINACIÓN KEYSET (Cursor sobre precio, id) ---
+# En lugar de OFFSET (que obliga a recorrer todo lo anterior) la página
+# siguiente empieza justo después del último (precio, id) mostrado. El orden
+# es estable: precio ascendente con los NULL ("no disponible") al final y el
+# id como desempate. Con búsqueda de texto el mismo esquema se aplica a la
+# relevancia (bm25, un float).
+
+SEPARADOR = '~'
+
+
+def codificar_cursor(precio, ultimo_id):
+    return f"{'' if precio is None else precio}{SEPARADOR}{ultimo_id}"
+
+
+def decodificar_cursor(texto, tipo=Decimal):
+    """(valor | None, id) o None si el cursor no es válido. `tipo` convierte el valor."""
+    if not texto or SEPARADOR not in texto: return None
+    precio, _, ultimo_id = texto.partition(SEPARADOR)
+    try:
+        valor = tipo(precio) if precio else None
+        # 'NaN' o 'inf' son números para Decimal/float, pero no un precio
+        if valor is not None and not math.isfinite(valor): return None
+        return valor, int(ultimo_id)
+    except (InvalidOperation, ValueError):
+        return None
+
+
+def pagina_por_precio(queryset, cursor=None, tamano=24, campo='precio_usuario', tipo=Decimal):
+    """
+    Devuelve (objetos de la página, cursor de la siguiente | None).
+    `campo` es la anotación por la que se ordena (precio, o `relevancia`
+    con tipo=float) y `tipo` el de su valor en el cursor.
+    """
+    posicion = decodificar_cursor(cursor, tipo)
+    if posicion:
+        precio, ultimo_id = posicion
+        if precio is None:
+            queryset = queryset.filter(Q(**{f'{campo}__isnull': True}), id__gt=ultimo_id)
+        else:
+            queryset = queryset.filter(
+                Q(**{f'{campo}__gt': precio}) |
+                Q(**{campo: precio, 'id__gt': ultimo_id}) |
+                Q(**{f'{campo}__isnull': True})
+            )
+
+    # Una fila de más para saber si hay página siguiente sin hacer COUNT
+    filas = list(queryset.order_by(F(campo).asc(nulls_last=True), 'id')[:tamano + 1])
+    if len(filas) <= tamano:
+        return filas, None
+    filas = filas[:tamano]
+    return filas, codificar_cursor(getattr(filas[-1], campo), filas[-1].id)
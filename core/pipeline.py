@@ -0,0 +1,132 @@
+import queue
+import threading
+import time
+
+# Marca de fin de flujo que se propaga de una etapa a la siguiente
+FIN = object()
+
+
+# --- ETAPA (Paso con su propia concurrencia y contadores) ---
+class Etapa:
+    """
+    Un paso de la pipeline: `funcion(elemento)` ejecutada por `hilos` hilos.
+    Devuelve el elemento para la siguiente etapa, o None para descartarlo.
+    al_terminar() se ejecuta una sola vez, en el último hilo que acaba
+    (p. ej. para vaciar un buffer o cerrar la conexión a la BD).
+    """
+    def __init__(self, nombre, funcion, hilos=1, al_terminar=None):
+        self.nombre = nombre
+        self.funcion = funcion
+        self.hilos = max(1, hilos)
+        self.al_terminar = al_terminar
+
+        self.cerrojo = threading.Lock()
+        self.procesados = 0
+        self.errores = []
+        self.ocupado = 0.0          # segundos dentro de `funcion` (sumando hilos)
+        self.espera_entrada = 0.0   # esperando trabajo de la etapa anterior
+        self.espera_salida = 0.0    # bloqueado porque la siguiente va llena (backpressure)
+
+    def anotar(self, ocupado=0.0, espera_entrada=0.0, espera_salida=0.0, procesado=False, error=None):
+        with self.cerrojo:
+            self.ocupado += ocupado
+            self.espera_entrada += espera_entrada
+            self.espera_salida += espera_salida
+            if procesado: self.procesados += 1
+            if error is not None: self.errores.append(error)
+
+    def resumen(self):
+        return (
+            f"{self.nombre:<14} {self.hilos} hilo(s) · {self.procesados} elementos · "
+            f"trabajando {self.ocupado:.2f}s · sin trabajo {self.espera_entrada:.2f}s · "
+            f"frenado por la siguiente {self.espera_salida:.2f}s · {len(self.errores)} errores"
+        )
+
+
+# --- PIPELINE (Etapas unidas por colas acotadas) ---
+class Pipeline:
+    """
+    fuente (iterable, en su propio hilo) → etapa 1 → ... → etapa N.
+    Las colas entre etapas tienen tamaño `tamano_cola`: si una etapa va lenta,
+    las anteriores se bloquean en put() en lugar de acumular memoria.
+    Los errores de cada elemento se anotan en su etapa y el flujo continúa.
+    """
+    def __init__(self, fuente, etapas, tamano_cola=8, nombre_fuente='fuente'):
+        self.fuente = fuente
+        self.etapas = list(etapas)
+        self.tamano_cola = tamano_cola
+        self.etapa_fuente = Etapa(nombre_fuente, None)
+
+    @property
+    def errores(self):
+        return [e for etapa in [self.etapa_fuente] + self.etapas for e in etapa.errores]
+
+    def ejecutar(self):
+        colas = [queue.Queue(maxsize=self.tamano_cola) for _ in self.etapas]
+        hilos = [threading.Thread(target=self.producir, args=(colas[0], self.etapas[0].hilos), daemon=True)]
+
+        for i, etapa in enumerate(self.etapas):
+            salida = colas[i + 1] if i + 1 < len(self.etapas) else None
+            hilos_siguiente = self.etapas[i + 1].hilos if salida else 0
+            vivos = [etapa.hilos]
+            for _ in range(etapa.hilos):
+                hilos.append(threading.Thread(
+                    target=self.trabajar, args=(etapa, colas[i], salida, hilos_siguiente, vivos), daemon=True
+                ))
+
+        for h in hilos: h.start()
+        for h in hilos: h.join()
+        return self
+
+    def producir(self, salida, hilos_siguiente):
+        etapa = self.etapa_fuente
+        iterador = iter(self.fuente)
+        try:
+            while True:
+                t0 = time.perf_counter()
+                try:
+                    elemento = next(iterador)
+                except StopIteration:
+                    break
+                t1 = time.perf_counter()
+                salida.put(elemento)
+                etapa.anotar(ocupado=t1 - t0, espera_salida=time.perf_counter() - t1, procesado=True)
+        except Exception as e:
+            etapa.anotar(error=e)
+        finally:
+            for _ in range(hilos_siguiente): salida.put(FIN)
+
+    def trabajar(self, etapa, entrada, salida, hilos_siguiente, vivos):
+        while True:
+            t0 = time.perf_counter()
+            elemento = entrada.get()
+            t1 = time.perf_counter()
+            if elemento is FIN:
+                etapa.anotar(espera_entrada=t1 - t0)
+                break
+            try:
+                resultado = etapa.funcion(elemento)
+            except Exception as e:
+                etapa.anotar(espera_entrada=t1 - t0, ocupado=time.perf_counter() - t1, error=e)
+                continue
+            t2 = time.perf_counter()
+            if salida is not None and resultado is not None:
+                salida.put(resultado)
+            etapa.anotar(
+                espera_entrada=t1 - t0, ocupado=t2 - t1,
+                espera_salida=time.perf_counter() - t2, procesado=True
+            )
+
+        with etapa.cerrojo:
+            vivos[0] -= 1
+            ultimo = vivos[0] == 0
+        if not ultimo: return
+        try:
+            if etapa.al_terminar: etapa.al_terminar()
+        except Exception as e:
+            etapa.anotar(error=e)
+        finally:
+            for _ in range(hilos_siguiente): salida.put(FIN)
+
+    def informe(self):
+        return "\n".join(e.resumen() for e in [self.etapa_fuente] + self.etapas)
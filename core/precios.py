@@ -0,0 +1,284 @@
+from collections import defaultdict
+from decimal import ROUND_HALF_UP, Decimal
+from django.db import transaction
+from django.db.models import F, Q, Min, FilteredRelation
+from django.utils import timezone
+from . import matrices
+from .cache import CATALOGO, subir_version
+from .models import (
+    ProductoReal, Receta, RecetaIngrediente, Supermercado, CostePorSupermercado, PrecioPendiente,
+    ConjuntoSupermercados, PrecioRecetaConjunto, PerfilUsuario
+)
+
+CENTIMOS = Decimal('0.01')
+# El motor matricial devuelve los costes en céntimos/kg × gramos
+CIENMILESIMAS = Decimal(100000)
+
+
+# --- RESOLUTOR DE PRODUCTO MÁS BARATO ---
+def mapa_productos_mas_baratos(mis_supers, ingredientes=None):
+    """
+    Devuelve {ingrediente_base_id: ProductoReal} con el producto más barato
+    por kg de cada ingrediente dentro de los supermercados indicados.
+    Una sola consulta, con el supermercado ya unido (select_related).
+    """
+    productos = ProductoReal.objects.filter(
+        supermercado__in=mis_supers
+    ).select_related('supermercado').order_by('ingrediente_base_id', 'precio_por_kg', 'id')
+
+    if ingredientes is not None:
+        productos = productos.filter(ingrediente_base__in=ingredientes)
+
+    mapa = {}
+    for prod in productos:
+        # El primero de cada ingrediente es el más barato (ORDER BY precio_por_kg)
+        mapa.setdefault(prod.ingrediente_base_id, prod)
+    return mapa
+
+
+# --- INDEXADOR DE PRECIOS (Basado en conjuntos) ---
+def tabla_precios_minimos(supers_ids=None, ingredientes=None):
+    """
+    {(ingrediente_base_id, supermercado_id): precio_por_kg mínimo}.
+    Una única consulta agregada (GROUP BY) en vez de una por combinación.
+    """
+    productos = ProductoReal.objects.filter(precio_por_kg__gt=0)
+    if supers_ids is not None:
+        productos = productos.filter(supermercado__in=supers_ids)
+    if ingredientes is not None:
+        productos = productos.filter(ingrediente_base__in=ingredientes)
+
+    filas = productos.values('ingrediente_base_id', 'supermercado_id').annotate(minimo=Min('precio_por_kg'))
+    return {(f['ingrediente_base_id'], f['supermercado_id']): f['minimo'] for f in filas}
+
+def ingredientes_por_receta(recetas=None):
+    """{receta_id: [(ingrediente_base_id, gramos), ...]} en una sola consulta."""
+    filas = RecetaIngrediente.objects.all()
+    if recetas is not None:
+        filas = filas.filter(receta__in=recetas)
+
+    por_receta = defaultdict(list)
+    for receta_id, ing_id, gramos in filas.values_list('receta_id', 'ingrediente_base_id', 'cantidad_gramos'):
+        por_receta[receta_id].append((ing_id, gramos))
+    return por_receta
+
+def redondear_coste(importe):
+    """A céntimos, la mitad hacia arriba: igual en el camino Decimal y en el matricial."""
+    return importe.quantize(CENTIMOS, rounding=ROUND_HALF_UP)
+
+def calcular_coste(receta_id, super_id, items, precios):
+    """CostePorSupermercado (sin guardar) de una receta en un súper."""
+    coste_total = Decimal(0)
+    es_posible = True
+    for ing_id, gramos in items:
+        precio_kg = precios.get((ing_id, super_id))
+        if precio_kg is None:
+            es_posible = False
+            continue
+        # Coste = (PrecioKG / 1000) * GramosNecesarios
+        coste_total += (precio_kg / 1000) * Decimal(gramos)
+
+    return CostePorSupermercado(
+        receta_id=receta_id,
+        supermercado_id=super_id,
+        coste=redondear_coste(coste_total),
+        es_posible=es_posible
+    )
+
+def calcular_costes(recetas_ids, supers_ids, por_receta, precios):
+    """Genera los CostePorSupermercado (sin guardar) a partir de las tablas en memoria."""
+    return [
+        calcular_coste(receta_id, super_id, por_receta.get(receta_id, []), precios)
+        for receta_id in recetas_ids
+        for super_id in supers_ids
+    ]
+
+def calcular_costes_matricial(recetas_ids, supers_ids, por_receta, precios):
+    """
+    Misma salida que calcular_costes, resuelta como producto de matrices
+    (NumPy). La suma es entera y exacta, y se redondea en Decimal como allí.
+    """
+    matriz = matrices.MatrizRecetas(recetas_ids, (
+        (receta_id, ing_id, gramos)
+        for receta_id, items in por_receta.items()
+        for ing_id, gramos in items
+    ))
+    totales, posibles = matriz.costes(supers_ids, precios)
+
+    return [
+        CostePorSupermercado(
+            receta_id=receta_id,
+            supermercado_id=super_id,
+            coste=redondear_coste(Decimal(int(totales[i, j])) / CIENMILESIMAS),
+            es_posible=bool(posibles[i, j])
+        )
+        for i, receta_id in enumerate(recetas_ids)
+        for j, super_id in enumerate(supers_ids)
+    ]
+
+def guardar_costes(costes):
+    """Upsert masivo sobre la clave única (receta, supermercado)."""
+    CostePorSupermercado.objects.bulk_create(
+        costes,
+        update_conflicts=True,
+        unique_fields=['receta', 'supermercado'],
+        update_fields=['coste', 'es_posible', 'ultima_actualizacion'],
+        batch_size=500
+    )
+    return len(costes)
+
+def indexar_precios():
+    """
+    Recalcula TODOS los CostePorSupermercado con 3 lecturas (recetas,
+    ingredientes de receta, precios mínimos agregados) y escrituras en bloque.
+    """
+    inicio = timezone.now()
+    supers_ids = list(Supermercado.objects.values_list('id', flat=True))
+    recetas_ids = list(Receta.objects.values_list('id', flat=True))
+
+    calcular = calcular_costes_matricial if matrices.DISPONIBLE else calcular_costes
+    costes = calcular(recetas_ids, supers_ids, ingredientes_por_receta(), tabla_precios_minimos())
+    guardar_costes(costes)
+    registrar_conjuntos(conjuntos_en_uso(), materializar=False)
+    materializar_precios()
+    subir_version(CATALOGO)
+
+    # Una pasada completa deja al día todo lo marcado antes de empezar
+    PrecioPendiente.objects.filter(marcado_en__lte=inicio).delete()
+    return costes
+
+def indexar_precios_incremental():
+    """
+    Modo "cambios desde la última ejecución": consume los PrecioPendiente y
+    recalcula sólo los CostePorSupermercado afectados, usando el índice
+    inverso IngredienteBase -> Receta (vía RecetaIngrediente).
+    """
+    inicio = timezone.now()
+    # Los conjuntos nuevos se materializan enteros; luego se ponen al día con el resto
+    registrar_conjuntos(conjuntos_en_uso())
+
+    pendientes = PrecioPendiente.objects.filter(marcado_en__lte=inicio)
+    pares = list(pendientes.values_list('ingrediente_base_id', 'supermercado_id'))
+    if not pares:
+        return []
+
+    supers_por_ingrediente = defaultdict(set)
+    for ing_id, super_id in pares:
+        supers_por_ingrediente[ing_id].add(super_id)
+
+    # Índice inverso: qué recetas usan cada ingrediente cambiado, y en qué súper
+    supers_por_receta = defaultdict(set)
+    for receta_id, ing_id in RecetaIngrediente.objects.filter(
+        ingrediente_base__in=supers_por_ingrediente.keys()
+    ).values_list('receta_id', 'ingrediente_base_id'):
+        supers_por_receta[receta_id] |= supers_por_ingrediente[ing_id]
+
+    por_receta = ingredientes_por_receta(supers_por_receta.keys())
+    precios = tabla_precios_minimos(
+        supers_ids={s for supers in supers_por_receta.values() for s in supers},
+        ingredientes={ing_id for items in por_receta.values() for ing_id, _ in items}
+    )
+
+    costes = [
+        calcular_coste(receta_id, super_id, por_receta.get(receta_id, []), precios)
+        for receta_id, supers in supers_por_receta.items()
+        for super_id in supers
+    ]
+    guardar_costes(costes)
+    materializar_precios(recetas_ids=list(supers_por_receta))
+    subir_version(CATALOGO)
+
+    # Sólo borramos las marcas que ya existían al empezar (las nuevas esperan)
+    pendientes.delete()
+    return costes
+
+
+# --- PRECIOS MATERIALIZADOS POR CONJUNTO DE SUPERMERCADOS ---
+def conjuntos_en_uso():
+    """Conjuntos (tuplas de ids) elegidos por algún perfil, más el de todos los súper."""
+    por_perfil = defaultdict(set)
+    for perfil_id, super_id in PerfilUsuario.supermercados_seleccionados.through.objects.values_list(
+        'perfilusuario_id', 'supermercado_id'
+    ):
+        por_perfil[perfil_id].add(super_id)
+    conjuntos = {tuple(sorted(ids)) for ids in por_perfil.values()}
+    # Sin selección (o sin sesión) se usan todos
+    conjuntos.add(tuple(sorted(Supermercado.objects.values_list('id', flat=True))))
+    return conjuntos
+
+def registrar_conjuntos(conjuntos_ids, materializar=True):
+    """
+    Registra los conjuntos de supermercados que aún no existan y, si
+    `materializar`, rellena sus precios en la misma transacción. Es un camino
+    de escritura (indexador, admin, trabajos de planes): las vistas sólo leen
+    y, mientras un conjunto no esté registrado, agregan al vuelo.
+    Devuelve los ConjuntoSupermercados nuevos.
+    """
+    por_firma = {ConjuntoSupermercados.firma_de(ids): ids for ids in conjuntos_ids if ids}
+    existentes = set(ConjuntoSupermercados.objects.filter(firma__in=por_firma).values_list('firma', flat=True))
+    nuevos = [
+        ConjuntoSupermercados(firma=firma, supermercados=ConjuntoSupermercados.lista_de(ids))
+        for firma, ids in por_firma.items() if firma not in existentes
+    ]
+    if not nuevos: return []
+    with transaction.atomic():
+        ConjuntoSupermercados.objects.bulk_create(nuevos, ignore_conflicts=True)
+        if materializar: materializar_precios(nuevos)
+    return nuevos
+
+def anotar_precio_conjunto(recetas, supers_ids, campo):
+    """
+    Anota en el queryset `recetas` el coste mínimo posible de cada receta en
+    ese conjunto de supermercados (None si no es posible en ninguno). Si el
+    conjunto está registrado sale de la tabla materializada (LEFT JOIN por su
+    índice único); si no, se agrega al vuelo sobre CostePorSupermercado, sin
+    escribir nada.
+    """
+    firma = ConjuntoSupermercados.firma_de(supers_ids)
+    if ConjuntoSupermercados.objects.filter(firma=firma).exists():
+        return recetas.annotate(
+            precio_conjunto=FilteredRelation('precios_conjunto', condition=Q(precios_conjunto__firma=firma))
+        ).annotate(**{campo: F('precio_conjunto__coste')})
+    return recetas.annotate(**{campo: Min(
+        'costes_por_supermercado__coste',
+        filter=Q(costes_por_supermercado__es_posible=True, costes_por_supermercado__supermercado__in=supers_ids)
+    )})
+
+def materializar_precios(conjuntos=None, recetas_ids=None):
+    """
+    Rellena PrecioRecetaConjunto (coste mínimo entre los CostePorSupermercado
+    posibles del conjunto y el súper ganador) para todos los conjuntos
+    registrados, o los dados, y todas las recetas o sólo `recetas_ids`.
+    Devuelve el número de filas escritas.
+    """
+    conjuntos = list(ConjuntoSupermercados.objects.all() if conjuntos is None else conjuntos)
+    if not conjuntos: return 0
+
+    costes = CostePorSupermercado.objects.filter(es_posible=True)
+    if recetas_ids is not None:
+        costes = costes.filter(receta_id__in=recetas_ids)
+    # Ordenadas: el primer (receta, súper) de cada conjunto es el ganador
+    filas = list(costes.order_by('receta_id', 'coste', 'supermercado_id').values_list('receta_id', 'supermercado_id', 'coste'))
+
+    nuevas = []
+    for conjunto in conjuntos:
+        ids = conjunto.ids()
+        ganadores = set()
+        for receta_id, super_id, coste in filas:
+            if super_id in ids and receta_id not in ganadores:
+                ganadores.add(receta_id)
+                nuevas.append(PrecioRecetaConjunto(
+                    firma=conjunto.firma, receta_id=receta_id, supermercado_id=super_id, coste=coste
+                ))
+
+    with transaction.atomic():
+        firmas = [c.firma for c in conjuntos]
+        if recetas_ids is None:
+            PrecioRecetaConjunto.objects.filter(firma__in=firmas).delete()
+        else:
+            recetas_ids = list(recetas_ids)
+            for i in range(0, len(recetas_ids), 500):
+                PrecioRecetaConjunto.objects.filter(firma__in=firmas, receta_id__in=recetas_ids[i:i + 500]).delete()
+        PrecioRecetaConjunto.objects.bulk_create(nuevas, batch_size=500)
+        ConjuntoSupermercados.objects.filter(firma__in=firmas).update(actualizado_en=timezone.now())
+    return len(nuevas)
@@ -0,0 +1,112 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from .models import TrabajoPlan
+from .motor import generar_plan_motor
+
+# Un trabajo "vivo" más antiguo que esto se da por perdido (p.ej. reinicio del servidor)
+CADUCIDAD_TRABAJO = timedelta(minutes=10)
+
+_ejecutor = None
+
+
+def obtener_ejecutor():
+    global _ejecutor
+    if _ejecutor is None:
+        hilos = getattr(settings, 'QOME_HILOS_PLANES', 2)
+        _ejecutor = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix='qome-plan')
+    return _ejecutor
+
+
+# --- COLA DE REGENERACIÓN ---
+def encolar_regeneracion(user):
+    """
+    Registra un TrabajoPlan y lo lanza en el pool de hilos. Si el usuario ya
+    tiene uno pendiente se reutiliza: varios POST seguidos = 1 sola
+    regeneración, y como aún no ha empezado leerá el perfil más reciente.
+    Uno en curso no vale (ya leyó el perfil anterior): el nuevo espera a que
+    termine y lo lanza quien lo termina (ver ejecutar_trabajo). La
+    restricción `un_trabajo_pendiente_por_usuario` hace que dos peticiones
+    simultáneas no puedan crear dos.
+    """
+    activos = TrabajoPlan.objects.filter(usuario=user, estado__in=TrabajoPlan.ACTIVOS)
+    pendientes = activos.filter(estado='PENDIENTE')
+    with transaction.atomic():
+        # Los vivos demasiado antiguos se dan por perdidos y dejan sitio a uno nuevo
+        activos.filter(creado_en__lt=timezone.now() - CADUCIDAD_TRABAJO).update(
+            estado='ERROR', mensaje="Trabajo caducado sin terminar", terminado_en=timezone.now()
+        )
+        trabajo = pendientes.select_for_update().first()
+        if trabajo:
+            return trabajo
+        try:
+            with transaction.atomic():
+                trabajo = TrabajoPlan.objects.create(usuario=user)
+        except IntegrityError:
+            # Otra petición lo ha creado entre la consulta y el INSERT
+            return pendientes.get()
+
+        if getattr(settings, 'QOME_PLANES_EN_SEGUNDO_PLANO', True):
+            # Se lanza cuando la transacción confirma el trabajo
+            transaction.on_commit(lambda: obtener_ejecutor().submit(ejecutar_en_hilo, trabajo.id))
+    if not getattr(settings, 'QOME_PLANES_EN_SEGUNDO_PLANO', True):
+        ejecutar_trabajo(trabajo.id)
+    return trabajo
+
+
+def ejecutar_en_hilo(trabajo_id):
+    try:
+        ejecutar_trabajo(trabajo_id)
+    finally:
+        # Cada hilo abre su propia conexión: la cerramos al terminar
+        connection.close()
+
+
+def reclamar(trabajo_id):
+    """
+    PENDIENTE -> EN_CURSO en un solo UPDATE, y solo si el usuario no tiene
+    otro en curso: dos planes del mismo usuario a la vez acabarían con el
+    del perfil viejo pisando al nuevo si terminase después.
+    """
+    en_curso = TrabajoPlan.objects.filter(usuario_id=OuterRef('usuario_id'), estado='EN_CURSO')
+    return TrabajoPlan.objects.filter(id=trabajo_id, estado='PENDIENTE').exclude(Exists(en_curso)).update(
+        estado='EN_CURSO', iniciado_en=timezone.now()
+    )
+
+
+def ejecutar_trabajo(trabajo_id):
+    while trabajo_id:
+        # Reclamo atómico: si otro hilo ya lo cogió (o hay otro en curso), no hacemos nada
+        if not reclamar(trabajo_id): return
+
+        trabajo = TrabajoPlan.objects.select_related('usuario').get(id=trabajo_id)
+        try:
+            exito, msg = generar_plan_motor(trabajo.usuario)
+        except Exception as e:
+            exito, msg = False, f"Error generando el plan: {e}"
+
+        TrabajoPlan.objects.filter(id=trabajo_id).update(
+            estado='HECHO' if exito else 'ERROR',
+            mensaje=msg[:255],
+            terminado_en=timezone.now()
+        )
+        # El que se encoló mientras este corría no pudo reclamarse: lo lanzamos aquí
+        trabajo_id = TrabajoPlan.objects.filter(usuario_id=trabajo.usuario_id, estado='PENDIENTE').values_list(
+            'id', flat=True
+        ).first()
+
+
+# --- CONSULTAS DE ESTADO ---
+def ultimo_trabajo(user):
+    return TrabajoPlan.objects.filter(usuario=user).order_by('-creado_en', '-id').first()
+
+
+def trabajo_activo(user):
+    return TrabajoPlan.objects.filter(
+        usuario=user,
+        estado__in=TrabajoPlan.ACTIVOS,
+        creado_en__gte=timezone.now() - CADUCIDAD_TRABAJO
+    ).order_by('-creado_en').first()
@@ -1,3 +1,987 @@
-from django.test import TestCase
+import hashlib
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from contextlib import redirect_stdout
+from datetime import timedelta
+from decimal import Decimal
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from unittest import mock
+from urllib.parse import urlsplit, parse_qs
+from django.contrib.auth.models import User
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.db.models import Case, DecimalField, F, Value, When
+from django.db.models.functions import Cast
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
 
-# Create your tests here.
+from .http import ClienteHTTP, CacheHTTP, ErrorHTTP
+from .clasificador import (
+    BLACKLIST, MATCH_SINONIMOS_OR, MATCH_COMPUESTO_AND, Clasificador, cumple_criterios_seguros
+)
+from . import busqueda, cache, indice_ean, matrices, mercadona
+from .busqueda import TABLA_FTS, buscar_recetas, expresion_fts, hay_fts
+from .ingesta import BufferProductos, EstadoCrawler
+from .models import (
+    ConjuntoSupermercados, CostePorSupermercado, DocumentoBusquedaReceta, EstadoCategoria, EstadoProductoScrapeado,
+    IngredienteBase, LineaCompra, PerfilUsuario, PlanSemanal, PrecioPendiente, PrecioRecetaConjunto, ProductoReal,
+    Receta, RecetaIngrediente, RespuestaOFF, Supermercado, TrabajoPlan, VersionCache
+)
+from .motor import guardar_planes
+from .paginacion import codificar_cursor, decodificar_cursor, pagina_por_precio
+from .pipeline import Etapa, Pipeline
+from .precios import (
+    anotar_precio_conjunto, calcular_costes, calcular_costes_matricial, guardar_costes, indexar_precios, indexar_precios_incremental, materializar_precios,
+    registrar_conjuntos
+)
+from .off_api import ClienteOFF
+from .tareas import CADUCIDAD_TRABAJO, encolar_regeneracion
+
+
+# --- SERVIDOR STUB CON JSON GRABADO ---
+ARBOL_GRABADO = {
+    'results': [
+        {'id': 12, 'name': 'Aceite, especias y salsas', 'categories': [
+            {'id': 112, 'name': 'Aceite, vinagre y sal'},
+            {'id': 115, 'name': 'Especias'},
+        ]},
+        {'id': 18, 'name': 'Carne', 'categories': [
+            {'id': 38, 'name': 'Aves y pollo'},
+        ]},
+    ]
+}
+
+CATEGORIAS_GRABADAS = {
+    112: {'id': 112, 'categories': [
+        {'id': 420, 'products': [
+            {'id': '4241', 'display_name': 'Aceite de oliva 0,4º Hacendado',
+             'price_instructions': {'unit_price': '4.95', 'reference_price': '4.950', 'reference_format': 'L'}},
+        ]},
+        {'id': 421, 'products': [
+            {'id': '4717', 'display_name': 'Sal fina Hacendado',
+             'price_instructions': {'unit_price': '0.39', 'reference_price': '0.390', 'reference_format': 'kg'}},
+        ]},
+    ]},
+    115: {'id': 115, 'products': [
+        {'id': '22708', 'display_name': 'Orégano Hacendado',
+         'price_instructions': {'unit_price': '0.85', 'reference_price': '85.000', 'reference_format': 'kg'}},
+    ]},
+    38: {'id': 38, 'categories': [
+        {'id': 500, 'products': [
+            {'id': '3004', 'display_name': 'Filetes pechuga de pollo',
+             'price_instructions': {'unit_price': '4.06', 'reference_price': '7.250', 'reference_format': 'kg'}},
+        ]},
+    ]},
+}
+
+# Búsquedas de Open Food Facts (search_terms -> productos)
+BUSQUEDAS_OFF_GRABADAS = {
+    'tomate': [{'product_name': 'Tomate triturado', 'nutriments': {
+        'energy-kcal_100g': 32, 'proteins_100g': 1.3, 'fat_100g': 0.2, 'carbohydrates_100g': 5.1}}],
+    'arroz': [{'product_name': 'Arroz redondo', 'nutriments': {
+        'energy-kcal_100g': 350, 'proteins_100g': 7, 'fat_100g': 0.9, 'carbohydrates_100g': 78}}],
+}
+
+
+class ServidorStub:
+    def __init__(self, fallos_por_ruta=None):
+        self.fallos = dict(fallos_por_ruta or {})
+        self.peticiones = []
+        stub = self
+
+        class Manejador(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                ruta = self.path.split('?')[0]
+                stub.peticiones.append(ruta)
+                if stub.fallos.get(ruta, 0) > 0:
+                    stub.fallos[ruta] -= 1
+                    return self.responder(503, {'error': 'ocupado'})
+                if ruta == '/cgi/search.pl':
+                    termino = parse_qs(urlsplit(self.path).query).get('search_terms', [''])[0]
+                    return self.responder(200, {'products': BUSQUEDAS_OFF_GRABADAS.get(termino, [])})
+                if ruta == '/api/categories/':
+                    return self.responder(200, ARBOL_GRABADO)
+                cat_id = ruta.strip('/').split('/')[-1]
+                if cat_id.isdigit() and int(cat_id) in CATEGORIAS_GRABADAS:
+                    return self.responder(200, CATEGORIAS_GRABADAS[int(cat_id)])
+                self.responder(404, {})
+
+            def responder(self, estado, cuerpo):
+                datos = json.dumps(cuerpo).encode()
+                etag = '"%s"' % hashlib.sha1(datos).hexdigest()
+                if estado == 200 and self.headers.get('If-None-Match') == etag:
+                    estado, datos = 304, b''
+                self.send_response(estado)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', str(len(datos)))
+                self.end_headers()
+                self.wfile.write(datos)
+
+            def log_message(self, *args):
+                pass
+
+        self.servidor = ThreadingHTTPServer(('127.0.0.1', 0), Manejador)
+        self.base = f"http://127.0.0.1:{self.servidor.server_address[1]}"
+        threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+
+    def parar(self):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+
+class CrawlerMercadonaTests(SimpleTestCase):
+    def setUp(self):
+        self.stub = ServidorStub(fallos_por_ruta={'/api/categories/115/': 1})
+        self.cliente = ClienteHTTP(concurrencia=3, peticiones_por_segundo=0, timeout=5, backoff=0.01)
+
+    def tearDown(self):
+        self.cliente.cerrar()
+        self.stub.parar()
+
+    def test_descarga_concurrente_de_todas_las_hojas(self):
+        arbol = mercadona.obtener_arbol_categorias(self.cliente, base=self.stub.base)
+        hojas = mercadona.categorias_hoja(arbol)
+        self.assertEqual(hojas, [112, 115, 38])
+
+        resultados = {
+            cat_id: (productos, error)
+            for cat_id, productos, error in mercadona.descargar_categorias(self.cliente, hojas, base=self.stub.base)
+        }
+        self.assertTrue(all(error is None for _, error in resultados.values()))
+        nombres = sorted(p['display_name'] for productos, _ in resultados.values() for p in productos)
+        self.assertEqual(len(nombres), 4)
+        self.assertIn('Sal fina Hacendado', nombres)
+
+    def test_reintenta_tras_error_503(self):
+        productos = mercadona.extraer_productos_de_categoria(self.cliente, 115, base=self.stub.base)
+        self.assertEqual(productos[0]['display_name'], 'Orégano Hacendado')
+        self.assertEqual(self.stub.peticiones.count('/api/categories/115/'), 2)
+
+
+class CacheHTTPTests(SimpleTestCase):
+    def setUp(self):
+        self.directorio = tempfile.mkdtemp()
+        self.stub = ServidorStub()
+
+    def tearDown(self):
+        self.stub.parar()
+        shutil.rmtree(self.directorio, ignore_errors=True)
+
+    def test_revalida_con_etag_y_reproduce_sin_red(self):
+        base = self.stub.base
+
+        def recorrer(cliente):
+            hojas = mercadona.categorias_hoja(mercadona.obtener_arbol_categorias(cliente, base=base))
+            return sorted(
+                p['display_name']
+                for _, productos, _ in mercadona.descargar_categorias(cliente, hojas, base=base)
+                for p in productos or []
+            )
+
+        primera = ClienteHTTP(peticiones_por_segundo=0, cache=CacheHTTP(self.directorio))
+        esperados = recorrer(primera)
+        self.assertEqual(primera.estadisticas['descargas'], 4)
+
+        segunda = ClienteHTTP(peticiones_por_segundo=0, cache=CacheHTTP(self.directorio))
+        self.assertEqual(recorrer(segunda), esperados)
+        self.assertEqual(segunda.estadisticas['no_modificados'], 4)
+
+        # Replay: con el servidor parado el resultado es idéntico
+        self.stub.parar()
+        self.stub = ServidorStub()
+        replay = ClienteHTTP(cache=CacheHTTP(self.directorio), solo_cache=True, reintentos=0)
+        self.assertEqual(recorrer(replay), esperados)
+        self.assertEqual(replay.estadisticas['desde_cache'], 4)
+        with self.assertRaises(ErrorHTTP):
+            replay.get_json(mercadona.url_categoria(999, base))
+
+    def test_replay_sin_cache_no_descarga_en_vivo(self):
+        with self.assertRaises(ValueError):
+            mercadona.crear_cliente(replay=True)
+        with self.assertRaises(ValueError):
+            ClienteHTTP(solo_cache=True)
+
+
+class ClienteOFFTests(TestCase):
+    def setUp(self):
+        self.stub = ServidorStub(fallos_por_ruta={'/cgi/search.pl': 1})
+        self.cliente = ClienteOFF(concurrencia=3, peticiones_por_segundo=0, timeout=5, backoff=0.01, base=self.stub.base)
+
+    def tearDown(self):
+        self.cliente.cerrar()
+        self.stub.parar()
+
+    def test_descarga_en_paralelo_y_reutiliza_la_cache(self):
+        consultas = ['Tomate', 'arroz', 'Unicornio']
+        resultados = self.cliente.obtener_muchos(consultas)
+        self.assertEqual(resultados['Tomate']['kcal'], 32)
+        self.assertEqual(resultados['arroz']['hidr'], 78.0)
+        self.assertIsNone(resultados['Unicornio'])
+        # 3 búsquedas + 1 reintento tras el 503
+        self.assertEqual(self.stub.peticiones.count('/cgi/search.pl'), 4)
+        self.assertEqual(RespuestaOFF.objects.count(), 3)
+
+        # Misma consulta normalizada (mayúsculas, tildes, espacios): sin red
+        otra = ClienteOFF(peticiones_por_segundo=0, base=self.stub.base)
+        self.assertEqual(otra.obtener('  TOMATE ')['kcal'], 32)
+        self.assertIsNone(otra.obtener('unicornio'))
+        self.assertEqual(otra.estadisticas['desde_cache'], 2)
+        self.assertEqual(self.stub.peticiones.count('/cgi/search.pl'), 4)
+
+    def test_caducidad_de_la_cache(self):
+        self.cliente.obtener('arroz')
+        RespuestaOFF.objects.update(guardada_en=RespuestaOFF.objects.get().guardada_en - timedelta(days=2))
+        caducada = ClienteOFF(peticiones_por_segundo=0, ttl=timedelta(days=1), base=self.stub.base)
+        self.assertEqual(caducada.obtener('arroz')['kcal'], 350)
+        self.assertEqual(caducada.estadisticas['descargas'], 1)
+
+
+# --- CLASIFICADOR COMPILADO ---
+class IngredienteFalso:
+    def __init__(self, nombre):
+        self.nombre = nombre
+
+
+def primer_ingrediente_original(nombre_producto, ingredientes):
+    for ing in ingredientes:
+        if cumple_criterios_seguros(nombre_producto, ing.nombre):
+            return ing
+    return None
+
+
+class ClasificadorTests(SimpleTestCase):
+    def setUp(self):
+        nombres = list(MATCH_SINONIMOS_OR) + list(MATCH_COMPUESTO_AND) + [
+            'Guisantes', 'Conejo', 'Huevos', 'Perejil', 'Calabacín', 'Fresas', 'Sepia', 'Dorada',
+        ]
+        random.Random(7).shuffle(nombres)
+        self.ingredientes = [IngredienteFalso(n) for n in nombres]
+        self.clasificador = Clasificador(self.ingredientes)
+
+    def nombres_de_prueba(self):
+        palabras = [k for ks in MATCH_SINONIMOS_OR.values() for k in ks]
+        palabras += [k for ks in MATCH_COMPUESTO_AND.values() for k in ks]
+        palabras += [i.nombre for i in self.ingredientes] + BLACKLIST[:8]
+        palabras += ['hacendado', 'pack', 'Salsa', 'SAL', 'Ajos', 'pan', 'rallado', '500 g']
+        rnd = random.Random(42)
+        nombres = [
+            'Sal fina Hacendado', 'Salsa de tomate', 'Ajo morado', 'Ajos tiernos', 'Champú de manzana',
+            'Pan de molde integral', 'Jamón cocido extra', 'Aceite de oliva virgen', 'Queso fresco batido',
+            'Comida para perro con pollo', 'Tomate frito', 'Leche semidesnatada', '', 'sal',
+        ]
+        for _ in range(3000):
+            trozos = rnd.sample(palabras, rnd.randint(1, 4))
+            nombres.append((' ' if rnd.random() < 0.8 else '').join(trozos))
+        return nombres
+
+    def test_equivalente_al_bucle_original(self):
+        for nombre in self.nombres_de_prueba():
+            with self.subTest(nombre=nombre):
+                self.assertIs(
+                    self.clasificador.clasificar(nombre),
+                    primer_ingrediente_original(nombre, self.ingredientes)
+                )
+
+
+# --- COLA DE REGENERACIÓN DE PLANES ---
+@override_settings(QOME_PLANES_EN_SEGUNDO_PLANO=True)
+class ColaRegeneracionTests(TestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_user('cola', password='x')
+
+    def test_reutiliza_solo_el_trabajo_pendiente(self):
+        primero = encolar_regeneracion(self.usuario)
+        self.assertEqual(encolar_regeneracion(self.usuario).id, primero.id)
+        self.assertEqual(TrabajoPlan.objects.count(), 1)
+
+        # El que está en curso ya leyó el perfil: hace falta otro
+        TrabajoPlan.objects.filter(id=primero.id).update(estado='EN_CURSO')
+        segundo = encolar_regeneracion(self.usuario)
+        self.assertNotEqual(segundo.id, primero.id)
+        self.assertEqual(encolar_regeneracion(self.usuario).id, segundo.id)
+        self.assertEqual(TrabajoPlan.objects.count(), 2)
+
+    def test_un_trabajo_caducado_deja_sitio_a_uno_nuevo(self):
+        viejo = encolar_regeneracion(self.usuario)
+        TrabajoPlan.objects.filter(id=viejo.id).update(
+            estado='EN_CURSO', creado_en=timezone.now() - CADUCIDAD_TRABAJO - timedelta(minutes=1)
+        )
+        nuevo = encolar_regeneracion(self.usuario)
+        self.assertNotEqual(nuevo.id, viejo.id)
+        self.assertEqual(TrabajoPlan.objects.get(id=viejo.id).estado, 'ERROR')
+
+    def test_la_bd_impide_dos_trabajos_pendientes(self):
+        encolar_regeneracion(self.usuario)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            TrabajoPlan.objects.create(usuario=self.usuario)
+
+    @override_settings(QOME_PLANES_EN_SEGUNDO_PLANO=False, QOME_INSTRUMENTAR_VISTAS=[])
+    def test_guardar_el_perfil_durante_un_plan_genera_otro_con_el_perfil_nuevo(self):
+        PerfilUsuario.objects.create(usuario=self.usuario, objetivo='MANTENER')
+        self.client.force_login(self.usuario)
+        objetivos_leidos = []
+
+        def generar(usuario):
+            objetivos_leidos.append(PerfilUsuario.objects.get(usuario=usuario).objetivo)
+            if len(objetivos_leidos) == 1:
+                # El usuario guarda el perfil mientras se genera el primer plan
+                self.client.post(reverse('perfil'), {'objetivo': 'PERDER', 'actividad': 'LIGERO', 'genero': 'F'})
+                # El nuevo no arranca a la vez que el que está en curso
+                self.assertEqual(TrabajoPlan.objects.filter(estado='EN_CURSO').count(), 1)
+            return True, "Plan generado"
+
+        with mock.patch('core.tareas.generar_plan_motor', side_effect=generar):
+            primero = encolar_regeneracion(self.usuario)
+
+        self.assertEqual(objetivos_leidos, ['MANTENER', 'PERDER'])
+        self.assertEqual(TrabajoPlan.objects.get(id=primero.id).estado, 'HECHO')
+        self.assertEqual(list(TrabajoPlan.objects.order_by('id').values_list('estado', flat=True)), ['HECHO', 'HECHO'])
+
+
+# --- PIPELINE POR ETAPAS ---
+class PipelineTests(SimpleTestCase):
+    def test_fin_atraviesa_todas_las_etapas(self):
+        terminadas = []
+        recibidos = []
+        cerrojo = threading.Lock()
+
+        def anotar(x):
+            with cerrojo: recibidos.append(x)
+
+        pipeline = Pipeline(range(200), [
+            Etapa('doble', lambda x: x * 2, hilos=3, al_terminar=lambda: terminadas.append('doble')),
+            Etapa('pares', lambda x: x if x % 4 == 0 else None, hilos=2, al_terminar=lambda: terminadas.append('pares')),
+            Etapa('final', anotar, hilos=4, al_terminar=lambda: terminadas.append('final')),
+        ], tamano_cola=3).ejecutar()
+
+        self.assertEqual(sorted(recibidos), list(range(0, 400, 4)))
+        # Cada al_terminar una vez, y en orden: una etapa acaba cuando acaba la anterior
+        self.assertEqual(terminadas, ['doble', 'pares', 'final'])
+        self.assertEqual([e.procesados for e in pipeline.etapas], [200, 200, 100])
+        self.assertEqual(pipeline.errores, [])
+
+    def test_las_colas_acotadas_frenan_a_la_fuente(self):
+        producidos = []
+        seguir = threading.Event()
+
+        def fuente():
+            for i in range(50):
+                producidos.append(i)
+                yield i
+
+        pipeline = Pipeline(fuente(), [Etapa('lenta', lambda x: seguir.wait(5), hilos=1)], tamano_cola=2)
+        hilo = threading.Thread(target=pipeline.ejecutar)
+        hilo.start()
+        time.sleep(0.3)
+        # 1 en la etapa + 2 en la cola + 1 esperando en put()
+        self.assertLessEqual(len(producidos), 4)
+        seguir.set()
+        hilo.join(5)
+        self.assertEqual(len(producidos), 50)
+        self.assertEqual(pipeline.etapas[0].procesados, 50)
+
+    def test_los_errores_por_elemento_se_anotan_y_el_flujo_sigue(self):
+        def dividir(x):
+            return 10 // x
+
+        def fuente():
+            yield from [1, 0, 2, 0, 5]
+            raise RuntimeError("fuente rota")
+
+        pipeline = Pipeline(fuente(), [Etapa('división', dividir, hilos=2)]).ejecutar()
+        etapa = pipeline.etapas[0]
+        self.assertEqual(etapa.procesados, 3)
+        self.assertEqual([type(e) for e in etapa.errores], [ZeroDivisionError, ZeroDivisionError])
+        self.assertIsInstance(pipeline.etapa_fuente.errores[0], RuntimeError)
+        self.assertEqual(len(pipeline.errores), 3)
+
+
+# --- BUFFER DE PRODUCTOS Y CHECKPOINTS ---
+class BufferProductosTests(TestCase):
+    def setUp(self):
+        self.super = Supermercado.objects.create(nombre='Mercadona')
+        self.ingrediente = IngredienteBase.objects.create(nombre='Tomate')
+        self.estado = EstadoCrawler(self.super)
+        self.buffer = BufferProductos(
+            self.super, tamano_lote=10,
+            al_vaciar=self.estado.guardar_checkpoint, al_fallar=self.estado.descartar_pendientes
+        )
+
+    def agregar(self, nombre, producto_id):
+        datos = {'nombre_comercial': nombre, 'precio_actual': Decimal('1.20'), 'peso_gramos': 500}
+        self.buffer.agregar(datos, self.ingrediente)
+        self.estado.producto_en_buffer(producto_id, f"h-{producto_id}")
+
+    def test_un_lote_fallido_no_deja_checkpoint(self):
+        self.agregar('Tomate frito', 'p1')
+        self.estado.categoria_terminada(7, 'h-cat')
+        with mock.patch.object(PrecioPendiente, 'marcar', side_effect=DatabaseError("disco lleno")):
+            with self.assertRaises(DatabaseError):
+                self.buffer.vaciar()
+
+        self.assertFalse(ProductoReal.objects.exists())
+        self.assertEqual(self.buffer.pendientes, {})
+        self.assertEqual(self.buffer.insertados, 0)
+        self.assertEqual(self.buffer.rechazados["lote no guardado (error de BD)"], 1)
+
+        # El siguiente lote sólo marca lo suyo: p1 se reprocesará la próxima vez
+        self.agregar('Tomate triturado', 'p2')
+        self.buffer.vaciar()
+        self.assertEqual(
+            list(EstadoProductoScrapeado.objects.values_list('producto_id', flat=True)), ['p2']
+        )
+        self.assertFalse(EstadoCategoria.objects.exists())
+        self.assertEqual(self.buffer.insertados, 1)
+
+    def test_el_buffer_se_vacia_tras_confirmar(self):
+        self.agregar('Tomate frito', 'p1')
+        self.agregar('Tomate frito', 'p1')  # mismo nombre: gana el último
+        self.buffer.vaciar()
+        self.agregar('Tomate frito', 'p1')
+        self.buffer.vaciar()
+        self.assertEqual(ProductoReal.objects.count(), 1)
+        self.assertEqual((self.buffer.insertados, self.buffer.actualizados), (1, 1))
+        self.assertEqual(self.buffer.pendientes, {})
+
+    def test_una_fila_sin_ean_ni_nutricion_no_borra_el_enriquecimiento(self):
+        self.agregar('Tomate frito', 'p1')
+        self.buffer.vaciar()
+        ProductoReal.objects.update(ean='8480000123456', kcal_100g=82, prot_100g=1.5)
+
+        # Nuevo barrido: otro precio, la tienda no da EAN ni nutrición
+        datos = {'nombre_comercial': 'Tomate frito', 'precio_actual': Decimal('1.35'), 'peso_gramos': 500}
+        self.buffer.agregar(datos, self.ingrediente)
+        self.buffer.vaciar()
+        producto = ProductoReal.objects.get()
+        self.assertEqual(producto.precio_actual, Decimal('1.35'))
+        self.assertEqual((producto.ean, producto.kcal_100g, producto.prot_100g), ('8480000123456', 82, 1.5))
+
+        # Si la fila sí los trae, mandan los de la fila
+        datos.update(ean='8480000999999', kcal_100g=90, prot_100g=1.6, grasas_100g=4.0, hidratos_100g=9.0)
+        self.buffer.agregar(datos, self.ingrediente)
+        self.buffer.vaciar()
+        producto.refresh_from_db()
+        self.assertEqual((producto.ean, producto.kcal_100g, producto.grasas_100g), ('8480000999999', 90, 4.0))
+
+
+# --- ÍNDICE EAN (ordenación externa + búsqueda binaria) ---
+class IndiceEANTests(SimpleTestCase):
+    FILAS = [
+        (0, ('8480000000009', 'Leche', 46, 3.1, 1.6, 4.7)),
+        (40, ('0000000000017', 'Agua', 0, 0.0, 0.0, 0.0)),
+        (75, ('no-es-un-ean', 'Raro', 1, 1.0, 1.0, 1.0)),
+        (90, ('5000000000003', 'Arroz', 350, 7.0, 0.6, 78.0)),
+        (130, ('8480000000009', 'Leche (repetida)', 99, 9.0, 9.0, 9.0)),
+        (170, ('99999999999999', 'Último', 10, 1.0, 2.0, 3.0)),
+        (210, ('3000000000007', 'Aceite', 884, 0.0, 100.0, 0.0)),
+        (260, ('5000000000003', 'Arroz (repetido)', 1, 1.0, 1.0, 1.0)),
+    ]
+
+    def setUp(self):
+        self.directorio = tempfile.mkdtemp()
+        self.ruta = f"{self.directorio}/off_ean.idx"
+        # Trozos de 2 registros: obliga a mezclar varios trozos
+        with mock.patch.object(indice_ean, 'REGISTROS_POR_TROZO', 2):
+            self.total = indice_ean.construir_indice(iter(self.FILAS), self.ruta)
+        self.indice = indice_ean.IndiceEAN(self.ruta)
+
+    def tearDown(self):
+        self.indice.cerrar()
+        shutil.rmtree(self.directorio)
+
+    def test_ordena_deduplica_y_no_deja_temporales(self):
+        self.assertEqual(self.total, 5)
+        self.assertEqual(len(self.indice), 5)
+        self.assertEqual(os.listdir(self.directorio), ['off_ean.idx'])
+
+    def test_busca_primero_ultimo_y_repetidos(self):
+        self.assertEqual(self.indice.buscar('0000000000017')['offset'], 40)      # primer registro
+        self.assertEqual(self.indice.buscar('99999999999999')['kcal'], 10)      # último registro
+        # Con EAN repetido gana la primera aparición, aunque esté en otro trozo
+        leche = self.indice.buscar(' 8480000000009 ')
+        self.assertEqual((leche['kcal'], leche['offset']), (46, 0))
+        self.assertAlmostEqual(leche['prot'], 3.1, places=5)
+        self.assertEqual(self.indice.buscar('5000000000003')['offset'], 90)
+
+    def test_fallos(self):
+        for codigo in ['1', '4000000000006', '99999999999998', '999999999999999', 'abc', '', None]:
+            with self.subTest(codigo=codigo):
+                self.assertIsNone(self.indice.buscar(codigo))
+
+
+# --- PAGINACIÓN KEYSET ---
+class PaginacionTests(TestCase):
+    # (minutos, calorías): 0 calorías = sin precio (NULL); hay empates de precio
+    DATOS = [(12, 100), (5, 100), (12, 100), (30, 0), (5, 100), (12, 100), (8, 0), (20, 100), (5, 0)]
+
+    def setUp(self):
+        Receta.objects.bulk_create([
+            Receta(titulo=f"Receta {i}", tiempo_preparacion=minutos, calorias=calorias,
+                   grasas=[0.1 + 0.2, 1 / 3, -1e-7, 1 / 3, 2.5e-17, 0.1 + 0.2, 7.0, 1 / 3, 0.0][i])
+            for i, (minutos, calorias) in enumerate(self.DATOS)
+        ])
+        self.recetas = Receta.objects.annotate(
+            precio_usuario=Case(
+                When(calorias=0, then=Value(None)),
+                default=Cast('tiempo_preparacion', DecimalField(max_digits=6, decimal_places=2)),
+            ),
+            relevancia=F('grasas'),
+        )
+
+    def recorrer(self, tamano, **opciones):
+        ids, cursor, paginas = [], None, 0
+        while True:
+            pagina, cursor = pagina_por_precio(self.recetas, cursor, tamano, **opciones)
+            ids += [r.id for r in pagina]
+            paginas += 1
+            if cursor is None: return ids, paginas
+
+    def esperado(self, campo):
+        return [r.id for r in sorted(
+            self.recetas, key=lambda r: (getattr(r, campo) is None, getattr(r, campo) or 0, r.id)
+        )]
+
+    def test_empates_y_cola_de_nulos_en_cualquier_tamano(self):
+        esperado = self.esperado('precio_usuario')
+        for tamano in range(1, len(self.DATOS) + 2):
+            with self.subTest(tamano=tamano):
+                ids, paginas = self.recorrer(tamano)
+                self.assertEqual(ids, esperado)
+                self.assertEqual(paginas, max(1, -(-len(esperado) // tamano)))
+
+    def test_cursor_sobre_la_cola_de_nulos(self):
+        nulos = list(self.recetas.filter(precio_usuario__isnull=True).order_by('id').values_list('id', flat=True))
+        pagina, _ = pagina_por_precio(self.recetas, codificar_cursor(None, nulos[0]), 10)
+        self.assertEqual([r.id for r in pagina], nulos[1:])
+
+    def test_relevancia_float_ida_y_vuelta(self):
+        for valor in [0.1 + 0.2, 1 / 3, -1e-7, 2.5e-17]:
+            self.assertEqual(decodificar_cursor(codificar_cursor(valor, 7), float), (valor, 7))
+        ids, _ = self.recorrer(1, campo='relevancia', tipo=float)
+        self.assertEqual(ids, self.esperado('relevancia'))
+
+    def test_cursor_malformado_vuelve_al_principio(self):
+        primera, _ = pagina_por_precio(self.recetas, None, 3)
+        for cursor in ['', 'abc', '~', 'x~1', '5~x', '5', 'NaN~3', 'sNaN~3', 'inf~3', '-Infinity~3']:
+            with self.subTest(cursor=cursor):
+                self.assertIsNone(decodificar_cursor(cursor))
+                pagina, _ = pagina_por_precio(self.recetas, cursor, 3)
+                self.assertEqual(pagina, primera)
+        self.assertIsNone(decodificar_cursor('nan~3', float))
+
+
+# --- MOTOR MATRICIAL DE COSTES ---
+@unittest.skipUnless(matrices.DISPONIBLE, "NumPy no está instalado")
+class CostesMatricialTests(SimpleTestCase):
+    def comparar(self, recetas_ids, supers_ids, por_receta, precios):
+        def filas(costes):
+            return [(c.receta_id, c.supermercado_id, c.coste, c.es_posible) for c in costes]
+        decimal = filas(calcular_costes(recetas_ids, supers_ids, por_receta, precios))
+        self.assertEqual(filas(calcular_costes_matricial(recetas_ids, supers_ids, por_receta, precios)), decimal)
+        return decimal
+
+    def test_medio_centimo_se_redondea_igual(self):
+        # 1,50 €/kg × 10 g = 0,015 €: en float es 0,01499…
+        filas = self.comparar([1, 2], [7], {1: [(3, 10)], 2: [(3, 10), (4, 5)]}, {(3, 7): Decimal('1.50')})
+        self.assertEqual(filas, [(1, 7, Decimal('0.02'), True), (2, 7, Decimal('0.02'), False)])
+
+    def test_mismos_costes_que_el_camino_decimal(self):
+        azar = random.Random(8)
+        recetas_ids, supers_ids, ingredientes = list(range(1, 301)), [1, 2, 3], list(range(1, 41))
+        por_receta = {
+            receta_id: [(ing_id, azar.randint(1, 600)) for ing_id in azar.sample(ingredientes, azar.randint(0, 8))]
+            for receta_id in recetas_ids
+        }
+        precios = {
+            (ing_id, super_id): Decimal(azar.randint(1, 5000)) / 100
+            for ing_id in ingredientes for super_id in supers_ids if azar.random() < 0.9
+        }
+        self.comparar(recetas_ids, supers_ids, por_receta, precios)
+
+
+# --- PRECIOS MATERIALIZADOS POR CONJUNTO ---
+class PreciosConjuntoTests(TestCase):
+    def setUp(self):
+        self.a, self.b, self.c = Supermercado.objects.bulk_create(
+            [Supermercado(nombre=n) for n in ('Mercadona', 'Dia', 'Lidl')]
+        )
+        self.r1, self.r2 = Receta.objects.bulk_create(
+            [Receta(titulo='Pisto', tiempo_preparacion=30), Receta(titulo='Lentejas', tiempo_preparacion=40)]
+        )
+        self.todos = (self.a.id, self.b.id, self.c.id)
+        self.costes({
+            (self.r1, self.a): ('5.00', True), (self.r1, self.b): ('3.00', True), (self.r1, self.c): ('1.00', False),
+            (self.r2, self.a): ('4.00', True), (self.r2, self.b): ('4.00', True),
+        })
+
+    def costes(self, filas):
+        guardar_costes([
+            CostePorSupermercado(receta=r, supermercado=s, coste=Decimal(coste), es_posible=posible)
+            for (r, s), (coste, posible) in filas.items()
+        ])
+
+    def materializados(self, supers_ids):
+        return dict(
+            (receta_id, (super_id, coste)) for receta_id, super_id, coste in PrecioRecetaConjunto.objects.filter(
+                firma=ConjuntoSupermercados.firma_de(supers_ids)
+            ).values_list('receta_id', 'supermercado_id', 'coste')
+        )
+
+    def test_firma_de_longitud_fija_con_ids_grandes(self):
+        firma = ConjuntoSupermercados.firma_de([1000, 3, 300, 3])
+        self.assertEqual(firma, ConjuntoSupermercados.firma_de([3, 300, 1000]))
+        self.assertNotEqual(firma, ConjuntoSupermercados.firma_de([3, 300]))
+        self.assertLessEqual(len(firma), ConjuntoSupermercados._meta.get_field('firma').max_length)
+
+        lejano = Supermercado.objects.create(id=400, nombre='Alcampo')
+        self.costes({(self.r2, lejano): ('2.00', True)})
+        conjunto, = registrar_conjuntos([(self.a.id, lejano.id)])
+        self.assertEqual(conjunto.supermercados, f"{self.a.id},400")
+        self.assertEqual(self.materializados((lejano.id, self.a.id)), {
+            self.r1.id: (self.a.id, Decimal('5.00')), self.r2.id: (lejano.id, Decimal('2.00'))
+        })
+
+    def test_gana_el_super_posible_mas_barato(self):
+        registrar_conjuntos([self.todos, (self.c.id,)])
+        self.assertEqual(self.materializados(self.todos), {
+            self.r1.id: (self.b.id, Decimal('3.00')),   # Lidl es más barato pero no es posible
+            self.r2.id: (self.a.id, Decimal('4.00')),   # empate: el de menor id
+        })
+        self.assertEqual(self.materializados((self.c.id,)), {})
+        self.assertEqual(registrar_conjuntos([self.todos]), [])
+
+    def test_rematerializar_unas_recetas(self):
+        registrar_conjuntos([self.todos, (self.a.id,)])
+        self.costes({(self.r1, self.a): ('5.00', False), (self.r1, self.b): ('3.00', False)})
+        materializar_precios(recetas_ids=[self.r1.id])
+        # r1 ya no es posible en ningún conjunto: sus filas desaparecen; r2 no se toca
+        self.assertEqual(self.materializados(self.todos), {self.r2.id: (self.a.id, Decimal('4.00'))})
+        self.assertEqual(self.materializados((self.a.id,)), {self.r2.id: (self.a.id, Decimal('4.00'))})
+
+        self.costes({(self.r1, self.b): ('2.50', True)})
+        materializar_precios(recetas_ids=[self.r1.id])
+        self.assertEqual(self.materializados(self.todos)[self.r1.id], (self.b.id, Decimal('2.50')))
+        self.assertNotIn(self.r1.id, self.materializados((self.a.id,)))
+
+    def test_sin_registrar_se_agrega_al_vuelo_sin_escribir(self):
+        conjunto = (self.a.id, self.c.id)
+        al_vuelo = dict(anotar_precio_conjunto(Receta.objects.all(), conjunto, 'precio').values_list('id', 'precio'))
+        self.assertFalse(ConjuntoSupermercados.objects.exists())
+
+        registrar_conjuntos([conjunto])
+        materializado = dict(anotar_precio_conjunto(Receta.objects.all(), conjunto, 'precio').values_list('id', 'precio'))
+        self.assertEqual(al_vuelo, materializado)
+        self.assertEqual(al_vuelo, {self.r1.id: Decimal('5.00'), self.r2.id: Decimal('4.00')})
+
+    @override_settings(QOME_INSTRUMENTAR_VISTAS=[])
+    def test_el_catalogo_no_escribe_en_un_get(self):
+        usuario = User.objects.create_user('lector', password='x')
+        perfil = PerfilUsuario.objects.create(usuario=usuario)
+        perfil.supermercados_seleccionados.set([self.b, self.c])
+        self.client.force_login(usuario)
+
+        respuesta = self.client.get(reverse('pagina_recetas'))
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertFalse(ConjuntoSupermercados.objects.exists())
+        self.assertFalse(PrecioRecetaConjunto.objects.exists())
+        self.assertIn('3.00', respuesta.json()['html'].replace(',', '.'))
+
+        # El indexador sí registra los conjuntos en uso (y el de todos)
+        indexar_precios_incremental()
+        self.assertEqual(
+            set(ConjuntoSupermercados.objects.values_list('supermercados', flat=True)),
+            {f"{self.b.id},{self.c.id}", ','.join(map(str, self.todos))}
+        )
+
+
+# --- BÚSQUEDA DE RECETAS ---
+class BusquedaTests(TestCase):
+    def setUp(self):
+        self.salmon = IngredienteBase.objects.create(nombre='Salmón')
+        self.patata = IngredienteBase.objects.create(nombre='Patata')
+        self.receta = Receta.objects.create(titulo='Salmón al horno', tiempo_preparacion=25)
+        self.otra = Receta.objects.create(titulo='Tortilla', tiempo_preparacion=20)
+        RecetaIngrediente.objects.create(receta=self.receta, ingrediente_base=self.salmon, cantidad_gramos=200)
+        self.linea = RecetaIngrediente.objects.create(receta=self.receta, ingrediente_base=self.patata, cantidad_gramos=150)
+        RecetaIngrediente.objects.create(receta=self.otra, ingrediente_base=self.patata, cantidad_gramos=300)
+
+    def encontradas(self, texto):
+        recetas, _ = buscar_recetas(Receta.objects.all(), texto)
+        return set(recetas.values_list('titulo', flat=True))
+
+    def filas_fts(self, texto):
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT count(*) FROM {TABLA_FTS} WHERE {TABLA_FTS} MATCH %s", [expresion_fts(texto)])
+            return cursor.fetchone()[0]
+
+    def test_prefijos_sin_tildes_y_orden_por_relevancia(self):
+        self.assertTrue(hay_fts())
+        self.assertEqual(self.encontradas('SALM horn'), {'Salmón al horno'})
+        recetas, orden = buscar_recetas(Receta.objects.all(), 'patata')
+        self.assertEqual(orden, 'relevancia')
+        self.assertEqual(recetas.count(), 2)
+        self.assertEqual(buscar_recetas(Receta.objects.all(), ' ¿? '), (mock.ANY, None))
+
+    def test_triggers_siguen_a_recetas_e_ingredientes(self):
+        self.patata.nombre = 'Boniato'
+        self.patata.save()
+        self.assertEqual(self.encontradas('patata'), set())
+        self.assertEqual(self.encontradas('boniato'), {'Salmón al horno', 'Tortilla'})
+
+        self.linea.delete()
+        self.assertEqual(self.encontradas('boniato'), {'Tortilla'})
+
+        self.receta.titulo = 'Lubina a la sal'
+        self.receta.save()
+        self.assertEqual(self.encontradas('horno'), set())
+        self.assertEqual(self.encontradas('lubina salmon'), {'Lubina a la sal'})
+
+        self.salmon.delete()
+        self.assertEqual(self.encontradas('salmon'), set())
+        self.assertEqual(self.filas_fts('salmon'), 0)
+
+        self.receta.delete()
+        self.assertEqual(self.filas_fts('lubina'), 0)
+        self.assertFalse(DocumentoBusquedaReceta.objects.filter(receta_id=self.receta.id).exists())
+
+    def test_busqueda_demasiado_generica_se_ordena_por_precio(self):
+        with mock.patch.object(busqueda, 'LIMITE_RELEVANCIA', 1):
+            recetas, orden = buscar_recetas(Receta.objects.all(), 'patata')
+        self.assertIsNone(orden)
+        self.assertEqual(recetas.count(), 2)
+
+    def test_respaldo_like_sin_fts5(self):
+        with mock.patch.object(busqueda, 'hay_fts', return_value=False):
+            self.assertEqual(self.encontradas('SALM horn'), {'Salmón al horno'})
+            self.assertEqual(self.encontradas('patat'), {'Salmón al horno', 'Tortilla'})
+            self.assertEqual(self.encontradas('tortilla salmon'), set())
+            _, orden = buscar_recetas(Receta.objects.all(), 'patata')
+        self.assertIsNone(orden)
+
+
+# --- CACHÉ CON CLAVES VERSIONADAS ---
+@override_settings(QOME_INSTRUMENTAR_VISTAS=[])
+class CacheVersionadaTests(TestCase):
+    ESPACIOS = ('catalogo', 'receta', 'plan')
+
+    def setUp(self):
+        self.super = Supermercado.objects.create(nombre='Mercadona')
+        self.receta = Receta.objects.create(titulo='Pisto', tiempo_preparacion=30)
+        self.usuario = User.objects.create_user('cacheado', password='x')
+        self.perfil = PerfilUsuario.objects.create(usuario=self.usuario)
+        self.client.force_login(self.usuario)
+
+    def fallos(self):
+        return {e: cache.estadisticas.get(e, {}).get('fallos', 0) for e in self.ESPACIOS}
+
+    def visitar(self):
+        antes = self.fallos()
+        for url in [reverse('pagina_recetas'), reverse('detalle_receta', args=[self.receta.id]), reverse('plan_semanal')]:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return {e for e, n in self.fallos().items() if n > antes[e]}
+
+    def assertInvalida(self, cambio, espacios):
+        self.visitar()
+        self.assertEqual(self.visitar(), set())  # todo servido desde la caché
+        cambio()
+        self.assertEqual(self.visitar(), set(espacios))
+
+    def test_indexar_precios(self):
+        self.assertInvalida(indexar_precios, self.ESPACIOS)
+
+    def test_guardar_receta(self):
+        self.assertInvalida(self.receta.save, self.ESPACIOS)
+
+    def test_guardar_perfil(self):
+        self.assertInvalida(self.perfil.save, {'plan'})
+
+    def test_guardar_planes(self):
+        plan = {'usuario_id': self.usuario.id, 'comidas': [(self.receta.id, 0, 'COMIDA')], 'cesta': {}, 'coste': 0}
+        self.assertInvalida(lambda: guardar_planes([plan]), {'plan'})
+
+    def test_las_versiones_no_se_repiten_tras_vaciar_la_bd(self):
+        calculos = []
+
+        def calcular():
+            calculos.append(len(calculos))
+            return calculos[-1]
+
+        dependencias = [('prueba',)]
+        cache.subir_version(('prueba',))
+        self.assertEqual(cache.obtener('prueba', 'k', dependencias, calcular), 0)
+        self.assertEqual(cache.obtener('prueba', 'k', dependencias, calcular), 0)
+        anterior = cache.versiones(dependencias)[0]
+
+        # BD vacía (reinicio, otra copia...): sin versión no se cachea ni se sirve lo de antes
+        VersionCache.objects.all().delete()
+        self.assertEqual(cache.versiones(dependencias), (None,))
+        self.assertEqual(cache.obtener('prueba', 'k', dependencias, calcular), 1)
+        self.assertEqual(cache.obtener('prueba', 'k', dependencias, calcular), 2)
+
+        cache.subir_version(('prueba',))
+        self.assertGreater(cache.versiones(dependencias)[0], anterior)
+        self.assertEqual(cache.obtener('prueba', 'k', dependencias, calcular), 3)
+        self.assertEqual(cache.obtener('prueba', 'k', dependencias, calcular), 3)
+
+
+# --- LISTA DE LA COMPRA (LineaCompra) ---
+class GuardarPlanesTests(TestCase):
+    def test_lineas_y_subtotales(self):
+        mercadona, dia = Supermercado.objects.bulk_create([Supermercado(nombre='Mercadona'), Supermercado(nombre='Dia')])
+        usuario = User.objects.create_user('comprador', password='x')
+        receta = Receta.objects.create(titulo='Pisto', tiempo_preparacion=30)
+
+        tomate = IngredienteBase.objects.create(nombre='Tomate')
+
+        def linea(super_, nombre, unidades, precio):
+            producto = ProductoReal.objects.create(
+                supermercado=super_, ingrediente_base=tomate, nombre_comercial=nombre,
+                precio_actual=Decimal(precio), peso_gramos=500
+            )
+            return producto.id, {
+                'super': super_.nombre, 'supermercado_id': super_.id, 'nombre': nombre, 'unidades': unidades,
+                'precio_u': Decimal(precio), 'total': unidades * Decimal(precio), 'imagen': None, 'peso_gramos': 500,
+            }
+
+        plan = {
+            'usuario_id': usuario.id, 'comidas': [(receta.id, 0, 'COMIDA'), (receta.id, 0, 'CENA')], 'coste': 7.5,
+            'cesta': dict([
+                linea(mercadona, 'Tomate', 3, '1.15'),
+                linea(mercadona, 'Calabacín', 1, '0.99'),
+                linea(dia, 'Tomate', 2, '1.05'),
+            ]),
+        }
+        viejo, = guardar_planes([plan])
+        nuevo, = guardar_planes([plan])
+
+        self.assertFalse(PlanSemanal.objects.filter(id=viejo.id).exists())
+        nuevo.refresh_from_db()
+        self.assertEqual(nuevo.subtotales_compra, {'Mercadona': 4.44, 'Dia': 2.1})
+        self.assertEqual(nuevo.comidas.count(), 2)
+        self.assertEqual(
+            list(nuevo.lineas_compra.order_by('id').values_list('supermercado_nombre', 'nombre', 'unidades', 'total')),
+            [('Mercadona', 'Tomate', 3, Decimal('3.45')), ('Mercadona', 'Calabacín', 1, Decimal('0.99')),
+             ('Dia', 'Tomate', 2, Decimal('2.10'))]
+        )
+        self.assertEqual(set(nuevo.lineas_compra.values_list('producto_id', flat=True)), set(plan['cesta']))
+        self.assertEqual(LineaCompra.objects.count(), 3)
+
+        # Si el súper desaparece, sus líneas siguen en el plan con su nombre
+        dia.delete()
+        self.assertEqual(
+            list(nuevo.lineas_compra.filter(supermercado_nombre='Dia').values_list('supermercado_id', 'total')),
+            [(None, Decimal('2.10'))]
+        )
+
+
+class MigracionLineasCompraTests(TransactionTestCase):
+    ANTES = [('core', '0011_versioncache')]
+    DESPUES = [('core', '0012_lineas_compra')]
+
+    def migrar(self, destino):
+        ejecutor = MigrationExecutor(connection)
+        with redirect_stdout(io.StringIO()) as salida:
+            ejecutor.migrate(destino)
+        return ejecutor.loader.project_state(destino).apps, salida.getvalue()
+
+    def tearDown(self):
+        ejecutor = MigrationExecutor(connection)
+        with redirect_stdout(io.StringIO()):
+            ejecutor.migrate(ejecutor.loader.graph.leaf_nodes())
+
+    def test_ida_y_vuelta(self):
+        apps, _ = self.migrar(self.ANTES)
+        usuario = apps.get_model('auth', 'User').objects.create(username='migrado')
+        mercadona = apps.get_model('core', 'Supermercado').objects.create(nombre='Mercadona')
+        ingrediente = apps.get_model('core', 'IngredienteBase').objects.create(nombre='Arroz')
+        arroz = apps.get_model('core', 'ProductoReal').objects.create(
+            supermercado=mercadona, ingrediente_base=ingrediente, nombre_comercial='Arroz redondo',
+            precio_actual=Decimal('1.10'), peso_gramos=1234, precio_por_kg=Decimal('0.89')
+        )
+        cesta = {
+            'Arroz redondo': {'super': 'Mercadona', 'unidades': 2, 'precio_u': 1.1, 'total': 2.2,
+                              'imagen': None, 'peso_display': '1.2kg'},
+            'Tomate frito': {'super': 'Mercadona', 'unidades': 1, 'precio_u': 0.85, 'total': 0.85,
+                             'imagen': 'https://ejemplo.test/t.jpg', 'peso_display': '350g'},
+            'Leche': {'super': 'Carrefour', 'unidades': 6, 'precio_u': 0.9, 'total': 5.4,
+                      'imagen': None, 'peso_display': '1kg'},
+        }
+        plan = apps.get_model('core', 'PlanSemanal').objects.create(
+            usuario=usuario, fecha_inicio='2026-10-12', lista_compra_snapshot=json.dumps(cesta)
+        )
+
+        apps, informe = self.migrar(self.DESPUES)
+        self.assertIn("'Carrefour': 1", informe)
+        lineas = apps.get_model('core', 'LineaCompra').objects.filter(plan_id=plan.id).order_by('nombre')
+        self.assertEqual(
+            [(l.supermercado_nombre, l.supermercado_id, l.nombre, l.producto_id, l.peso_gramos, l.unidades, l.total)
+             for l in lineas],
+            [('Mercadona', mercadona.id, 'Arroz redondo', arroz.id, 1234, 2, Decimal('2.20')),
+             ('Carrefour', None, 'Leche', None, 1000, 6, Decimal('5.40')),
+             ('Mercadona', mercadona.id, 'Tomate frito', None, 350, 1, Decimal('0.85'))]
+        )
+        self.assertEqual(
+            apps.get_model('core', 'PlanSemanal').objects.get(id=plan.id).subtotales_compra,
+            {'Mercadona': 3.05, 'Carrefour': 5.4}
+        )
+
+        # Nada se pierde: la vuelta reconstruye el snapshot entero
+        apps, _ = self.migrar(self.ANTES)
+        vuelta = json.loads(apps.get_model('core', 'PlanSemanal').objects.get(id=plan.id).lista_compra_snapshot)
+        self.assertEqual(vuelta, cesta)
+
+
+# --- INSTRUMENTACIÓN POR PETICIÓN ---
+class InstrumentacionPeticionesTests(TestCase):
+    def setUp(self):
+        Receta.objects.create(titulo='Pisto', tiempo_preparacion=30)
+
+    def pedir(self, nombre_vista):
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(reverse(nombre_vista))
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta, len(consultas)
+
+    def test_cabecera_y_log_en_una_vista_instrumentada(self):
+        # pagina_recetas (el scroll infinito) va en la lista por defecto
+        with self.assertLogs('qome.peticiones', 'INFO') as logs:
+            respuesta, n_consultas = self.pedir('pagina_recetas')
+
+        self.assertRegex(
+            respuesta['Server-Timing'], rf'^total;dur=[\d.]+, db;dur=[\d.]+;desc="{n_consultas} consultas"$'
+        )
+        [registro] = logs.records
+        self.assertEqual(registro.levelname, 'INFO')
+        datos = json.loads(registro.getMessage())
+        self.assertEqual((datos['vista'], datos['estado'], datos['consultas']), ('pagina_recetas', 200, n_consultas))
+        self.assertNotIn('todas', datos)
+
+    @override_settings(QOME_INSTRUMENTAR_VISTAS=['perfil'])
+    def test_sin_cabecera_fuera_de_las_vistas_instrumentadas(self):
+        with self.assertNoLogs('qome.peticiones'):
+            respuesta, _ = self.pedir('pagina_recetas')
+        self.assertNotIn('Server-Timing', respuesta)
+
+    @override_settings(QOME_PETICION_LENTA_MS=0, QOME_CONSULTAS_MAS_LENTAS=1)
+    def test_peticion_lenta_avisa_con_todas_las_consultas(self):
+        with self.assertLogs('qome.peticiones', 'WARNING') as logs:
+            _, n_consultas = self.pedir('pagina_recetas')
+
+        datos = json.loads(logs.records[0].getMessage())
+        self.assertEqual(logs.records[0].levelname, 'WARNING')
+        self.assertGreater(n_consultas, 1)
+        self.assertEqual(len(datos['todas']), n_consultas)
+        self.assertEqual(len(datos['mas_lentas']), 1)
+        self.assertTrue(all(c['sql'] for c in datos['todas']))
@@ -5,8 +5,10 @@ from . import views
 urlpatterns = [
     # RUTAS PRINCIPALES
     path('', views.lista_recetas, name='home'),
+    path('recetas/pagina/', views.pagina_recetas, name='pagina_recetas'),
     path('receta/<int:receta_id>/', views.detalle_receta, name='detalle_receta'),
     path('mi-plan/', views.ver_plan_semanal, name='plan_semanal'),
+    path('mi-plan/estado/', views.estado_plan, name='estado_plan'),
     
     # RUTAS DE USUARIO
     path('registro/', views.registro, name='registro'),
@@ -1,131 +1,17 @@
-import json
-import random
-from datetime import date, timedelta
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import login
 from django.contrib.auth.decorators import login_required
-from django.db.models import Min, Q
+from django.http import JsonResponse
+from django.template.loader import render_to_string
 from django.contrib import messages
-from .models import (
-    Receta, PerfilUsuario, PlanSemanal, Supermercado, 
-    ComidaPlanificada, ProductoReal, CostePorSupermercado
-)
-
-# --- MOTOR TETRIS V9 (Con Pesos y Macros) ---
-def generar_plan_motor(user):
-    try:
-        perfil = user.perfil
-    except:
-        return False, "Usuario sin perfil configurado."
-
-    # 1. Supermercados
-    mis_supers = perfil.supermercados_seleccionados.all()
-    if not mis_supers.exists():
-        mis_supers = Supermercado.objects.all()
-
-    # 2. Estrategia Nutricional
-    orden_prioridad = 'precio_minimo_mio'
-    if perfil.gasto_energetico_diario > 2500:
-        orden_prioridad = '-calorias'
-    elif perfil.gasto_energetico_diario < 1800:
-        orden_prioridad = 'calorias'
-
-    # 3. Limpieza
-    inicio_semana = date.today()
-    PlanSemanal.objects.filter(usuario=user).delete()
-    plan = PlanSemanal.objects.create(usuario=user, fecha_inicio=inicio_semana)
-    
-    despensa = {} 
-    cesta_compra_real = {}
-    memoria_reciente = [] 
-    coste_total_plan = 0.0
-
-    dias = range(7) 
-    momentos = ['COMIDA', 'CENA']
-
-    # 4. Generación
-    for dia in dias:
-        for momento in momentos:
-            # Filtramos recetas posibles
-            base_query = Receta.objects.filter(
-                costes_por_supermercado__supermercado__in=mis_supers,
-                costes_por_supermercado__es_posible=True
-            ).annotate(
-                precio_minimo_mio=Min('costes_por_supermercado__coste')
-            )
-
-            # Ordenamos
-            candidatas = base_query.order_by(orden_prioridad, 'precio_minimo_mio')
-
-            # Filtro Anti-Repetición
-            if memoria_reciente:
-                candidatas = candidatas.exclude(titulo__in=memoria_reciente)
-
-            pool = candidatas[:5]
-            if not pool.exists(): continue 
-                
-            receta_elegida = random.choice(pool)
-            
-            memoria_reciente.append(receta_elegida.titulo)
-            if len(memoria_reciente) > 4: memoria_reciente.pop(0)
-            
-            coste_plato = receta_elegida.precio_minimo_mio or 0
-            coste_total_plan += float(coste_plato)
-
-            # --- GENERAR LISTA DE COMPRA ---
-            for item in receta_elegida.ingredientes.all():
-                nombre_base = item.ingrediente_base.nombre
-                necesario = item.cantidad_gramos
-                
-                if nombre_base not in despensa: despensa[nombre_base] = 0
-
-                if despensa[nombre_base] < necesario:
-                    prod = ProductoReal.objects.filter(
-                        ingrediente_base=item.ingrediente_base,
-                        supermercado__in=mis_supers
-                    ).order_by('precio_por_kg').first()
-
-                    if prod:
-                        peso_pack = prod.peso_gramos
-                        cantidad_a_comprar = 1
-                        deficit = necesario - despensa[nombre_base]
-                        
-                        while (cantidad_a_comprar * peso_pack) < deficit:
-                            cantidad_a_comprar += 1
-                        
-                        despensa[nombre_base] += (peso_pack * cantidad_a_comprar)
-                        
-                        clave = f"{prod.nombre_comercial}"
-                        if clave not in cesta_compra_real:
-                            # FORMATEO DE PESO PARA VISUALIZACIÓN
-                            peso_txt = f"{prod.peso_gramos}g"
-                            if prod.peso_gramos >= 1000:
-                                peso_txt = f"{prod.peso_gramos/1000:.1f}kg".replace(".0kg", "kg")
-
-                            cesta_compra_real[clave] = {
-                                'super': prod.supermercado.nombre,
-                                'unidades': 0,
-                                'precio_u': float(prod.precio_actual),
-                                'total': 0.0,
-                                'imagen': prod.imagen_url,
-                                'peso_display': peso_txt # <--- NUEVO
-                            }
-                        cesta_compra_real[clave]['unidades'] += cantidad_a_comprar
-                        cesta_compra_real[clave]['total'] += (cantidad_a_comprar * float(prod.precio_actual))
-
-                despensa[nombre_base] -= necesario
-
-            ComidaPlanificada.objects.create(
-                plan=plan, receta=receta_elegida, dia_semana=dia, momento=momento
-            )
-
-    plan.lista_compra_snapshot = json.dumps(cesta_compra_real)
-    plan.coste_total_estimado = coste_total_plan
-    plan.save()
-    
-    return True, "Plan generado correctamente."
-
+from .models import Receta, PerfilUsuario, PlanSemanal, Supermercado
+from .tareas import encolar_regeneracion, trabajo_activo, ultimo_trabajo
+from .paginacion import pagina_por_precio
+from .precios import anotar_precio_conjunto
+from .busqueda import buscar_recetas
+from . import cache
+from .cache import CATALOGO, version_usuario
 
 # --- VISTAS WEB ---
 
@@ -135,25 +21,20 @@ def home(request):
     else:
         return redirect('login')
 
-def lista_recetas(request):
-    recetas = Receta.objects.all()
+TAMANO_PAGINA_RECETAS = 24
+# Parámetros de la URL que cambian el contenido de una página del catálogo
+PARAMETROS_CATALOGO = ('q', 'horno', 'sarten', 'tupper', 'cursor')
+
+def perfil_y_conjunto(request):
+    """(perfil | None, metas | None, ids ordenados de los supermercados con que se ponen precios)."""
     perfil = None
     metas = None
+    mis_supers = None
     
     if request.user.is_authenticated:
         try:
             perfil = PerfilUsuario.objects.get(usuario=request.user)
-            mis_supers = perfil.supermercados_seleccionados.all()
-
-            if mis_supers.exists():
-                recetas = recetas.annotate(
-                    precio_usuario=Min(
-                        'costes_por_supermercado__coste',
-                        filter=Q(costes_por_supermercado__supermercado__in=mis_supers)
-                    )
-                )
-            else:
-                recetas = recetas.annotate(precio_usuario=Min('costes_por_supermercado__coste'))
+            mis_supers = list(perfil.supermercados_seleccionados.values_list('id', flat=True))
 
             metas = {
                 'calorias': perfil.gasto_energetico_diario,
@@ -162,25 +43,79 @@ def lista_recetas(request):
                 'hidratos': perfil.objetivo_hidratos,
             }
         except PerfilUsuario.DoesNotExist: pass
-    else:
-        recetas = recetas.annotate(precio_usuario=Min('costes_por_supermercado__coste'))
 
+    # Sin selección (o sin sesión) el precio es el mínimo entre todos los súper
+    if not mis_supers:
+        mis_supers = list(Supermercado.objects.values_list('id', flat=True))
+    return perfil, metas, tuple(sorted(mis_supers))
+
+def recetas_filtradas(request, supers_ids):
+    """
+    Queryset (sin evaluar) de recetas con los filtros de la URL y el precio
+    mínimo en esos supermercados (de la tabla materializada si el conjunto
+    está registrado; si no, agregado al vuelo). Sólo se evalúa para la
+    página que se pinta. Con búsqueda (?q=) se ordena por relevancia si hay
+    índice FTS5. Devuelve (recetas, campo de orden).
+    """
+    recetas = anotar_precio_conjunto(Receta.objects.all(), supers_ids, 'precio_usuario')
+
+    orden = None
     query = request.GET.get('q')
-    if query: recetas = recetas.filter(titulo__icontains=query)
+    if query: recetas, orden = buscar_recetas(recetas, query)
     
     # Filtros Utensilios
     if request.GET.get('horno'): recetas = recetas.filter(es_apta_horno=True)
     if request.GET.get('sarten'): recetas = recetas.filter(es_apta_sarten=True)
     if request.GET.get('tupper'): recetas = recetas.filter(es_apta_tupper=True)
 
+    return recetas, orden
+
+def paginar_recetas(request, recetas, orden):
+    if orden == 'relevancia':
+        return pagina_por_precio(recetas, request.GET.get('cursor'), TAMANO_PAGINA_RECETAS, campo=orden, tipo=float)
+    return pagina_por_precio(recetas, request.GET.get('cursor'), TAMANO_PAGINA_RECETAS)
+
+def pagina_catalogo(request, supers_ids):
+    """(recetas de la página, cursor siguiente), cacheado hasta que cambie el catálogo."""
+    parametros = tuple((p, request.GET.get(p)) for p in PARAMETROS_CATALOGO)
+    return cache.obtener(
+        'catalogo', (supers_ids, parametros), [CATALOGO],
+        lambda: paginar_recetas(request, *recetas_filtradas(request, supers_ids))
+    )
+
+def lista_recetas(request):
+    perfil, metas, supers_ids = perfil_y_conjunto(request)
+    pagina, siguiente = pagina_catalogo(request, supers_ids)
+
+    # Filtros actuales sin el cursor (para pedir las páginas siguientes)
+    filtros = request.GET.copy()
+    filtros.pop('cursor', None)
+
     return render(request, 'core/lista_recetas.html', {
-        'recetas': recetas, 'perfil': perfil, 'metas': metas
+        'recetas': pagina, 'perfil': perfil, 'metas': metas,
+        'siguiente': siguiente, 'filtros': filtros.urlencode()
     })
 
-def detalle_receta(request, receta_id):
+def pagina_recetas(request):
+    """Fragmento JSON para el scroll infinito: tarjetas ya renderizadas + cursor siguiente."""
+    _, _, supers_ids = perfil_y_conjunto(request)
+    pagina, siguiente = pagina_catalogo(request, supers_ids)
+    html = render_to_string('core/tarjetas_recetas.html', {'recetas': pagina}, request=request)
+    return JsonResponse({'html': html, 'siguiente': siguiente})
+
+def datos_detalle_receta(receta_id):
     receta = get_object_or_404(Receta, id=receta_id)
-    costes = receta.costes_por_supermercado.filter(es_posible=True).select_related('supermercado').order_by('coste')
-    return render(request, 'core/detalles_receta.html', {'receta': receta, 'costes': costes})
+    return {
+        'receta': receta,
+        'ingredientes': list(receta.ingredientes.select_related('ingrediente_base').order_by('id')),
+        'costes': list(
+            receta.costes_por_supermercado.filter(es_posible=True).select_related('supermercado').order_by('coste')
+        ),
+    }
+
+def detalle_receta(request, receta_id):
+    datos = cache.obtener('receta', receta_id, [CATALOGO], lambda: datos_detalle_receta(receta_id))
+    return render(request, 'core/detalles_receta.html', datos)
 
 def registro(request):
     if request.method == 'POST':
@@ -219,8 +154,8 @@ def perfil(request):
         
         perfil_usuario.save()
         
-        generar_plan_motor(request.user)
-        messages.success(request, "Perfil guardado y Plan regenerado.")
+        encolar_regeneracion(request.user)
+        messages.success(request, "Perfil guardado. Estamos generando tu nuevo plan.")
         
         return redirect('plan_semanal')
 
@@ -229,15 +164,9 @@ def perfil(request):
         'supermercados': todos_supers
     })
 
-@login_required
-def ver_plan_semanal(request):
-    if request.method == 'POST':
-        exito, msg = generar_plan_motor(request.user)
-        if exito: messages.success(request, msg)
-        else: messages.error(request, msg)
-        return redirect('plan_semanal')
-
-    plan = PlanSemanal.objects.filter(usuario=request.user).order_by('-fecha_inicio').first()
+def datos_plan_semanal(usuario):
+    """Calendario y lista de la compra del último plan (sin lo que cambia en cada visita)."""
+    plan = PlanSemanal.objects.filter(usuario=usuario).order_by('-fecha_inicio', '-id').first()
     
     dias_semana = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
     calendario = {i: {'nombre': dias_semana[i], 'comida': None, 'cena': None} for i in range(7)}
@@ -252,26 +181,42 @@ def ver_plan_semanal(request):
             elif comida.momento == 'CENA':
                 calendario[comida.dia_semana]['cena'] = comida.receta
         
-        if plan.lista_compra_snapshot:
-            try:
-                raw_lista = json.loads(plan.lista_compra_snapshot)
-                lista_agrupada = {}
-                for nombre_prod, datos in raw_lista.items():
-                    super_nombre = datos.get('super', 'Otros')
-                    if super_nombre not in lista_agrupada: 
-                        lista_agrupada[super_nombre] = []
-                        subtotales_super[super_nombre] = 0.0
-                    
-                    datos['nombre'] = nombre_prod
-                    lista_agrupada[super_nombre].append(datos)
-                    subtotales_super[super_nombre] += datos['total']
-                
-                lista_compra_visual = lista_agrupada
-            except: pass
+        # Una consulta por el índice de plan; las líneas ya vienen con su total
+        for linea in plan.lineas_compra.order_by('id'):
+            lista_compra_visual.setdefault(linea.supermercado_nombre, []).append(linea)
+        subtotales_super = plan.subtotales_compra
 
-    return render(request, 'core/plan_semanal.html', {
+    return {
         'calendario': calendario,
         'lista_compra': lista_compra_visual,
         'plan': plan,
-        'subtotales': subtotales_super
+        'subtotales': subtotales_super,
+    }
+
+@login_required
+def ver_plan_semanal(request):
+    if request.method == 'POST':
+        encolar_regeneracion(request.user)
+        messages.info(request, "Regenerando tu plan en segundo plano...")
+        return redirect('plan_semanal')
+
+    datos = cache.obtener(
+        'plan', request.user.id, [CATALOGO, version_usuario(request.user.id)],
+        lambda: datos_plan_semanal(request.user)
+    )
+    return render(request, 'core/plan_semanal.html', {
+        **datos,
+        'generando': trabajo_activo(request.user) is not None
+    })
+
+@login_required
+def estado_plan(request):
+    """Endpoint ligero (JSON) que consulta la página del plan mientras se genera."""
+    trabajo = ultimo_trabajo(request.user)
+    if not trabajo:
+        return JsonResponse({'estado': None, 'mensaje': ''})
+    return JsonResponse({
+        'estado': trabajo.estado,
+        'mensaje': trabajo.mensaje,
+        'generando': trabajo_activo(request.user) is not None
     })
\ No newline at end of file
@@ -42,6 +42,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.InstrumentacionPeticiones',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -81,6 +82,21 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/6.0/topics/cache/
+# Contenido (fichas, páginas del catálogo, plan) en la memoria de cada proceso;
+# las versiones que lo invalidan están en la BD, compartidas (core/cache.py)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'qome',
+        'TIMEOUT': 600,
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -123,3 +139,30 @@ LOGIN_REDIRECT_URL = 'home'
 
 # Cuando haces logout, te vas a la portada (en vez de a la pantalla de admin)
 LOGOUT_REDIRECT_URL = 'home'
+
+# Generación de planes en segundo plano (pool de hilos + tabla TrabajoPlan)
+QOME_PLANES_EN_SEGUNDO_PLANO = True
+QOME_HILOS_PLANES = 2
+
+# Almacén local de nutrición construido desde un volcado de Open Food Facts
+QOME_OFF_ALMACEN = BASE_DIR / 'off_nutricion.sqlite3'
+# Índice binario EAN -> nutrientes (mmap) construido desde el mismo volcado
+QOME_OFF_INDICE_EAN = BASE_DIR / 'off_ean.idx'
+# Días que vale una respuesta cacheada de la API de Open Food Facts
+QOME_OFF_CACHE_DIAS = 30
+
+# Instrumentación por petición (core/middleware.py): Server-Timing + log JSON
+QOME_INSTRUMENTAR_VISTAS = ['home', 'pagina_recetas', 'plan_semanal', 'perfil']  # nombres de URL; None = todas
+QOME_PETICION_LENTA_MS = 500  # por encima, el log lleva todas las consultas
+QOME_CONSULTAS_MAS_LENTAS = 3
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'consola': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'qome': {'handlers': ['consola'], 'level': 'INFO'},
+    },
+}